@@ -5,13 +5,17 @@ import seaborn as sns # type: ignore
 
 from typing import Optional
 import pandas as pd # type: ignore
+import numpy as np # type: ignore
 import datetime
+import itertools
 import os
 
-from models import Candle, MarketTrade
+from models import MarketTrade
 from database import Database, DatabaseSetupService
 from coinbase.rest import RESTClient # type: ignore
 import services.coinbase_services as cb
+from services.candle_sync_service import CandleSyncService
+from services.candle_resampler import CandleResampler
 
 CWD = os.getcwd()
 DATA_DIR = os.path.join(CWD, 'data')
@@ -23,6 +27,8 @@ WEEKDAY_ORDER = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday
 
 PLACEHOLDER_DATE = datetime.datetime.now()
 
+MARKET_TRADES_BATCH_SIZE = 5000
+
 class AnalysisTarget:
     def __init__(self, trading_pair: str, start_date: datetime.datetime, end_date:datetime.datetime):
         self.trading_pair = trading_pair
@@ -101,14 +107,11 @@ def fetch_and_upload_data(
         return
 
     market_trades = cb.fetch_market_trades(client, trading_pair, start_date, end_date, cb.CANDLES_LIMIT_MAX)
-    for market_trade_data in market_trades:
-        market_trade = MarketTrade(market_trade_data)
-        db.insert_one(table_name='market_trades', values=market_trade.get_values())
+    for market_trades_batch in itertools.batched(market_trades, MARKET_TRADES_BATCH_SIZE):
+        db.insert_many(table_name='market_trades', rows=[MarketTrade(market_trade_data).get_values() for market_trade_data in market_trades_batch])
 
-    candles = cb.fetch_market_trade_candles(client, trading_pair, start_date, end_date, cb.CANDLES_LIMIT_MAX)
-    for candle_data in candles:
-        candle = Candle(candle_data)
-        db.insert_one(table_name='candles', values=candle.get_values())
+    # synced through the coverage table so the coarser granularities can be resampled locally, see get_candles_df
+    CandleSyncService(client, db).sync(trading_pair, cb.Granularity.ONE_MINUTE, start_date, end_date)
 
 def get_candles_df(
         db: Database, granularity: str,
@@ -118,23 +121,28 @@ def get_candles_df(
     start_date = analysis_target.start_date if analysis_target else start_date
     end_date = analysis_target.end_date if analysis_target else end_date
 
-    res = db.get_rows(
-        table_name='candles',
-        where_statement=f"WHERE trading_pair='{trading_pair}' AND time between '{start_date.isoformat()}' AND '{end_date.isoformat()}' AND granularity='{granularity}'"
-    )
-    market_candles = [Candle(candle) for candle in res]
+    resampler = CandleResampler(db)
+    if granularity != cb.Granularity.ONE_MINUTE and resampler.covers(trading_pair, granularity, start_date, end_date):
+        df_candles = resampler.get_candles_frame(trading_pair, granularity, start_date, end_date)
+    else:
+        df_candles = db.fetch_frame(
+            table_name='candles',
+            where_statement=db.build_where(
+                eq={'trading_pair': trading_pair, 'granularity': granularity},
+                btwn={'start': {'min': int(start_date.timestamp()), 'max': int(end_date.timestamp())}}
+            )
+        )
 
-    df_candles = pd.DataFrame(data=[candle.to_dict() for candle in market_candles])
     df_candles['timestamp'] = df_candles['start']
-    df_candles['minute'] = df_candles['time'].transform(lambda x: x.minute)
-    df_candles['hour'] = df_candles['time'].transform(lambda x: x.hour)
-    df_candles['weekday'] = df_candles['time'].transform(lambda x: x.strftime('%A'))
-    df_candles['month'] = df_candles['time'].transform(lambda x: x.month)
-    df_candles['year'] = df_candles['time'].transform(lambda x: x.year)
-    df_candles['month_year'] = df_candles['time'].transform(lambda x: x.strftime('%y-%m'))
+    df_candles['minute'] = df_candles['time'].dt.minute
+    df_candles['hour'] = df_candles['time'].dt.hour
+    df_candles['weekday'] = df_candles['time'].dt.strftime('%A')
+    df_candles['month'] = df_candles['time'].dt.month
+    df_candles['year'] = df_candles['time'].dt.year
+    df_candles['month_year'] = df_candles['time'].dt.strftime('%y-%m')
 
     df_candles['price_change'] = df_candles['close'] - df_candles['open']
-    df_candles['price_direction'] = df_candles['price_change'].transform(lambda x: 'Positive' if x > 0 else 'Negative')
+    df_candles['price_direction'] = np.where(df_candles['price_change'] > 0, 'Positive', 'Negative')
     df_candles['percent_change'] = (df_candles['price_change'] / df_candles['open']) * 100
 
     return df_candles
@@ -147,23 +155,20 @@ def get_market_trades_df(
     start_date = analysis_target.start_date if analysis_target else start_date
     end_date = analysis_target.end_date if analysis_target else end_date
 
-    res = db.get_rows(
+    df_trades = db.fetch_frame(
         table_name='market_trades',
-        where_statement=f"WHERE trading_pair='{trading_pair}' AND time between '{start_date.isoformat()}' AND '{end_date.isoformat()}'"
+        where_statement=db.build_where(
+            eq={'trading_pair': trading_pair},
+            btwn={'time_epoch': {'min': int(start_date.timestamp()), 'max': int(end_date.timestamp())}}
+        )
     )
-    market_trades = [MarketTrade(market_trade) for market_trade in res]
-    market_trade_data = []
-    for trade in market_trades:
-        data = trade.to_dict()
-        data['total'] = trade.total
-        market_trade_data.append(data)
-
-    df_trades = pd.DataFrame(data=market_trade_data)
-    df_trades['timestamp'] = df_trades['time'].transform(lambda x: x.timestamp()) 
-    df_trades['hour'] = df_trades['time'].transform(lambda x: x.hour)
-    df_trades['minute'] = df_trades['time'].transform(lambda x: x.minute)
-    df_trades['second'] = df_trades['time'].transform(lambda x: x.second)
-    df_trades['hour_min'] = df_trades['time'].transform(lambda x: datetime.time(hour=x.hour, minute=x.minute))
+
+    df_trades['total'] = df_trades['price'] * df_trades['size'] * np.where(df_trades['side'] == 'SELL', -1, 1)
+    df_trades['timestamp'] = (df_trades['time'] - pd.Timestamp(0, tz='UTC')).dt.total_seconds()
+    df_trades['hour'] = df_trades['time'].dt.hour
+    df_trades['minute'] = df_trades['time'].dt.minute
+    df_trades['second'] = df_trades['time'].dt.second
+    df_trades['hour_min'] = df_trades['time'].dt.floor('min').dt.time
     df_trades.sort_values(by='time', inplace=True)
     return df_trades
 
@@ -0,0 +1,101 @@
+"""Repeatable ingestion benchmark against a local FakeCoinbaseServer, no credentials or network needed.
+
+Run from the repository root:
+    python -m benchmarks.ingestion_benchmark --candle-days 7 --trade-hours 2 --latency 0.05 --rate-limit-every 50
+
+Every run serves the same synthetic data for the same settings, the response cache is bypassed so
+each fetcher is measured against the (fake) API.
+"""
+import argparse
+import datetime
+import json
+import threading
+import time
+
+import websocket
+
+import services.coinbase_services as cb
+from services.coinbase_services import Granularity, RateLimitedClient
+from services.fake_coinbase import FakeCoinbaseServer, FakeRESTClient, SyntheticMarket
+from services.rate_limiter import RateLimiter
+
+# Fixed end of every fetched range so runs request identical windows
+BENCHMARK_END = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+def bench_candles(client: RateLimitedClient, days: float, workers: int) -> dict:
+    start = BENCHMARK_END - datetime.timedelta(days=days)
+    started = time.perf_counter()
+    candles = cb.get_asset_candles(client, 'BTC-USD', Granularity.ONE_MINUTE, start, BENCHMARK_END, max_workers=workers, cache=None)
+    elapsed = time.perf_counter() - started
+    return {'name': f"get_asset_candles ONE_MINUTE {days}d", 'rows': len(candles), 'seconds': elapsed}
+
+def bench_market_trades(client: RateLimitedClient, hours: float, workers: int) -> dict:
+    start = BENCHMARK_END - datetime.timedelta(hours=hours)
+    started = time.perf_counter()
+    rows = 0
+    for _ in cb.fetch_market_trades(client, 'BTC-USD', start, BENCHMARK_END, cb.CANDLES_LIMIT_MAX, max_workers=workers, cache=None):
+        rows += 1
+    elapsed = time.perf_counter() - started
+    return {'name': f"fetch_market_trades {hours}h", 'rows': rows, 'seconds': elapsed}
+
+def bench_websocket(ws_url: str, channel: str, product_ids: list[str], seconds: float) -> dict:
+    received = {'messages': 0, 'bytes': 0}
+
+    def on_open(ws):
+        ws.send(json.dumps({'type': 'subscribe', 'channel': channel, 'product_ids': product_ids}))
+
+    def on_message(ws, message):
+        json.loads(message)
+        received['messages'] += 1
+        received['bytes'] += len(message)
+
+    ws = websocket.WebSocketApp(ws_url, on_open=on_open, on_message=on_message)
+    thread = threading.Thread(target=ws.run_forever, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    time.sleep(seconds)
+    elapsed = time.perf_counter() - started
+    messages = received['messages']
+    ws.close()
+    thread.join(timeout=5)
+    return {'name': f"websocket {channel} x{len(product_ids)}", 'rows': messages, 'seconds': elapsed}
+
+def print_results(results: list[dict]):
+    print(f"{'benchmark':<40}{'rows':>12}{'seconds':>12}{'rows/sec':>14}")
+    for result in results:
+        rate = result['rows'] / result['seconds'] if result['seconds'] else 0
+        print(f"{result['name']:<40}{result['rows']:>12}{result['seconds']:>12.3f}{rate:>14.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--candle-days', type=float, default=7)
+    parser.add_argument('--trade-hours', type=float, default=1)
+    parser.add_argument('--trades-per-second', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=cb.REST_RATE_LIMIT, help='client side requests per second')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every REST response')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='answer every nth REST request with a 429')
+    parser.add_argument('--page-size', type=int, default=1000, help='max trades per /ticker response')
+    parser.add_argument('--ws-seconds', type=float, default=3)
+    parser.add_argument('--ws-rate', type=float, default=1000, help='WebSocket messages per second per subscription')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    market = SyntheticMarket(seed=args.seed, trades_per_second=args.trades_per_second)
+    with FakeCoinbaseServer(market, latency=args.latency, rate_limit_every=args.rate_limit_every, max_page_size=args.page_size,
+                            ws_messages_per_second=args.ws_rate) as server:
+        rate_limiter = RateLimiter(rate=args.rate)
+        client = RateLimitedClient(FakeRESTClient(base_url=server.rest_url), rate_limiter=rate_limiter)
+
+        results = [
+            bench_candles(client, args.candle_days, args.workers),
+            bench_market_trades(client, args.trade_hours, args.workers),
+            bench_websocket(server.ws_url, 'level2', ['BTC-USD', 'ETH-USD'], args.ws_seconds),
+        ]
+        print_results(results)
+        print()
+        print(f"server: {server.get_metrics()}")
+        print(f"client: {rate_limiter.get_metrics()}")
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,7 @@ import datetime
 
 import utils
 from ui import Menu, QuitMenuError, CancelMenuError
-from services import PredictionService, PortfolioService
+from services import PredictionService, PortfolioService, ProductCatalog
 from database.database import Database
 from database.database_setup_service import DatabaseSetupService
 import services.coinbase_services as cb
@@ -31,9 +31,10 @@ class Controller:
         client = cb.get_client()
 
         self.db = Database('mywow.db')
-        self.db_setup = DatabaseSetupService()
+        self.db_setup = DatabaseSetupService(self.db)
         self.prediction_service = PredictionService(client, self.db)
         self.portfolio_service = PortfolioService(client, self.db)
+        self.product_catalog = ProductCatalog(client, self.db)
 
         self.setup_menus()
         self.load_state()
@@ -147,7 +148,7 @@ class Controller:
 
     def handle_add_pred_action(self):
         while True:
-            prediction, choice = self.active_menu.addprediction()
+            prediction, choice = self.active_menu.addprediction(validate_trading_pair=self.product_catalog.exists)
             if prediction:
                 self.prediction_service.add_prediction(prediction)
             
@@ -7,14 +7,33 @@ import plotly.express as px # type: ignore
 
 import pandas as pd # type: ignore
 import datetime
+import threading
+from typing import Optional
 from requests.exceptions import HTTPError # type: ignore
 from timeit import default_timer as timer
 
 import analysis_service as analysis
 from database import Database, DatabaseSetupService
 import services.coinbase_services as cb
+from services.product_catalog import ProductCatalog
 
 
+# Trading pairs are validated against the stored product list instead of a get_product request per keystroke,
+# the catalog is built on first use so importing the dashboard opens no database and no API client
+product_catalog: Optional[ProductCatalog] = None
+product_catalog_lock = threading.Lock()
+
+def get_product_catalog() -> ProductCatalog:
+    global product_catalog
+    with product_catalog_lock:
+        if product_catalog is None:
+            # Shared by every callback, each request thread gets its own pooled connection
+            db = Database('mywow.db')
+            # runs the migrations, the products table included
+            DatabaseSetupService(db)
+            product_catalog = ProductCatalog(db=db)
+        return product_catalog
+
 analysis_history = analysis.get_analysis_history()
 dropdown_history_options = [
     {'label': label, 'value': label} for label in analysis_history
@@ -192,8 +211,7 @@ app.layout = html.Div(
 def validate_trading_pair(trading_pair):
     try:
         assert(trading_pair is not None)
-        client = cb.get_client()
-        client.get_product(trading_pair.upper())
+        assert(get_product_catalog().exists(trading_pair))
         return trading_pair.upper()
     except AssertionError:
         return None
@@ -252,7 +270,6 @@ def update_plots_container(target_label: str):
 
     start_1 = timer()
 
-    db = Database('mywow.db')
     if not analysis.analysis_exists(analysis_target=target):
         client = cb.get_client()
         analysis.fetch_and_upload_data(db, client, analysis_target=target)
@@ -261,7 +278,6 @@ def update_plots_container(target_label: str):
     start_2 = timer()
 
     market_trade_charts = analysis.get_trade_analysis_charts(db, analysis_target=target)
-    db.on_exit()
 
     dash.callback_context.record_timing('task_2', timer() - start_2, '2nd Task')
 
@@ -279,4 +295,5 @@ if __name__=='__main__':
     # db = Database('mywow.db')
     # DatabaseSetupService()
     # db.on_exit()
+    get_product_catalog().start_background_refresh()
     app.run_server(debug=True)
\ No newline at end of file
@@ -1,2 +1,5 @@
+from .query_builder import QueryBuilder, Statement, OnConflict
+from .connection_manager import ConnectionManager
 from .database import Database, InvalidTableNameError, InvalidValuesError, InvalidInsertError, DuplicateInsertError
-from .database_setup_service import DatabaseSetupService, DBMSConstructionError, TableConstructionError, InvalidLocalStorageError, InvalidDataSourceError
\ No newline at end of file
+from .database_setup_service import DatabaseSetupService, DBMSConstructionError, TableConstructionError, InvalidLocalStorageError, InvalidDataSourceError
+from .migrations import Migration, MigrationRunner, MigrationError
\ No newline at end of file
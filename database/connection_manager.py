@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import weakref
+from queue import LifoQueue, Empty, Full
+from typing import Optional
+
+from .query_builder import STATEMENT_CACHE_SIZE
+
+class ConnectionManager:
+    """Hands out one configured SQLite connection per thread and pools them between threads.
+
+    Every connection runs in WAL mode so readers never block the writer (or each other), which lets the
+    dashboard, background ingestion and the TUI share one database file. A thread keeps its connection
+    until it exits, at which point the connection returns to the idle pool for the next thread instead
+    of being closed, so short lived request threads do not pay the connect and PRAGMA cost each time.
+    """
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',        # WAL is still durable across application crashes, fsync only on checkpoints
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,       # negative values are KiB: 64MB page cache per connection
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,           # milliseconds a writer waits on the lock before raising "database is locked"
+    }
+    MAX_IDLE_CONNECTIONS = 8
+
+    managers: dict[str, 'ConnectionManager'] = {}
+    managers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, db_path: str) -> 'ConnectionManager':
+        """Returns the process wide manager of a database file"""
+        with cls.managers_lock:
+            if db_path not in cls.managers:
+                cls.managers[db_path] = ConnectionManager(db_path)
+            return cls.managers[db_path]
+
+    def __init__(self, db_path: str, pragmas: Optional[dict] = None, max_idle_connections: int = MAX_IDLE_CONNECTIONS):
+        self.db_path = db_path
+        self.pragmas = pragmas if pragmas else dict(ConnectionManager.pragmas)
+        self.local = threading.local()
+        self.idle: LifoQueue[sqlite3.Connection] = LifoQueue(maxsize=max_idle_connections)
+
+        # Catalog information shared by every Database object using this file, see Database.get_table_metadata
+        self.table_metadata: dict[str, dict] = {}
+
+    def connect(self) -> sqlite3.Connection:
+        # check_same_thread is off as pooled connections move between threads, but only ever one thread at a time
+        conn = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            return self.connect()
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put_nowait(conn)
+        except (Full, sqlite3.ProgrammingError):
+            conn.close()
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns the calling thread's connection, taking one from the pool on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.acquire()
+            self.local.conn = conn
+            self.local.cur = conn.cursor()
+            weakref.finalize(threading.current_thread(), self.release, conn)
+        return conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """Returns the calling thread's shared cursor"""
+        self.connection()
+        return self.local.cur
+
+    def close_thread_connection(self):
+        """Closes the calling thread's connection, the next call to connection() opens a new one"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            return
+        self.local.cur.close()
+        conn.close()
+        self.local.conn = None
+        self.local.cur = None
+
+    def close_all(self):
+        """Closes the calling thread's connection and every idle pooled connection"""
+        self.close_thread_connection()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                break
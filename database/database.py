@@ -1,8 +1,14 @@
 import sqlite3
 import datetime
 import json
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional
 from os import path, getcwd
+import pandas as pd # type: ignore
+import numpy as np # type: ignore
+from dateutil import tz as dateutil_tz # type: ignore
+
+from .query_builder import QueryBuilder, Statement, OnConflict
+from .connection_manager import ConnectionManager
 
 data_dir = path.join(getcwd(), 'data')
 
@@ -19,29 +25,95 @@ class DuplicateInsertError(Exception):
     pass
 
 class Database:
+    # Rows held in memory at once while streaming a result with fetchmany
+    ROWS_CHUNK_SIZE = 10_000
+
     def __init__(self, db_name: str):
         self.db_name = db_name
         db_path = path.join(data_dir, db_name)
-        self.conn = sqlite3.connect(db_path)
-
-        self.cur = self.conn.cursor()
+        self.connection_manager = ConnectionManager.get(db_path)
         self.table_name = ''
+
+        # { table_name : { 'schema': { col_name : col_type }, 'primary_key': [pk_index, pk_name], 'unique_columns': { col_name, ... } } }
+        self.table_metadata: dict[str, dict] = self.connection_manager.table_metadata
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection of the calling thread, a Database object can be shared between threads"""
+        return self.connection_manager.connection()
+
+    @property
+    def cur(self) -> sqlite3.Cursor:
+        return self.connection_manager.cursor()
     
     def on_exit(self):
         print(f"Closing connection to database {self.db_name}...")
-        self.cur.close()
-        self.conn.close()
+        self.connection_manager.close_thread_connection()
 
     def table_exists(self, table_name: str):
         if not table_name or table_name.strip() == "":
             return False
-        
-        res = self.cur.execute(f"PRAGMA table_info({table_name})")
-        table_info = res.fetchall()
-        if table_info:
-            return True
+        return self.get_table_metadata(table_name) is not None
+
+    def get_table_metadata(self, table_name: str) -> Optional[dict]:
+        """Returns the cached catalog information of a table, reading it from the PRAGMAs on first use.
+
+        return_value: { 'schema': { col_name : col_type }, 'primary_key': [pk_index, pk_name], 'unique_columns': { col_name, ... } } | None
+        """
+        if table_name in self.table_metadata:
+            return self.table_metadata[table_name]
+
+        table_info = self.cur.execute(f"PRAGMA table_info({table_name})").fetchall()
+        if not table_info:
+            return None
+
+        primary_key: list[int | str] = [-1, '']
+        for col_info in table_info:
+            if col_info[-1] == 1:
+                primary_key = list(col_info[:2])
+                break
+
+        unique_columns = set()
+        for index in self.cur.execute(f"PRAGMA index_list({table_name})").fetchall():
+            index_name, is_unique = index[1], index[2]
+            index_columns = self.cur.execute(f"PRAGMA index_info({index_name})").fetchall()
+            if is_unique and len(index_columns) == 1:
+                unique_columns.add(index_columns[0][-1])
+
+        metadata = {
+            'schema': { col[1] : col[2] for col in table_info },
+            'primary_key': primary_key,
+            'unique_columns': unique_columns,
+        }
+        self.table_metadata[table_name] = metadata
+        return metadata
+
+    def invalidate_table_metadata(self, table_name: Optional[str] = None):
+        """Drops cached catalog information for one table, or for every table when no name is given"""
+        if table_name:
+            self.table_metadata.pop(table_name, None)
         else:
-            return False
+            self.table_metadata.clear()
+
+    def execute_ddl(self, query: str):
+        """Runs a schema changing statement (CREATE/ALTER/DROP) and invalidates the metadata cache"""
+        self.cur.execute(query)
+        self.conn.commit()
+        self.invalidate_table_metadata()
+
+    def get_schema_version(self) -> int:
+        return self.cur.execute("PRAGMA user_version").fetchone()[0]
+
+    def set_schema_version(self, version: int):
+        self.cur.execute(f"PRAGMA user_version = {int(version)}")
+        self.conn.commit()
+
+    def create_index(self, index_name: str, table_name: str, columns: list[str]):
+        if not index_name or not columns:
+            raise InvalidValuesError
+        if not self.table_exists(table_name):
+            raise InvalidTableNameError
+        self.execute_ddl(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({', '.join(columns)})")
 
     def check_table(func: Any):
         def wrapper(self, *args, **kwargs):
@@ -88,6 +160,7 @@ class Database:
         definition = ", ".join(definitions)
         query = f"CREATE TABLE {table_name}({definition})"
         self.cur.execute(query)
+        self.invalidate_table_metadata(table_name)
 
     def set_table(self, table_name: str):
         if self.table_exists(table_name):
@@ -95,64 +168,85 @@ class Database:
         else:
             raise InvalidTableNameError
 
-    @staticmethod
-    def format_value(value) -> str:
-        if value == '':
-            return f"''"
-
-        if type(value) == str:
-            return f"'{value}'"
-        elif type(value) == datetime.datetime:
-            return f"'{value.isoformat()}'"
-        else:
-            return str(value)
-
-    def format_dict_values(self, values: dict) -> list[str]:
-        if not values:
-            return []
+    @check_table
+    def compile_insert(self, table_name: Optional[str] = None, on_conflict: str = OnConflict.IGNORE, update_columns: Optional[list[str]] = None) -> tuple[list[str], str]:
+        """
+        return_value: ( [ col_name, ... ], insert_query )
+        """
+        if not OnConflict.verify(on_conflict):
+            raise InvalidValuesError
 
-        updated_values = []
-        for col_name in values:
-            val = values[col_name]
-            updated_values.append(f"{col_name}={self.format_value(val)}")
+        columns = list(self.get_table_metadata(table_name)['schema'])
+        _, p_col = self.get_table_primary_key(table_name=table_name)
+        if on_conflict == OnConflict.REPLACE:
+            update_columns = [col_name for col_name in columns if col_name != p_col]
+        elif on_conflict == OnConflict.UPDATE:
+            if not update_columns or any(col_name not in columns for col_name in update_columns):
+                raise InvalidValuesError
+        else:
+            update_columns = []
+        if update_columns and not p_col:
+            raise InvalidValuesError
 
-        return updated_values
+        query = QueryBuilder.compile_insert(table_name, tuple(columns), on_conflict, str(p_col), tuple(update_columns))
+        return columns, query
 
     @check_table
-    def insert_one(self, values: list | dict, table_name: Optional[str] = None):
+    def insert_one(self, values: list | dict, table_name: Optional[str] = None, on_conflict: str = OnConflict.IGNORE, update_columns: Optional[list[str]] = None) -> int:
+        """Inserts a single row, see insert_many for the conflict policies.
+
+        Return: number of rows written
+        """
         if not values:
             raise InvalidValuesError
-        if type(values) == dict:
-            table_schema = self.get_row_schema(table_name)
-            for key in table_schema:
-                table_schema[key] = values[key]
-            values = [table_schema[key] for key in table_schema]
-
-        formatted_values = []
-        for val in values:
-            formatted_values.append(self.format_value(val))
-
-        p_index, p_col = self.get_table_primary_key(table_name=table_name)
-        duplicate = self.get_rows(table_name=table_name, where_statement=f"WHERE {p_col}={formatted_values[p_index]}")
-        if duplicate:
-            print(f'Failed INSERT: Duplicate "{p_col}" found.')
-            # raise DuplicateInsertError
-            return
+        return self.insert_many([values], table_name=table_name, on_conflict=on_conflict, update_columns=update_columns)
 
-        query = f"INSERT INTO {table_name} VALUES ({', '.join(formatted_values)})"
-        self.cur.execute(query)
-        self.conn.commit()
+    @check_table
+    def insert_many(self, rows: list[list | dict], table_name: Optional[str] = None, on_conflict: str = OnConflict.IGNORE, update_columns: Optional[list[str]] = None, commit: bool = True) -> int:
+        """Inserts every row with a single parameterized executemany and one commit.
+
+        Primary key conflicts are resolved by SQLite's ON CONFLICT clause in the same statement, no row is read before writing.
+
+        :rows: [ [ col_value, ... ] | { col_name : col_value, ... }, ... ]
+        :on_conflict:
+            - OnConflict.IGNORE keeps rows whose primary key already exists
+            - OnConflict.REPLACE overwrites every other column of those rows
+            - OnConflict.UPDATE overwrites only update_columns of those rows
+            - OnConflict.ABORT rolls back the batch and raises DuplicateInsertError
+        :commit: commit after the batch, pass False to write several batches in one transaction committed by the caller
+
+        Return: number of rows written
+        """
+        rows = [row for row in rows if row]
+        if not rows:
+            return 0
+
+        columns, query = self.compile_insert(table_name=table_name, on_conflict=on_conflict, update_columns=update_columns)
+        params = []
+        for row in rows:
+            if type(row) == dict:
+                row = [row.get(col_name, None) for col_name in columns]
+            if len(row) != len(columns):
+                raise InvalidValuesError
+            params.append([QueryBuilder.to_param(val) for val in row])
+
+        try:
+            self.cur.executemany(query, params)
+            row_count = self.cur.rowcount
+            if commit:
+                self.conn.commit()
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise DuplicateInsertError
+        return row_count
 
     @check_table
     def update_where(self, updated_values: dict, where_values: dict, table_name: Optional[str] = None):
         if not updated_values or not where_values:
             raise InvalidValuesError
 
-        formatted_update_values = self.format_dict_values(updated_values)
-        formatted_where_values = self.format_dict_values(where_values)
-        
-        query = f"UPDATE {table_name} SET {",".join(formatted_update_values)} WHERE {" AND ".join(formatted_where_values)}"
-        self.cur.execute(query)
+        statement = QueryBuilder.update(table_name, updated_values, where_values)
+        self.cur.execute(statement.sql, statement.params)
         self.conn.commit()
 
     @check_table
@@ -160,15 +254,14 @@ class Database:
         if not values:
             raise InvalidValuesError
 
-        formatted_values = self.format_dict_values(values)
-        
-        query = f"DELETE FROM {table_name} WHERE {" AND ".join(formatted_values)}"
-        self.cur.execute(query)
+        statement = QueryBuilder.delete(table_name, values)
+        self.cur.execute(statement.sql, statement.params)
         self.conn.commit()
 
     @staticmethod
-    def build_where(eq: dict={}, lt: dict={}, gt: dict={}, lte: dict={}, gte: dict={}, btwn: dict={}) -> str:
-        """Constructs a where statement that requires all conditions be met.
+    def build_where(eq: Optional[dict] = None, lt: Optional[dict] = None, gt: Optional[dict] = None, lte: Optional[dict] = None,
+                    gte: Optional[dict] = None, btwn: Optional[dict] = None) -> Statement:
+        """Constructs a parameterized where statement that requires all conditions be met.
 
         :eq, lt, gt, lte, gte: { column_name : value, ... }
 
@@ -176,44 +269,118 @@ class Database:
 
         Notes: 
             - Between (btwn) comparison is inclusive for min and max values. 
-            - If the condition contains a string, it must be passed with alternating apostraphes and quotation marks, ex: "'John'" or '"John"'
+            - Values are bound as '?' parameters, strings must not be quoted.
 
         Example: 
-        - build_where_with_conditions(eq={'name':"'John'"}, gt={'account_total':500}, lte={'items_purchased':10})
-        #prints "WHERE name='John' AND account_total>500 AND items_purchased<=10"
+        - build_where(eq={'name':'John'}, gt={'account_total':500}, lte={'items_purchased':10})
 
         Return: 
-            - String: "WHERE name='John' AND account_total>500 AND items_purchased<=10"
+            - Statement: "WHERE name=? AND account_total>? AND items_purchased<=?" with params ['John', 500, 10]
+        """
+        return QueryBuilder.where(eq=eq, lt=lt, gt=gt, lte=lte, gte=gte, btwn=btwn)
+
+    @staticmethod
+    def select_statement(table_name: str, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None) -> Statement:
+        where = where_statement if isinstance(where_statement, Statement) else Statement(where_statement.strip())
+        return QueryBuilder.select(table_name, headers=headers, where=where, order_by_statement=order_by_statement, limit=limit)
+
+    @check_table
+    def get_rows(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None) -> list[ dict[ str, str | float | int | datetime.datetime ] ]:
+        return list(self.iter_rows(table_name=table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers))
+
+    @check_table
+    def iter_chunks(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None, chunk_size: int = ROWS_CHUNK_SIZE) -> Iterator[list[tuple]]:
+        """Yields the raw selected rows chunk_size at a time using fetchmany.
+
+        Each call runs on its own cursor so other queries can be issued while a result is being consumed.
         """
-        where_conditions = []
-        if eq:
-            where_conditions.extend([f"{col_name}={eq[col_name]}" for col_name in eq])
-        if btwn:
-            where_conditions.extend([f"{col_name}>={btwn[col_name]['min']}" for col_name in btwn])
-            where_conditions.extend([f"{col_name}<={btwn[col_name]['max']}" for col_name in btwn])
-        if lt:
-            where_conditions.extend([f"{col_name}<{eq[col_name]}" for col_name in lt])
-        if lte:
-            where_conditions.extend([f"{col_name}<={eq[col_name]}" for col_name in lte])
-        if gt:
-            where_conditions.extend([f"{col_name}>{eq[col_name]}" for col_name in gt])
-        if gte:
-            where_conditions.extend([f"{col_name}>={eq[col_name]}" for col_name in gte])
-        return f"WHERE {' AND '.join(where_conditions)}"
+        cur = self.conn.cursor()
+        try:
+            statement = self.select_statement(table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers)
+            cur.execute(statement.sql, statement.params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
 
     @check_table
-    def get_rows(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str = '', order_by_statement: str = '', headers: Optional[list[str]] = None) -> list[ dict[ str, str | float | int | datetime.datetime ] ]:
-        if headers:
-            header_query = ', '.join(headers)
-        else:
-            header_query = '*'
+    def iter_rows(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None, chunk_size: int = ROWS_CHUNK_SIZE, formatted: bool = True) -> Iterator[dict[ str, str | float | int | datetime.datetime ] | tuple]:
+        """Yields the selected rows one at a time while only holding chunk_size rows in memory.
+
+        :formatted: yield rows as { col_name : converted_value } dicts, otherwise as the raw SQLite tuples
+        """
+        converters = self.get_column_converters(table_name=table_name, headers=headers)
+        for rows in self.iter_chunks(table_name=table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers, chunk_size=chunk_size):
+            for row in rows:
+                yield self.convert_row(row, converters) if formatted else row
+
+    @staticmethod
+    def to_array(values: tuple | list, col_type: str) -> np.ndarray:
+        """Converts one column of raw SQLite values into a typed NumPy array, DATETIME values become naive UTC datetime64"""
+        if col_type == "REAL" or col_type == "FLOAT":
+            return np.array(values, dtype=np.float64)
+        if col_type == "INT":
+            try:
+                return np.array(values, dtype=np.int64)
+            except (TypeError, ValueError):
+                # NULLs present, fall back to float so they become NaN
+                return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        if col_type == "DATETIME":
+            return pd.to_datetime(list(values), utc=True, format='ISO8601').tz_convert(None).to_numpy()
+        return np.array(values, dtype=object)
+
+    @check_table
+    def iter_arrays(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None, chunk_size: int = ROWS_CHUNK_SIZE) -> Iterator[dict[str, np.ndarray]]:
+        """Yields the selected rows column-wise, chunk_size rows at a time.
+
+        return_value: { col_name : np.ndarray, ... } per chunk
+        """
+        schema = self.get_table_metadata(table_name)['schema']
+        headers = headers if headers else list(schema)
+        for rows in self.iter_chunks(table_name=table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers, chunk_size=chunk_size):
+            yield {
+                col_name: self.to_array(values, schema[col_name]) for col_name, values in zip(headers, zip(*rows))
+            }
 
-        limit_statement = f"{f'LIMIT {limit}' if limit != -1 else ''}"
+    @check_table
+    def fetch_arrays(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None, chunk_size: int = ROWS_CHUNK_SIZE) -> dict[str, np.ndarray]:
+        """Reads the selected rows column-wise straight from the cursor without building a dict per row.
 
-        query = f"SELECT {header_query} FROM {table_name}" + f" {where_statement} " + f" {order_by_statement}" f" {limit_statement}"
-        res = self.cur.execute(query)
-        rows = res.fetchall()
-        return [self.format_row(row=row, table_name=table_name, headers=headers) for row in rows]
+        return_value: { col_name : np.ndarray, ... }
+        """
+        schema = self.get_table_metadata(table_name)['schema']
+        headers = headers if headers else list(schema)
+        chunks = list(self.iter_arrays(table_name=table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers, chunk_size=chunk_size))
+        if not chunks:
+            return { col_name: self.to_array((), schema[col_name]) for col_name in headers }
+        return {
+            col_name: np.concatenate([chunk[col_name] for chunk in chunks]) for col_name in headers
+        }
+
+    def to_frame(self, arrays: dict[str, np.ndarray], table_name: str, tz: Optional[datetime.tzinfo] = None) -> pd.DataFrame:
+        df = pd.DataFrame(arrays)
+
+        tz = tz if tz else dateutil_tz.tzlocal()
+        schema = self.get_table_metadata(table_name)['schema']
+        for col_name in df.columns:
+            if schema[col_name] == "DATETIME":
+                df[col_name] = df[col_name].dt.tz_localize('UTC').dt.tz_convert(tz)
+        return df
+
+    @check_table
+    def iter_frames(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None, chunk_size: int = ROWS_CHUNK_SIZE, tz: Optional[datetime.tzinfo] = None) -> Iterator[pd.DataFrame]:
+        """Yields the selected rows as DataFrames of at most chunk_size rows, for ranges too large to load at once"""
+        for arrays in self.iter_arrays(table_name=table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers, chunk_size=chunk_size):
+            yield self.to_frame(arrays, table_name=table_name, tz=tz)
+
+    @check_table
+    def fetch_frame(self, table_name: Optional[str] = None, limit: int = -1, where_statement: str | Statement = '', order_by_statement: str = '', headers: Optional[list[str]] = None, tz: Optional[datetime.tzinfo] = None, chunk_size: int = ROWS_CHUNK_SIZE) -> pd.DataFrame:
+        """Reads the selected rows into a DataFrame with typed columns, DATETIME columns are converted to tz (default: local time)"""
+        arrays = self.fetch_arrays(table_name=table_name, limit=limit, where_statement=where_statement, order_by_statement=order_by_statement, headers=headers, chunk_size=chunk_size)
+        return self.to_frame(arrays, table_name=table_name, tz=tz)
 
     @check_table
     def get_row_schema(self, table_name: Optional[str] = None) -> dict[str, None]:
@@ -227,46 +394,23 @@ class Database:
         """
         return_value: { col_name : col_type, ... }
         """
-        query = f"PRAGMA table_info({table_name})"
-        self.cur.execute(query)
-        res = self.cur.fetchall()
-        schema = {
-            col[1] : col[2] for col in res
-        }
-        return schema
+        return dict(self.get_table_metadata(table_name)['schema'])
     
     @check_table
     def column_is_unique(self, column_name: str, table_name: Optional[str] = None):
-        query = f"PRAGMA index_list({table_name})"
-        self.cur.execute(query)
-        res = self.cur.fetchall()
-        
-        for unique_col in res:
-            index_name = unique_col[1]
-            query = f"PRAGMA index_info({index_name})"
-            self.cur.execute(query)
-            col_info = self.cur.fetchall()[0]
-            if col_info[-1] == column_name:
-                return True
-
-        return False
+        return column_name in self.get_table_metadata(table_name)['unique_columns']
 
     @check_table
     def get_table_def(self, table_name: Optional[str] = None) -> dict[str, str]:
-        query = f"PRAGMA table_info({table_name})"
-        self.cur.execute(query)
-        res = self.cur.fetchall()
+        metadata = self.get_table_metadata(table_name)
 
-        pk_index, pk_name = self.get_table_primary_key(table_name=table_name)
+        pk_index, pk_name = metadata['primary_key']
         table_def: dict[str, str] = {}
-        for col in res:
-            col_name: str = str(col[1])
-            col_type: str = str(col[2]).upper()
-
-            col_def = col_type
+        for col_name, col_type in metadata['schema'].items():
+            col_def = str(col_type).upper()
             if col_name == pk_name:
                 col_def += " PRIMARY KEY"
-            if self.column_is_unique(column_name=col_name, table_name=table_name):
+            if col_name in metadata['unique_columns']:
                 col_def += " UNIQUE"
 
             table_def[col_name] = col_def
@@ -275,39 +419,47 @@ class Database:
 
     @check_table
     def get_table_primary_key(self, table_name: Optional[str] = None) -> list[int | str]:
-        query = self.cur.execute(f"PRAGMA table_info({table_name})")
-        table_info = query.fetchall()
-        for col_info in table_info:
-            if col_info[-1] == 1:
-                return col_info[:2]
-        return [-1, '']
+        return list(self.get_table_metadata(table_name)['primary_key'])
+
+    @staticmethod
+    def get_column_converter(col_type: str) -> Optional[Callable[[Any], Any]]:
+        if col_type == "TEXT" or col_type == "DATE":
+            return lambda value: value
+        if col_type == "REAL" or col_type == "FLOAT":
+            return float
+        if col_type == "INT":
+            return int
+        if col_type == "DATETIME":
+            return datetime.datetime.fromisoformat
+        return None
 
     @check_table
-    def format_row(self, row: list[str], table_name: Optional[str] = None, headers: Optional[list[str]] = None) -> dict[ str, str | float | int | datetime.datetime]:
-        """
-        return_value: [ col_value, ... ]
+    def get_column_converters(self, table_name: Optional[str] = None, headers: Optional[list[str]] = None) -> list[tuple[int, str, Callable[[Any], Any]]]:
+        """Resolves the value converter of every selected column once so rows can be formatted without catalog lookups.
+
+        return_value: [ (row_index, col_name, converter), ... ]
         """
-        schema = self.get_table_schema(table_name)
-        if headers:
-            schema = { header: schema[header] for header in schema if header in headers}
-        else:
+        schema = self.get_table_metadata(table_name)['schema']
+        if not headers:
             headers = [ header for header in schema ]
 
-        formatted_row: dict[str, str | float | int | datetime.datetime] = {}
+        converters = []
         for i, col_name in enumerate(headers):
-            col_type = schema[col_name]
-            if col_type == "TEXT":
-                formatted_row[col_name] = row[i]
-            if col_type == "REAL" or col_type == "FLOAT":
-                formatted_row[col_name] = float(row[i])
-            if col_type == "INT":
-                formatted_row[col_name] = int(row[i])
-            if col_type == "DATE":
-                formatted_row[col_name] = row[i]
-            if col_type == "DATETIME":
-                formatted_row[col_name] = datetime.datetime.fromisoformat(row[i])
-
-        return formatted_row
+            converter = self.get_column_converter(schema[col_name])
+            if converter:
+                converters.append((i, col_name, converter))
+        return converters
+
+    @staticmethod
+    def convert_row(row: list | tuple, converters: list[tuple[int, str, Callable[[Any], Any]]]) -> dict[ str, str | float | int | datetime.datetime]:
+        return { col_name: converter(row[i]) for i, col_name, converter in converters }
+
+    @check_table
+    def format_row(self, row: list[str], table_name: Optional[str] = None, headers: Optional[list[str]] = None) -> dict[ str, str | float | int | datetime.datetime]:
+        """
+        return_value: [ col_value, ... ]
+        """
+        return self.convert_row(row, self.get_column_converters(table_name=table_name, headers=headers))
 
 def main():
     pass
@@ -1,6 +1,10 @@
 import os
-from database import Database, InvalidTableNameError, InvalidValuesError, DuplicateInsertError
-from typing import Optional
+import csv
+import hashlib
+import datetime
+from database import Database, OnConflict, InvalidTableNameError, InvalidValuesError
+from database.migrations import Migration, MigrationRunner, MigrationError
+from typing import Callable, Optional
 
 class DBMSConstructionError(Exception):
     """Raised when a database management system object cannot be created"""
@@ -19,6 +23,9 @@ class InvalidDataSourceError(Exception):
     pass
 
 class DatabaseSetupService:
+    # Rows upserted per executemany while importing local storage files
+    IMPORT_BATCH_SIZE = 5000
+
     data_dir = os.path.join(os.getcwd(), 'data')
     local_db_path = os.path.join(data_dir, 'local_db')
     candles_dir = os.path.join(data_dir, 'candles')
@@ -68,24 +75,162 @@ class DatabaseSetupService:
             "side": "TEXT",
             "bid": "REAL",
             "ask": "REAL",
-            "exchange": "TEXT"
+            "exchange": "TEXT",
+            "time_epoch": "INT"
             },
     }
 
+    # Range loads filter on trading pair (and granularity) first, then scan a contiguous range of integer epochs.
+    # These are plain composite indexes, not covering ones: the loads select every column, so each matching row
+    # is still read from the table.
+    index_definitions = {
+        'candles': {
+            'candles_pair_granularity_start_idx': ['trading_pair', 'granularity', 'start'],
+            },
+        'market_trades': {
+            'market_trades_pair_time_epoch_idx': ['trading_pair', 'time_epoch'],
+            },
+    }
+
+
     def __init__(self, db: Optional[Database] = None):
         self.db = db if db else Database('mywow.db')
         self.db_name = self.db.db_name
+        self.migration_runner = MigrationRunner(self.db, self.get_migrations())
         self.setup_database()
 
+    def get_migrations(self) -> list[Migration]:
+        """Ordered schema changes applied to existing databases, new tables are created from table_definitions at the latest version"""
+        return [
+            Migration(1, 'initial tables', []),
+            Migration(2, 'market_trades.time_epoch and time-series indexes', [self.add_market_trades_time_epoch]),
+            Migration(3, 'local_imports fingerprints of imported local storage files', [self.create_local_imports_table]),
+            Migration(4, 'candle_coverage intervals of synced candles', [self.create_candle_coverage_table]),
+            Migration(5, 'candle_rollups of candles resampled from ONE_MINUTE candles', [self.create_candle_rollups_table]),
+            Migration(6, 'products catalog of tradable products', [self.create_products_table]),
+            Migration(7, 'candle ids include the trading pair and granularity', [self.rekey_candles]),
+        ]
+
     def setup_database(self):
         self.setup_local_storage()
+        try:
+            self.migration_runner.run()
+        except MigrationError:
+            raise DBMSConstructionError
         for name, definition in self.table_definitions.items():
             try:
                 self.create_table(table_name=name, table_definition=definition)
+                self.create_indexes(table_name=name)
                 self.upload_local_table_data(table_name=name)
             except TableConstructionError:
                 raise DBMSConstructionError
 
+    def add_market_trades_time_epoch(self, runner: MigrationRunner):
+        """Stores market trade times as integer epochs so range filters compare integers in UTC"""
+        if runner.table_exists('market_trades') and not runner.column_exists('market_trades', 'time_epoch'):
+            runner.rebuild_table('market_trades', self.table_definitions['market_trades'],
+                                 column_map={'time_epoch': "CAST(strftime('%s', time) AS INTEGER)"})
+
+        runner.after_commit(self.add_local_market_trades_time_epoch)
+
+    def add_local_market_trades_time_epoch(self):
+        local_table_path = os.path.join(self.local_db_path, 'market_trades.csv')
+        if not os.path.exists(local_table_path):
+            return
+        with open(local_table_path, 'r', newline='') as f:
+            local_header = next(csv.reader(f), [])
+        if 'time_epoch' in local_header:
+            return
+
+        def add_time_epoch(row: dict) -> dict:
+            row['time_epoch'] = int(datetime.datetime.fromisoformat(row['time']).timestamp())
+            return row
+        self.rewrite_local_table_file(local_table_path, local_header + ['time_epoch'], add_time_epoch)
+
+    @staticmethod
+    def rewrite_local_table_file(local_table_path: str, headers: list[str], convert_row: Callable[[dict], dict]):
+        """Rewrites every row of a local storage file through convert_row, the file is replaced only once fully written"""
+        temp_path = local_table_path + '.tmp'
+        with open(local_table_path, 'r', newline='') as source, open(temp_path, 'w', newline='') as target:
+            reader = csv.DictReader(source)
+            writer = csv.DictWriter(target, fieldnames=headers, lineterminator='\n')
+            writer.writeheader()
+            for row in reader:
+                if not any(row.values()):
+                    continue
+                writer.writerow(convert_row(row))
+        os.replace(temp_path, local_table_path)
+
+    def create_local_imports_table(self, runner: MigrationRunner):
+        runner.execute(
+            "CREATE TABLE IF NOT EXISTS local_imports("
+            "file_name TEXT PRIMARY KEY, size INT, mtime REAL, sha256 TEXT, imported_at DATETIME)"
+        )
+
+    def create_candle_coverage_table(self, runner: MigrationRunner):
+        """Half open [range_start, range_end) epoch intervals per trading pair and granularity whose candles are stored"""
+        runner.execute(
+            "CREATE TABLE IF NOT EXISTS candle_coverage("
+            "coverage_id TEXT PRIMARY KEY, trading_pair TEXT, granularity TEXT, range_start INT, range_end INT)"
+        )
+        runner.create_index('candle_coverage_pair_granularity_idx', 'candle_coverage', ['trading_pair', 'granularity', 'range_start'])
+
+    def create_candle_rollups_table(self, runner: MigrationRunner):
+        """Same columns as candles, one rollup per trading pair and granularity at each start.
+
+        Candles and rollups derived from the REST API (CandleSyncService, CandleResampler) saw every trade and are
+        written with OnConflict.REPLACE. Those built from the websocket (IngestionPipeline, LiveCandleBuilder) may
+        have missed trades and are written with OnConflict.IGNORE, so a REST-derived row always wins whichever
+        was written first.
+        """
+        runner.execute(
+            "CREATE TABLE IF NOT EXISTS candle_rollups("
+            "candle_id TEXT PRIMARY KEY UNIQUE, time DATETIME, start INT, trading_pair TEXT, "
+            "open REAL, high REAL, low REAL, close REAL, volume REAL, granularity TEXT)"
+        )
+        runner.create_index('candle_rollups_pair_granularity_start_idx', 'candle_rollups', ['trading_pair', 'granularity', 'start'])
+
+    def create_products_table(self, runner: MigrationRunner):
+        """Last fetched product list, updated_at is the epoch of the refresh that wrote each row"""
+        runner.execute(
+            "CREATE TABLE IF NOT EXISTS products("
+            "product_id TEXT PRIMARY KEY UNIQUE, base_currency_id TEXT, quote_currency_id TEXT, base_increment TEXT, "
+            "quote_increment TEXT, base_min_size TEXT, base_max_size TEXT, quote_min_size TEXT, quote_max_size TEXT, "
+            "status TEXT, trading_disabled INT, product_type TEXT, updated_at INT)"
+        )
+
+    def rekey_candles(self, runner: MigrationRunner):
+        """Candle ids were {symbol}-{start}, so candles of another quote currency or granularity at the same start replaced each other"""
+        # candle_rollups has the columns of candles
+        for table_name in ['candles', 'candle_rollups']:
+            if runner.table_exists(table_name):
+                runner.rebuild_table(table_name, self.table_definitions['candles'],
+                                     column_map={'candle_id': "trading_pair || '-' || granularity || '-' || start"})
+
+        runner.after_commit(self.rekey_local_candles)
+
+    def rekey_local_candles(self):
+        local_table_path = os.path.join(self.local_db_path, 'candles.csv')
+        if not os.path.exists(local_table_path):
+            return
+        with open(local_table_path, 'r', newline='') as f:
+            local_header = next(csv.reader(f), [])
+
+        def rekey(row: dict) -> dict:
+            # same format as Candle.build_candle_id
+            row['candle_id'] = f"{row['trading_pair']}-{row['granularity']}-{row['start']}"
+            return row
+        self.rewrite_local_table_file(local_table_path, local_header, rekey)
+
+    def create_indexes(self, table_name: str):
+        for index_name, columns in self.index_definitions.get(table_name, {}).items():
+            try:
+                self.db.create_index(index_name=index_name, table_name=table_name, columns=columns)
+            except InvalidTableNameError:
+                raise TableConstructionError
+            except InvalidValuesError:
+                raise TableConstructionError
+
     def setup_local_storage(self):
         # directories
         if not os.path.exists(self.data_dir):
@@ -123,26 +268,89 @@ class DatabaseSetupService:
         except TableConstructionError:
             raise
 
-    def upload_local_table_data(self, table_name: str):
+    def get_local_file_fingerprint(self, local_table_path: str) -> dict:
+        stat = os.stat(local_table_path)
+        return {
+            'file_name': os.path.basename(local_table_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def upload_local_table_data(self, table_name: str, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+        """Imports a table's local storage file, skipping it when it is unchanged since the last import.
+
+        Files are fingerprinted in local_imports by size and mtime, then by content hash when those differ,
+        so restarts only pay for files that were actually edited. Changed files are inserted in batches inside a
+        single transaction together with their new fingerprint, rows already in the table are kept.
+
+        return_value: number of rows written
+        """
         local_table_path = os.path.join(self.local_db_path, table_name + '.csv')
-        with open(local_table_path, 'r') as f:
-            _header = f.readline()
-            rows = [line.strip('\n').split(',') for line in f.readlines()]
-            data = []
-            for row in rows:
-                header = [col_name for col_name in self.table_definitions[table_name]]
-                header_to_value = {
-                    header[i]: value for i, value in enumerate(row)
-                }
-                data.append(header_to_value)
-
-            for values in data:
-                try:
-                    self.db.insert_one(table_name=table_name, values=values)
-                except DuplicateInsertError:
-                    continue
-                except InvalidValuesError:
-                    continue
+        fingerprint = self.get_local_file_fingerprint(local_table_path)
+        imported = self.db.get_rows(table_name='local_imports', where_statement=self.db.build_where(eq={'file_name': fingerprint['file_name']}))
+        if imported and imported[0]['size'] == fingerprint['size'] and imported[0]['mtime'] == fingerprint['mtime']:
+            return 0
+
+        fingerprint['sha256'] = self.hash_file(local_table_path)
+        fingerprint['imported_at'] = datetime.datetime.now().astimezone()
+        if imported and imported[0]['sha256'] == fingerprint['sha256']:
+            self.db.insert_one(table_name='local_imports', values=fingerprint, on_conflict=OnConflict.REPLACE)
+            return 0
+
+        row_count = 0
+        try:
+            with open(local_table_path, 'r', newline='') as f:
+                reader = csv.DictReader(f)
+                batch = []
+                for row in reader:
+                    if not any(row.values()):
+                        continue
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        row_count += self.db.insert_many(table_name=table_name, rows=batch, on_conflict=OnConflict.IGNORE, commit=False)
+                        batch = []
+                row_count += self.db.insert_many(table_name=table_name, rows=batch, on_conflict=OnConflict.IGNORE, commit=False)
+            self.db.insert_many(table_name='local_imports', rows=[fingerprint], on_conflict=OnConflict.REPLACE, commit=False)
+            self.db.conn.commit()
+        except Exception:
+            self.db.conn.rollback()
+            raise
+        return row_count
+
+    def export_local_table_data(self, table_name: str, chunk_size: int = Database.ROWS_CHUNK_SIZE) -> int:
+        """Writes every row of a table to its local storage file, streaming the rows so memory stays bounded.
+
+        return_value: number of rows written
+        """
+        if table_name not in self.table_definitions:
+            raise InvalidDataSourceError
+
+        local_table_path = os.path.join(self.local_db_path, table_name + '.csv')
+        temp_path = local_table_path + '.tmp'
+        headers = list(self.table_definitions[table_name])
+        row_count = 0
+        with open(temp_path, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(headers)
+            for row in self.db.iter_rows(table_name=table_name, headers=headers, chunk_size=chunk_size, formatted=False):
+                writer.writerow(row)
+                row_count += 1
+        os.replace(temp_path, local_table_path)
+
+        # The exported file mirrors the table, record it so the next startup does not import it back
+        fingerprint = self.get_local_file_fingerprint(local_table_path)
+        fingerprint['sha256'] = self.hash_file(local_table_path)
+        fingerprint['imported_at'] = datetime.datetime.now().astimezone()
+        self.db.insert_one(table_name='local_imports', values=fingerprint, on_conflict=OnConflict.REPLACE)
+        return row_count
 
 def main():
     pass
@@ -0,0 +1,164 @@
+import sqlite3
+from typing import Callable, Optional
+
+from .database import Database
+
+class MigrationError(Exception):
+    """Raised when a schema migration fails and its transaction is rolled back"""
+    pass
+
+class Migration:
+    def __init__(self, version: int, description: str, steps: list[Callable[['MigrationRunner'], None]]):
+        """
+        :version: schema version the database is at once every step has been applied
+        :steps: callables receiving the runner, applied in order inside the runner's transaction
+        """
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+class MigrationRunner:
+    """Applies pending migrations in version order inside a single transaction.
+
+    The schema version is recorded in PRAGMA user_version, which is written in the same transaction
+    as the migration steps so a failed migration leaves both the tables and the version untouched.
+    Steps must use the runner helpers (execute, add_column, create_index, rebuild_table) rather than
+    Database methods, as the latter commit and would end the migration transaction early. Changes outside the
+    database, ex. to local storage files, cannot be rolled back and are registered with after_commit instead.
+    """
+    REBUILD_CHUNK_SIZE = 50_000
+
+    def __init__(self, db: Database, migrations: list[Migration], chunk_size: int = REBUILD_CHUNK_SIZE):
+        self.db = db
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.chunk_size = chunk_size
+        self.commit_callbacks: list[Callable[[], None]] = []
+
+    @property
+    def latest_version(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+
+    def pending(self) -> list[Migration]:
+        schema_version = self.db.get_schema_version()
+        return [migration for migration in self.migrations if migration.version > schema_version]
+
+    def run(self) -> int:
+        """
+        return_value: schema version of the database after the run
+        """
+        pending = self.pending()
+        if not pending:
+            return self.db.get_schema_version()
+
+        if self.db.conn.in_transaction:
+            self.db.conn.commit()
+        migration: Optional[Migration] = None
+        self.commit_callbacks = []
+        try:
+            self.db.cur.execute("BEGIN")
+            for migration in pending:
+                print(f"Applying schema migration {migration.version}: {migration.description}...")
+                for step in migration.steps:
+                    step(self)
+                self.db.cur.execute(f"PRAGMA user_version = {int(migration.version)}")
+            self.db.conn.commit()
+        except Exception as e:
+            self.db.conn.rollback()
+            self.commit_callbacks = []
+            if migration is None:
+                raise MigrationError(f"Schema migrations could not start: {e}") from e
+            raise MigrationError(f"Schema migration to version {migration.version} failed: {e}") from e
+        finally:
+            self.db.invalidate_table_metadata()
+
+        callbacks, self.commit_callbacks = self.commit_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                raise MigrationError(f"Schema migration to version {pending[-1].version} was committed but updating local storage failed: {e}") from e
+        return pending[-1].version
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Runs callback once the migrations are committed, it is dropped if they are rolled back"""
+        self.commit_callbacks.append(callback)
+
+    def execute(self, query: str, params: Optional[list] = None) -> sqlite3.Cursor:
+        return self.db.cur.execute(query, params if params else [])
+
+    def table_exists(self, table_name: str) -> bool:
+        self.db.invalidate_table_metadata(table_name)
+        return self.db.table_exists(table_name)
+
+    def column_exists(self, table_name: str, column_name: str) -> bool:
+        return self.table_exists(table_name) and column_name in self.db.get_table_schema(table_name)
+
+    def add_column(self, table_name: str, column_name: str, column_type: str):
+        self.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+        self.db.invalidate_table_metadata(table_name)
+
+    def create_index(self, index_name: str, table_name: str, columns: list[str]):
+        self.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({', '.join(columns)})")
+
+    def get_chunk_key(self, table_name: str) -> list[str]:
+        """Columns a table's rows are stored in order of, rowid unless the table is WITHOUT ROWID, then its primary key"""
+        table_sql = self.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", [table_name]).fetchone()[0]
+        if 'WITHOUT ROWID' not in table_sql.upper():
+            return ['rowid']
+        # table_info rows: ( cid, name, type, notnull, dflt_value, pk ), pk is the column's position in the primary key
+        table_info = self.execute(f"PRAGMA table_info({table_name})").fetchall()
+        return [col_info[1] for col_info in sorted(table_info, key=lambda col_info: col_info[5]) if col_info[5] > 0]
+
+    def rebuild_table(self, table_name: str, table_definition: dict[str, str], table_options: str = '',
+                      column_map: Optional[dict[str, str]] = None):
+        """Recreates a table with a new definition, copying its rows over in chunks of chunk_size rows.
+
+        Copying with bounded INSERT ... SELECT batches keeps each statement's memory and undo log small when
+        tables hold millions of rows. Chunks are ranges of the old table's rowid, or primary key when it is a
+        WITHOUT ROWID table, so each one is a seek and a sequential read. The table's indexes are recreated
+        once the copy is complete.
+
+        :table_definition: { col_name : col_def, ... } of the rebuilt table
+        :table_options: appended after the column definitions, ex. 'WITHOUT ROWID'
+        :column_map: { new_col_name : select_expression, ... } for columns that are not copied as is,
+            columns missing from both the map and the old table are left NULL
+        """
+        column_map = column_map if column_map else {}
+        self.db.invalidate_table_metadata(table_name)
+        old_schema = self.db.get_table_schema(table_name)
+        copy_columns = [col_name for col_name in table_definition if col_name in column_map or col_name in old_schema]
+        select_expressions = [column_map.get(col_name, col_name) for col_name in copy_columns]
+        index_definitions = [
+            row[0] for row in self.execute(
+                "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", [table_name]
+            ).fetchall()
+        ]
+
+        rebuild_name = f"{table_name}__rebuild"
+        definition = ", ".join([f"{col_name} {col_def}" for col_name, col_def in table_definition.items()])
+        self.execute(f"DROP TABLE IF EXISTS {rebuild_name}")
+        self.execute(f"CREATE TABLE {rebuild_name}({definition}) {table_options}".strip())
+
+        chunk_key = ', '.join(self.get_chunk_key(table_name))
+        copy_query = f"INSERT INTO {rebuild_name} ({', '.join(copy_columns)}) SELECT {', '.join(select_expressions)} FROM {table_name}"
+        last_key: Optional[list] = None
+        while True:
+            # row values compare composite keys in order, ( a, b ) > ( ?, ? )
+            conditions = [f"({chunk_key}) > ({', '.join(['?'] * len(last_key))})"] if last_key else []
+            params = list(last_key) if last_key else []
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+            chunk_end = self.execute(
+                f"SELECT {chunk_key} FROM {table_name}{where} ORDER BY {chunk_key} LIMIT 1 OFFSET ?", params + [self.chunk_size - 1]
+            ).fetchone()
+            if chunk_end is None:
+                self.execute(copy_query + where, params)
+                break
+            conditions.append(f"({chunk_key}) <= ({', '.join(['?'] * len(chunk_end))})")
+            self.execute(f"{copy_query} WHERE {' AND '.join(conditions)}", params + list(chunk_end))
+            last_key = list(chunk_end)
+
+        self.execute(f"DROP TABLE {table_name}")
+        self.execute(f"ALTER TABLE {rebuild_name} RENAME TO {table_name}")
+        for index_definition in index_definitions:
+            self.execute(index_definition)
+        self.db.invalidate_table_metadata()
@@ -0,0 +1,149 @@
+import datetime
+from functools import lru_cache
+from typing import Any, Optional
+
+# Size of both the compiled statement shape LRUs below and the sqlite3 prepared statement cache of each connection
+STATEMENT_CACHE_SIZE = 256
+
+class OnConflict:
+    """Primary key conflict policies for inserts, applied with SQLite's native ON CONFLICT upsert clause"""
+    IGNORE = 'ignore'       # keep the stored row
+    REPLACE = 'replace'     # overwrite every non primary key column of the stored row
+    UPDATE = 'update'       # overwrite only the given update_columns of the stored row
+    ABORT = 'abort'         # fail the statement
+
+    @staticmethod
+    def verify(on_conflict: str) -> bool:
+        return on_conflict in [OnConflict.IGNORE, OnConflict.REPLACE, OnConflict.UPDATE, OnConflict.ABORT]
+
+class Statement:
+    """A '?' bound SQL statement and the parameters to execute it with"""
+    def __init__(self, sql: str = '', params: Optional[list] = None):
+        self.sql = sql
+        self.params: list = params if params else []
+
+    def __bool__(self) -> bool:
+        return bool(self.sql)
+
+    def __repr__(self) -> str:
+        return f"Statement({self.sql!r}, {self.params!r})"
+
+class QueryBuilder:
+    """Builds parameterized statements whose SQL text only depends on the statement shape.
+
+    Values are never formatted into the SQL, so repeated queries with different values produce identical
+    SQL text which sqlite3 serves from its prepared statement cache instead of re-parsing and re-planning.
+    The SQL text of each shape (table, operation, columns, comparison operators) is compiled once and kept in an LRU.
+    """
+    comparison_operators = {
+        'eq': '=',
+        'lt': '<',
+        'lte': '<=',
+        'gt': '>',
+        'gte': '>=',
+    }
+
+    @staticmethod
+    def to_param(value: Any) -> Any:
+        """Converts a python value into a value that can be bound to a '?' placeholder"""
+        if type(value) == datetime.datetime:
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def compile_conditions(shape: tuple[tuple[str, str], ...], separator: str = ' AND ') -> str:
+        """:shape: ( (col_name, operator), ... )"""
+        return separator.join([f"{col_name}{operator}?" for col_name, operator in shape])
+
+    @staticmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def compile_select(table_name: str, headers: tuple[str, ...], where_sql: str, order_by_statement: str, has_limit: bool) -> str:
+        header_query = ', '.join(headers) if headers else '*'
+        sql = f"SELECT {header_query} FROM {table_name}"
+        if where_sql:
+            sql += f" {where_sql}"
+        if order_by_statement:
+            sql += f" {order_by_statement}"
+        if has_limit:
+            sql += " LIMIT ?"
+        return sql
+
+    @staticmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def compile_insert(table_name: str, columns: tuple[str, ...], on_conflict: str = OnConflict.ABORT, conflict_target: str = '',
+                       update_columns: tuple[str, ...] = ()) -> str:
+        """
+        :conflict_target: primary key column checked for conflicts, required by OnConflict.REPLACE and OnConflict.UPDATE
+        :update_columns: columns overwritten with the incoming values by OnConflict.REPLACE and OnConflict.UPDATE
+        """
+        placeholders = ', '.join(['?'] * len(columns))
+        sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+        if on_conflict == OnConflict.IGNORE:
+            target = f"({conflict_target})" if conflict_target else ''
+            sql += f" ON CONFLICT{target} DO NOTHING"
+        elif on_conflict == OnConflict.REPLACE or on_conflict == OnConflict.UPDATE:
+            assignments = ', '.join([f"{col_name}=excluded.{col_name}" for col_name in update_columns])
+            sql += f" ON CONFLICT({conflict_target}) DO UPDATE SET {assignments}"
+        return sql
+
+    @staticmethod
+    def where(eq: Optional[dict] = None, lt: Optional[dict] = None, gt: Optional[dict] = None, lte: Optional[dict] = None,
+              gte: Optional[dict] = None, btwn: Optional[dict] = None) -> Statement:
+        """Constructs a where statement that requires all conditions be met.
+
+        :eq, lt, gt, lte, gte: { column_name : value, ... }
+
+        :btwn: { column_name : { 'min': value, 'max': value }, ... }
+
+        Notes:
+            - Between (btwn) comparison is inclusive for min and max values.
+            - Values are bound as parameters and must not be quoted.
+
+        Example:
+        - QueryBuilder.where(eq={'name':'John'}, gt={'account_total':500}, lte={'items_purchased':10})
+
+        Return:
+            - Statement("WHERE name=? AND account_total>? AND items_purchased<=?", ['John', 500, 10])
+        """
+        shape: list[tuple[str, str]] = []
+        params: list = []
+        conditions = {'eq': eq, 'lt': lt, 'lte': lte, 'gt': gt, 'gte': gte}
+        for comparison, values in conditions.items():
+            if not values:
+                continue
+            for col_name, value in values.items():
+                shape.append((col_name, QueryBuilder.comparison_operators[comparison]))
+                params.append(QueryBuilder.to_param(value))
+        if btwn:
+            for col_name, bounds in btwn.items():
+                shape.append((col_name, '>='))
+                params.append(QueryBuilder.to_param(bounds['min']))
+                shape.append((col_name, '<='))
+                params.append(QueryBuilder.to_param(bounds['max']))
+
+        if not shape:
+            return Statement()
+        return Statement(f"WHERE {QueryBuilder.compile_conditions(tuple(shape))}", params)
+
+    @staticmethod
+    def select(table_name: str, headers: Optional[list[str]] = None, where: Optional[Statement] = None,
+               order_by_statement: str = '', limit: int = -1) -> Statement:
+        where = where if where else Statement()
+        sql = QueryBuilder.compile_select(table_name, tuple(headers) if headers else (), where.sql, order_by_statement.strip(), limit != -1)
+        params = list(where.params)
+        if limit != -1:
+            params.append(limit)
+        return Statement(sql, params)
+
+    @staticmethod
+    def update(table_name: str, updated_values: dict, where_values: dict) -> Statement:
+        set_sql = QueryBuilder.compile_conditions(tuple((col_name, '=') for col_name in updated_values), ', ')
+        where = QueryBuilder.where(eq=where_values)
+        params = [QueryBuilder.to_param(value) for value in updated_values.values()] + where.params
+        return Statement(f"UPDATE {table_name} SET {set_sql} {where.sql}", params)
+
+    @staticmethod
+    def delete(table_name: str, where_values: dict) -> Statement:
+        where = QueryBuilder.where(eq=where_values)
+        return Statement(f"DELETE FROM {table_name} {where.sql}", where.params)
@@ -1,4 +1,5 @@
 from .prediction import Prediction
 from .portfolio import Portfolio
 from .candles import Candle
-from .trades import MarketTrade
\ No newline at end of file
+from .trades import MarketTrade
+from .order_book import OrderBook
\ No newline at end of file
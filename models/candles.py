@@ -21,7 +21,12 @@ class Candle:
         self.range_high: float = 0
         self.range_low: float = 0
 
-        self.candle_id = f"{self.symbol}-{self.start}"
+        self.candle_id = self.build_candle_id(self.trading_pair, self.granularity, self.start)
+
+    @staticmethod
+    def build_candle_id(trading_pair: str, granularity: str, start: int) -> str:
+        """A trading pair has one candle per granularity at each start"""
+        return f"{trading_pair}-{granularity}-{start}"
 
     def view_date(self) -> str:
         if type(self.time) == datetime.datetime:
@@ -0,0 +1,153 @@
+from bisect import bisect_left
+from typing import Optional
+
+class OrderBookSide:
+    """Price levels of one side of a book, kept in a sorted list of keys with the best level last.
+
+    Keys are prices for bids and negated prices for asks, so on both sides the best price is the largest key and
+    the levels that change most often (near the top of the book) sit at the end of the list, where inserting and
+    removing shifts the fewest elements. Finding a level is a binary search in O(log n), but adding or removing one
+    is a list insert or delete in O(n), a memmove of the keys after it which stays short near the top of the book.
+    Reading the best level is O(1).
+    """
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.keys: list[float] = []
+        self.sizes: dict[float, float] = {}     # { key : size }
+
+    def get_key(self, price: float) -> float:
+        return price if self.is_bid else -price
+
+    def get_price(self, key: float) -> float:
+        return key if self.is_bid else -key
+
+    def set(self, price: float, size: float):
+        """Sets the size of a price level, a size of 0 removes the level"""
+        key = self.get_key(price)
+        if size > 0:
+            if key not in self.sizes:
+                index = bisect_left(self.keys, key)
+                self.keys.insert(index, key)
+            self.sizes[key] = size
+        elif key in self.sizes:
+            del self.sizes[key]
+            index = bisect_left(self.keys, key)
+            del self.keys[index]
+
+    def load(self, levels: dict[float, float]):
+        """Replaces every level, { price : size }"""
+        self.sizes = {self.get_key(price): size for price, size in levels.items() if size > 0}
+        self.keys = sorted(self.sizes)
+
+    def best(self) -> Optional[tuple[float, float]]:
+        """
+        return_value: ( price, size ), None when the side is empty
+        """
+        if not self.keys:
+            return None
+        key = self.keys[-1]
+        return self.get_price(key), self.sizes[key]
+
+    def top(self, levels: int) -> list[tuple[float, float]]:
+        """
+        return_value: [ ( price, size ), ... ] best level first
+        """
+        keys = self.keys[-levels:] if levels > 0 else []
+        return [(self.get_price(key), self.sizes[key]) for key in reversed(keys)]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+class OrderBook:
+    """Level2 order book of one product, built from the level2 channel's snapshot and update events.
+
+    Each update sets the absolute quantity of a price level, a quantity of 0 removes it. Changing the size of an
+    existing level is O(1), adding or removing a level O(n) in the worst case, see OrderBookSide. The best
+    bid/ask, spread, mid price and microprice are read in O(1).
+    """
+    def __init__(self, product_id: str):
+        self.product_id = product_id
+        self.bids = OrderBookSide(is_bid=True)
+        self.asks = OrderBookSide(is_bid=False)
+        self.is_synced: bool = False    # True once a snapshot was applied
+        self.updated_at: str = ''       # event_time of the last applied update
+
+    def get_side(self, side: str) -> OrderBookSide:
+        # Coinbase names the ask side 'offer' in level2 updates
+        return self.bids if side == 'bid' else self.asks
+
+    def apply_snapshot(self, updates: list[dict]):
+        bids: dict[float, float] = {}
+        asks: dict[float, float] = {}
+        for update in updates:
+            levels = bids if update['side'] == 'bid' else asks
+            levels[float(update['price_level'])] = float(update['new_quantity'])
+            self.updated_at = update.get('event_time', self.updated_at)
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.is_synced = True
+
+    def apply_updates(self, updates: list[dict]):
+        for update in updates:
+            self.get_side(update['side']).set(float(update['price_level']), float(update['new_quantity']))
+            self.updated_at = update.get('event_time', self.updated_at)
+
+    def apply_event(self, event: dict):
+        """Applies one event of an l2_data message, { 'type': 'snapshot' | 'update', 'product_id', 'updates': [...] }"""
+        if event['type'] == 'snapshot':
+            self.apply_snapshot(event['updates'])
+        else:
+            self.apply_updates(event['updates'])
+
+    def best_bid(self) -> Optional[tuple[float, float]]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[tuple[float, float]]:
+        return self.asks.best()
+
+    def spread(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return ask[0] - bid[0]
+
+    def mid_price(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def microprice(self) -> Optional[float]:
+        """Mid price weighted towards the side with less size at the top of the book, where the next trade is more likely"""
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        (bid_price, bid_size), (ask_price, ask_size) = bid, ask
+        return (bid_price * ask_size + ask_price * bid_size) / (bid_size + ask_size)
+
+    def get_depth(self, levels: int) -> dict[str, list[tuple[float, float]]]:
+        """
+        return_value: { 'bids': [ ( price, size ), ... ], 'asks': [ ( price, size ), ... ] } the best levels of each side, best first
+        """
+        return {'bids': self.bids.top(levels), 'asks': self.asks.top(levels)}
+
+    def get_depth_size(self, levels: int) -> dict[str, float]:
+        """
+        return_value: { 'bids': size, 'asks': size } total size of the best levels of each side
+        """
+        return {
+            'bids': sum(size for _, size in self.bids.top(levels)),
+            'asks': sum(size for _, size in self.asks.top(levels)),
+        }
+
+    def to_dict(self, levels: int = 10) -> dict:
+        return {
+            'product_id': self.product_id,
+            'best_bid': self.best_bid(),
+            'best_ask': self.best_ask(),
+            'spread': self.spread(),
+            'mid_price': self.mid_price(),
+            'microprice': self.microprice(),
+            'depth': self.get_depth(levels),
+            'updated_at': self.updated_at,
+        }
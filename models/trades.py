@@ -21,6 +21,7 @@ class MarketTrade:
         self.total = self.price * self.size * (-1 if self.side == 'SELL' else 1)
 
         self.time = self.init_data['time'] if type(self.init_data['time']) == datetime.datetime else datetime.datetime.fromisoformat(self.init_data['time']).astimezone()
+        self.time_epoch: int = int(self.time.timestamp())
 
         self.bid = float(self.init_data['bid'] if self.init_data['bid'] else 0)
         self.ask = float(self.init_data['ask'] if self.init_data['ask'] else 0)
@@ -45,7 +46,8 @@ class MarketTrade:
             self.side,
             self.bid,
             self.ask,
-            self.exchange
+            self.exchange,
+            self.time_epoch
         ]
 
     def to_json(self) -> dict:
@@ -58,7 +60,8 @@ class MarketTrade:
             'side': self.side,
             'bid': str(self.bid),
             'ask': str(self.ask),
-            'exchange': self.exchange
+            'exchange': self.exchange,
+            'time_epoch': str(self.time_epoch)
         }
 
     def to_dict(self) -> dict:
@@ -1,3 +1,9 @@
 from .prediction_service import PredictionService
 from .portfolio_service import PortfolioService
+from .candle_sync_service import CandleSyncService
+from .candle_resampler import CandleResampler
+from .product_catalog import ProductCatalog
+from .order_book_service import OrderBookService
+from .live_candle_builder import LiveCandleBuilder
+from .market_data_broker import MarketDataBroker, OverflowPolicy
 from .coinbase_services import *
\ No newline at end of file
@@ -0,0 +1,261 @@
+import asyncio
+import datetime
+from collections import deque
+from typing import AsyncIterator, Optional
+
+import aiohttp # type: ignore
+from coinbase import jwt_generator # type: ignore
+from coinbase.constants import API_PREFIX, BASE_URL, USER_AGENT # type: ignore
+
+from services.coinbase_services import (
+    Granularity, RateLimitedClient, CANDLES_LIMIT_MAX, CANDLES_MAX_WORKERS, MARKET_TRADES_SLICE_SECONDS, MARKET_TRADES_MAX_WORKERS,
+    REST_RATE_LIMITER, RESPONSE_CACHE, CLIENT_REGISTRY, get_candle_windows, get_candle_window_cache_key, format_candles, merge_candle_pages,
+    get_market_trade_slices, get_market_trade_slice_cache_key, add_market_trades_page, get_next_market_trades_end,
+)
+from services.rate_limiter import RateLimiter
+from services.response_cache import ResponseCache
+from services.candle_sync_service import CandleSyncService
+from database import Database
+
+class AsyncRESTClient:
+    """asyncio counterpart of RateLimitedClient(RESTClient) for the market data and portfolio endpoints.
+
+    All requests share one aiohttp session whose connector keeps up to max_connections keep-alive connections,
+    so fanning out over many products reuses warm TLS connections instead of opening one per request.
+    Requests draw from the same RateLimiter as the synchronous client (without blocking the event loop) and
+    are retried on 429, 5xx and connection errors with the same backoff. Responses are returned as dicts,
+    like RESTClient responses' to_dict().
+
+    Use as an async context manager, or call open() and close() from the running event loop.
+    """
+    MAX_CONNECTIONS = 64
+    KEEPALIVE_TIMEOUT = 30  # seconds an idle pooled connection is kept open
+    TIMEOUT = 30            # seconds
+
+    def __init__(self, api_key: Optional[str] = None, api_secret: Optional[str] = None, base_url: str = BASE_URL, scheme: str = 'https',
+                 rate_limiter: Optional[RateLimiter] = None, max_connections: int = MAX_CONNECTIONS,
+                 max_retries: int = RateLimitedClient.MAX_RETRIES, timeout: int = TIMEOUT):
+        """
+        :api_key, api_secret: requests are signed when given, public and fake server endpoints need neither
+        :base_url: host (and port) without scheme, as for RESTClient
+        """
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.base_url = base_url
+        self.scheme = scheme
+        self.rate_limiter = rate_limiter if rate_limiter else REST_RATE_LIMITER
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def open(self) -> 'AsyncRESTClient':
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT, "Content-Type": "application/json"},
+            )
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> 'AsyncRESTClient':
+        return await self.open()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def get_headers(self, method: str, path: str) -> dict[str, str]:
+        if not self.api_key or not self.api_secret:
+            return {}
+        return {"Authorization": f"Bearer {jwt_generator.build_rest_jwt(f'{method} {self.base_url}{path}', self.api_key, self.api_secret)}"}
+
+    async def get(self, endpoint: str, path: str, params: Optional[dict] = None) -> dict:
+        """
+        :endpoint: RESTClient method name the request is rate limited and recorded under
+        """
+        await self.open()
+        params = { key: str(value) for key, value in (params if params else {}).items() if value is not None }
+        url = f"{self.scheme}://{self.base_url}{path}"
+
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve(endpoint)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self.session.get(url, params=params, headers=self.get_headers('GET', path)) as response:
+                    if response.status < 400:
+                        return await response.json()
+                    if response.status not in RateLimitedClient.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        self.rate_limiter.record(endpoint, errors=1)
+                        response.raise_for_status()
+                    backoff = RateLimitedClient.get_retry_backoff(attempt, response.headers.get('Retry-After'))
+                    if response.status == 429:
+                        # every caller, this one included, waits the backoff out in its next reserve
+                        self.rate_limiter.back_off(endpoint, backoff)
+                        backoff = 0.0
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    self.rate_limiter.record(endpoint, errors=1)
+                    raise
+                backoff = RateLimitedClient.get_retry_backoff(attempt)
+
+            self.rate_limiter.record(endpoint, retries=1, wait_time=backoff)
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+    async def get_candles(self, product_id: str, start: str, end: str, granularity: str, limit: Optional[int] = None) -> dict:
+        return await self.get('get_candles', f"{API_PREFIX}/products/{product_id}/candles",
+                              {'start': start, 'end': end, 'granularity': granularity, 'limit': limit})
+
+    async def get_market_trades(self, product_id: str, limit: int, start: Optional[str] = None, end: Optional[str] = None) -> dict:
+        return await self.get('get_market_trades', f"{API_PREFIX}/products/{product_id}/ticker", {'limit': limit, 'start': start, 'end': end})
+
+    async def get_product(self, product_id: str) -> dict:
+        return await self.get('get_product', f"{API_PREFIX}/products/{product_id}")
+
+    async def get_public_product(self, product_id: str) -> dict:
+        return await self.get('get_public_product', f"{API_PREFIX}/market/products/{product_id}")
+
+    async def get_portfolios(self) -> dict:
+        return await self.get('get_portfolios', f"{API_PREFIX}/portfolios")
+
+    async def get_portfolio_breakdown(self, portfolio_uuid: str) -> dict:
+        return await self.get('get_portfolio_breakdown', f"{API_PREFIX}/portfolios/{portfolio_uuid}")
+
+def get_async_client(dotenv_path: str = ".env") -> AsyncRESTClient:
+    """Returns a new client of dotenv_path's credentials, aiohttp sessions are bound to the event loop they are opened in so
+    each event loop keeps its own client"""
+    fake_url = CLIENT_REGISTRY.get_fake_url(dotenv_path)
+    if fake_url:
+        return AsyncRESTClient(base_url=fake_url, scheme='http')
+    config = CLIENT_REGISTRY.get_credentials(dotenv_path)
+    return AsyncRESTClient(api_key=config["COINBASE_API_KEY"], api_secret=config["COINBASE_API_SECRET"])
+
+async def get_default_portfolio(client: AsyncRESTClient) -> Optional[dict]:
+    portfolios = (await client.get_portfolios())["portfolios"]
+    default_portfolio = None
+    for portfolio in portfolios:
+        if portfolio["type"] == "DEFAULT":
+            default_portfolio = (await client.get_portfolio_breakdown(portfolio_uuid=portfolio["uuid"]))["breakdown"]
+    return default_portfolio
+
+async def get_product(client: AsyncRESTClient, product_id: str) -> dict:
+    return await client.get_public_product(product_id)
+
+async def get_products(client: AsyncRESTClient, product_ids: list[str], max_concurrency: int = AsyncRESTClient.MAX_CONNECTIONS) -> dict[str, dict]:
+    """Looks up many products concurrently, return_value: { product_id : product }"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def lookup(product_id: str) -> dict:
+        async with semaphore:
+            return await get_product(client, product_id)
+
+    products = await asyncio.gather(*[lookup(product_id) for product_id in product_ids])
+    return dict(zip(product_ids, products))
+
+async def fetch_candle_window(client: AsyncRESTClient, product_id: str, granularity: str, start: datetime.datetime, end: datetime.datetime,
+                              cache: Optional[ResponseCache] = RESPONSE_CACHE) -> list[dict]:
+    """Fetches the candles of one window, windows whose candles are all closed are read from and written to cache"""
+    key = get_candle_window_cache_key(product_id, granularity, start, end) if cache is not None else None
+    if key:
+        candles = await asyncio.to_thread(cache.get, key)
+        if candles is not None:
+            return candles
+
+    res = await client.get_candles(product_id=product_id, start=str(int(start.timestamp())), end=str(int(end.timestamp())), granularity=granularity)
+    candles = format_candles(res['candles'], product_id, granularity)
+
+    if key:
+        await asyncio.to_thread(cache.put, key, candles)
+    return candles
+
+async def get_asset_candles(client: AsyncRESTClient, product_id: str, granularity: str, start: datetime.datetime, end: datetime.datetime,
+                            limit: int = CANDLES_LIMIT_MAX, max_concurrency: int = CANDLES_MAX_WORKERS,
+                            cache: Optional[ResponseCache] = RESPONSE_CACHE) -> list[dict]:
+    """Fetches every candle between start and end newest first, at most max_concurrency windows in flight"""
+    if (not Granularity.verify(granularity)):
+        raise ValueError("Granularity must be one of the following: ONE_MINUTE, FIVE_MINUTES, FIFTEEN_MINUTES, THIRTY_MINUTES, ONE_HOUR, TWO_HOUR, SIX_HOUR, ONE_DAY")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_window(window_start: datetime.datetime, window_end: datetime.datetime) -> list[dict]:
+        async with semaphore:
+            return await fetch_candle_window(client, product_id, granularity, window_start, window_end, cache)
+
+    pages = await asyncio.gather(*[fetch_window(window_start, window_end) for window_start, window_end in get_candle_windows(start, end, granularity, limit)])
+    return merge_candle_pages(list(pages))
+
+async def fetch_market_trade_slice(client: AsyncRESTClient, product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int,
+                                   cache: Optional[ResponseCache] = RESPONSE_CACHE) -> list[dict]:
+    """Fetches every trade between start_time and end_time, paginating backwards from end_time, without duplicate trade_ids"""
+    key = get_market_trade_slice_cache_key(product_id, start_time, end_time, limit) if cache is not None else None
+    if key:
+        cached_market_trades = await asyncio.to_thread(cache.get, key)
+        if cached_market_trades is not None:
+            return cached_market_trades
+
+    market_trades: list = []
+    seen_trade_ids: set[str] = set()
+    while start_time < end_time:
+        res = await client.get_market_trades(product_id=product_id, limit=limit, start=str(int(start_time.timestamp())), end=str(int(end_time.timestamp())))
+        page = res['trades']
+        add_market_trades_page(page, market_trades, seen_trade_ids)
+
+        if len(page) < limit:
+            break
+        end_time = get_next_market_trades_end(page, end_time)
+
+    if key:
+        await asyncio.to_thread(cache.put, key, market_trades)
+    return market_trades
+
+async def fetch_market_trades(client: AsyncRESTClient, product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int,
+                              slice_seconds: int = MARKET_TRADES_SLICE_SECONDS, max_concurrency: int = MARKET_TRADES_MAX_WORKERS,
+                              cache: Optional[ResponseCache] = RESPONSE_CACHE) -> AsyncIterator[dict]:
+    """Yields every trade between start_time and end_time oldest slice first, see coinbase_services.fetch_market_trades"""
+    slices = get_market_trade_slices(start_time, end_time, slice_seconds)
+    pending: deque[asyncio.Task] = deque()
+    next_slice = 0
+    previous_trade_ids: set[str] = set()
+    try:
+        while pending or next_slice < len(slices):
+            while next_slice < len(slices) and len(pending) < max_concurrency:
+                slice_start, slice_end = slices[next_slice]
+                pending.append(asyncio.create_task(fetch_market_trade_slice(client, product_id, slice_start, slice_end, limit, cache)))
+                next_slice += 1
+
+            market_trades = await pending.popleft()
+            for market_trade in market_trades:
+                if market_trade['trade_id'] not in previous_trade_ids:
+                    yield market_trade
+            previous_trade_ids = { market_trade['trade_id'] for market_trade in market_trades }
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def upload_asset_candles(db: Database, client: AsyncRESTClient, product_ids: list[str], granularity: str,
+                               start: datetime.datetime, end: datetime.datetime, max_concurrency: int = CANDLES_MAX_WORKERS) -> int:
+    """Fetches the candles of many products concurrently and upserts each product's candles as soon as they arrive.
+
+    Database writes run in worker threads, each with its own pooled connection, so the event loop keeps fetching.
+    Each product's range is added to candle_coverage in the same transaction, like CandleSyncService.sync, so
+    later syncs do not fetch it again.
+
+    return_value: number of candles written
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def upload(product_id: str) -> int:
+        async with semaphore:
+            candles = await get_asset_candles(client, product_id, granularity, start, end)
+        range_start, range_end = CandleSyncService.get_sync_range(granularity, start, end)
+        return await asyncio.to_thread(CandleSyncService.store_candles, db, product_id, granularity, candles, range_start, range_end)
+
+    return sum(await asyncio.gather(*[upload(product_id) for product_id in product_ids]))
@@ -0,0 +1,146 @@
+import datetime
+from typing import Optional
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from dateutil import tz as dateutil_tz # type: ignore
+
+from services.coinbase_services import Granularity
+from database import Database, OnConflict
+from models.candles import Candle
+
+class CandleResampler:
+    """Builds FIVE_MINUTES ... ONE_DAY candles from stored ONE_MINUTE candles without calling Coinbase.
+
+    Minute candles are bucketed by start - start % granularity_seconds (buckets are aligned to UTC like
+    Coinbase's own candles) and aggregated with one group-by: first open, max high, min low, last close
+    and summed volume. A bucket is complete when its whole span lies inside the ONE_MINUTE candle_coverage
+    recorded by CandleSyncService, only complete buckets are materialized into candle_rollups.
+    """
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db if db else Database('mywow.db')
+
+    @staticmethod
+    def resample_frame(df_minutes: pd.DataFrame, granularity: str) -> pd.DataFrame:
+        """
+        :df_minutes: ONE_MINUTE candles with at least the start, open, high, low, close and volume columns
+        return_value: one row per bucket with the start, open, high, low, close and volume columns, sorted by start
+        """
+        granularity_seconds = Granularity.to_seconds(granularity)
+        df_minutes = df_minutes.sort_values(by='start')
+        buckets = df_minutes['start'] - df_minutes['start'] % granularity_seconds
+        df_resampled = df_minutes.groupby(buckets.rename('bucket'), sort=True).agg(
+            open=('open', 'first'),
+            high=('high', 'max'),
+            low=('low', 'min'),
+            close=('close', 'last'),
+            volume=('volume', 'sum'),
+        )
+        return df_resampled.rename_axis('start').reset_index()
+
+    def get_minute_coverage(self, trading_pair: str) -> list[tuple[int, int]]:
+        rows = self.db.iter_rows(
+            table_name='candle_coverage',
+            headers=['range_start', 'range_end'],
+            where_statement=self.db.build_where(eq={'trading_pair': trading_pair, 'granularity': Granularity.ONE_MINUTE}),
+            order_by_statement='ORDER BY range_start',
+            formatted=False
+        )
+        return [(range_start, range_end) for range_start, range_end in rows]
+
+    def get_bucket_starts(self, granularity: str, start: datetime.datetime, end: datetime.datetime) -> np.ndarray:
+        """Returns the start epochs of the buckets starting between start and end, inclusive"""
+        granularity_seconds = Granularity.to_seconds(granularity)
+        first_bucket = -(-int(start.timestamp()) // granularity_seconds) * granularity_seconds
+        return np.arange(first_bucket, int(end.timestamp()) + 1, granularity_seconds, dtype=np.int64)
+
+    def get_complete_buckets(self, trading_pair: str, granularity: str, bucket_starts: np.ndarray) -> np.ndarray:
+        """Returns a mask of the buckets whose span is inside the stored ONE_MINUTE coverage"""
+        coverage = self.get_minute_coverage(trading_pair)
+        if not coverage:
+            return np.zeros(len(bucket_starts), dtype=bool)
+        coverage_starts = np.array([range_start for range_start, _ in coverage], dtype=np.int64)
+        coverage_ends = np.array([range_end for _, range_end in coverage], dtype=np.int64)
+        index = np.searchsorted(coverage_starts, bucket_starts, side='right') - 1
+        bucket_ends = bucket_starts + Granularity.to_seconds(granularity)
+        return (index >= 0) & (coverage_ends[np.maximum(index, 0)] >= bucket_ends)
+
+    def covers(self, trading_pair: str, granularity: str, start: datetime.datetime, end: datetime.datetime) -> bool:
+        """True when every bucket between start and end can be resampled from stored ONE_MINUTE candles"""
+        bucket_starts = self.get_bucket_starts(granularity, start, end)
+        return len(bucket_starts) > 0 and bool(self.get_complete_buckets(trading_pair, granularity, bucket_starts).all())
+
+    def to_candles_frame(self, df_resampled: pd.DataFrame, trading_pair: str, granularity: str, tz: Optional[datetime.tzinfo] = None) -> pd.DataFrame:
+        """Lays resampled buckets out like Database.fetch_frame('candles'), the time column is converted to tz (default: local time)"""
+        tz = tz if tz else dateutil_tz.tzlocal()
+        df_candles = pd.DataFrame({
+            'candle_id': [Candle.build_candle_id(trading_pair, granularity, start) for start in df_resampled['start']],
+            'time': pd.to_datetime(df_resampled['start'], unit='s', utc=True).dt.tz_convert(tz),
+            'start': df_resampled['start'].astype(np.int64),
+            'trading_pair': trading_pair,
+            'open': df_resampled['open'],
+            'high': df_resampled['high'],
+            'low': df_resampled['low'],
+            'close': df_resampled['close'],
+            'volume': df_resampled['volume'],
+            'granularity': granularity,
+        })
+        return df_candles.reset_index(drop=True)
+
+    def resample(self, trading_pair: str, granularity: str, start: datetime.datetime, end: datetime.datetime, materialize: bool = False,
+                 tz: Optional[datetime.tzinfo] = None) -> pd.DataFrame:
+        """Resamples the stored ONE_MINUTE candles into the buckets starting between start and end.
+
+        :materialize: upsert the complete buckets into candle_rollups
+        return_value: DataFrame with the candles table's columns
+        """
+        if (not Granularity.verify(granularity)) or granularity == Granularity.ONE_MINUTE:
+            raise ValueError("Granularity must be one of the following: FIVE_MINUTES, FIFTEEN_MINUTES, THIRTY_MINUTES, ONE_HOUR, TWO_HOUR, SIX_HOUR, ONE_DAY")
+
+        granularity_seconds = Granularity.to_seconds(granularity)
+        first_bucket = -(-int(start.timestamp()) // granularity_seconds) * granularity_seconds
+        last_bucket = int(end.timestamp()) - int(end.timestamp()) % granularity_seconds
+        df_minutes = self.db.fetch_frame(
+            table_name='candles',
+            headers=['start', 'open', 'high', 'low', 'close', 'volume'],
+            where_statement=self.db.build_where(
+                eq={'trading_pair': trading_pair, 'granularity': Granularity.ONE_MINUTE},
+                btwn={'start': {'min': first_bucket, 'max': last_bucket + granularity_seconds - 1}}
+            )
+        )
+        df_candles = self.to_candles_frame(self.resample_frame(df_minutes, granularity), trading_pair, granularity, tz)
+
+        if materialize and len(df_candles):
+            complete = self.get_complete_buckets(trading_pair, granularity, df_candles['start'].to_numpy())
+            self.materialize(df_candles[complete])
+        return df_candles
+
+    def materialize(self, df_candles: pd.DataFrame) -> int:
+        """Upserts resampled candles into candle_rollups, return_value: number of rows written"""
+        times = [datetime.datetime.fromtimestamp(start).astimezone().isoformat() for start in df_candles['start']]
+        rows = [
+            [candle_id, time, int(start), trading_pair, float(open_price), float(high_price), float(low_price), float(close_price), float(volume), granularity]
+            for time, (candle_id, start, trading_pair, open_price, high_price, low_price, close_price, volume, granularity) in zip(
+                times, df_candles[['candle_id', 'start', 'trading_pair', 'open', 'high', 'low', 'close', 'volume', 'granularity']].itertuples(index=False, name=None)
+            )
+        ]
+        return self.db.insert_many(table_name='candle_rollups', rows=rows, on_conflict=OnConflict.REPLACE)
+
+    def get_candles_frame(self, trading_pair: str, granularity: str, start: datetime.datetime, end: datetime.datetime,
+                          tz: Optional[datetime.tzinfo] = None) -> pd.DataFrame:
+        """Returns the buckets starting between start and end, read from candle_rollups when every complete bucket is
+        already materialized there, otherwise resampled from the ONE_MINUTE candles and materialized.
+        """
+        df_rollups = self.db.fetch_frame(
+            table_name='candle_rollups',
+            where_statement=self.db.build_where(
+                eq={'trading_pair': trading_pair, 'granularity': granularity},
+                btwn={'start': {'min': int(start.timestamp()), 'max': int(end.timestamp())}}
+            ),
+            order_by_statement='ORDER BY start',
+            tz=tz
+        )
+        bucket_starts = self.get_bucket_starts(granularity, start, end)
+        complete_starts = bucket_starts[self.get_complete_buckets(trading_pair, granularity, bucket_starts)]
+        if np.isin(complete_starts, df_rollups['start'].to_numpy()).all():
+            return df_rollups
+        return self.resample(trading_pair, granularity, start, end, materialize=True, tz=tz)
@@ -0,0 +1,164 @@
+import datetime
+from typing import Optional
+from coinbase.rest import RESTClient # type: ignore
+
+import services.coinbase_services as cb
+from services.coinbase_services import Granularity
+from database import Database, OnConflict, QueryBuilder
+from models.candles import Candle
+
+class CandleSyncService:
+    """Fetches only the candles missing from the candles table.
+
+    Synced ranges are recorded in candle_coverage as half open [range_start, range_end) epoch intervals per
+    trading pair and granularity, merged so each pair keeps a handful of rows. A sync subtracts the coverage
+    from the requested range and requests the remaining gaps only, so ranges that were synced before cost
+    no API calls. Coverage only extends to the start of the current, still open, candle so that candle is
+    fetched again on the next sync. Pairs without coverage rows (ex. candles imported from local storage)
+    have their coverage derived once from the stored candle starts. Each gap is fetched before any write, its
+    candles and coverage are then stored in one short transaction so other writers never wait on the API.
+    """
+    def __init__(self, client: Optional[RESTClient] = None, db: Optional[Database] = None):
+        self.client = client if client else cb.get_client()
+        self.db = db if db else Database('mywow.db')
+
+    @staticmethod
+    def get_closed_end(granularity: str, now: Optional[datetime.datetime] = None) -> int:
+        """Returns the start epoch of the open candle, every candle starting before it is final"""
+        granularity_seconds = Granularity.to_seconds(granularity)
+        now_epoch = int((now if now else datetime.datetime.now().astimezone()).timestamp())
+        return now_epoch - now_epoch % granularity_seconds
+
+    @staticmethod
+    def merge_intervals(intervals: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        merged: list[tuple[int, int]] = []
+        for range_start, range_end in sorted(intervals):
+            if merged and range_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+            else:
+                merged.append((range_start, range_end))
+        return merged
+
+    @staticmethod
+    def get_missing_intervals(coverage: list[tuple[int, int]], range_start: int, range_end: int) -> list[tuple[int, int]]:
+        """
+        :coverage: merged [ (range_start, range_end), ... ] sorted by range_start
+        return_value: [ (gap_start, gap_end), ... ] of [range_start, range_end) not in coverage
+        """
+        gaps = []
+        cursor = range_start
+        for covered_start, covered_end in coverage:
+            if covered_end <= cursor:
+                continue
+            if covered_start >= range_end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < range_end:
+            gaps.append((cursor, range_end))
+        return gaps
+
+    def derive_coverage(self, trading_pair: str, granularity: str) -> list[tuple[int, int]]:
+        """Groups the stored candle starts into runs of consecutive candles, each run is a covered interval"""
+        granularity_seconds = Granularity.to_seconds(granularity)
+        closed_end = self.get_closed_end(granularity)
+        rows = self.db.cur.execute(
+            "SELECT MIN(start), MAX(start) FROM ("
+            "SELECT start, start - ROW_NUMBER() OVER (ORDER BY start) * ? AS run FROM candles WHERE trading_pair=? AND granularity=?"
+            ") GROUP BY run ORDER BY 1",
+            [granularity_seconds, trading_pair, granularity]
+        ).fetchall()
+        coverage = [(run_start, min(run_end + granularity_seconds, closed_end)) for run_start, run_end in rows]
+        return [(range_start, range_end) for range_start, range_end in coverage if range_start < range_end]
+
+    def get_coverage(self, trading_pair: str, granularity: str) -> list[tuple[int, int]]:
+        rows = self.db.iter_rows(
+            table_name='candle_coverage',
+            headers=['range_start', 'range_end'],
+            where_statement=self.db.build_where(eq={'trading_pair': trading_pair, 'granularity': granularity}),
+            order_by_statement='ORDER BY range_start',
+            formatted=False
+        )
+        coverage = [(range_start, range_end) for range_start, range_end in rows]
+        if coverage:
+            return coverage
+
+        coverage = self.derive_coverage(trading_pair, granularity)
+        if coverage:
+            self.set_coverage(trading_pair, granularity, coverage)
+        return coverage
+
+    def set_coverage(self, trading_pair: str, granularity: str, coverage: list[tuple[int, int]], commit: bool = True):
+        """Replaces the stored coverage of a trading pair and granularity"""
+        self.write_coverage(self.db, trading_pair, granularity, coverage)
+        if commit:
+            self.db.conn.commit()
+
+    @staticmethod
+    def write_coverage(db: Database, trading_pair: str, granularity: str, coverage: list[tuple[int, int]]):
+        statement = QueryBuilder.delete('candle_coverage', {'trading_pair': trading_pair, 'granularity': granularity})
+        db.cur.execute(statement.sql, statement.params)
+        db.insert_many(
+            table_name='candle_coverage',
+            rows=[[f"{trading_pair}-{granularity}-{range_start}", trading_pair, granularity, range_start, range_end] for range_start, range_end in coverage],
+            commit=False
+        )
+
+    @staticmethod
+    def get_sync_range(granularity: str, start: datetime.datetime, end: datetime.datetime) -> tuple[int, int]:
+        """
+        return_value: ( range_start, range_end ) epochs of the candles between start and end, up to the open candle included
+        """
+        granularity_seconds = Granularity.to_seconds(granularity)
+        closed_end = CandleSyncService.get_closed_end(granularity)
+        range_start = int(start.timestamp()) - int(start.timestamp()) % granularity_seconds
+        range_end = min(int(end.timestamp()) - int(end.timestamp()) % granularity_seconds, closed_end) + granularity_seconds
+        return range_start, range_end
+
+    @staticmethod
+    def store_candles(db: Database, trading_pair: str, granularity: str, candles: list[dict], range_start: int, range_end: int) -> int:
+        """Writes the candles fetched for [range_start, range_end) and adds the range to the coverage in one transaction.
+
+        The coverage is read back inside the transaction, after the candles took the write lock, so concurrent
+        writers of the same trading pair and granularity merge their ranges instead of overwriting each other's.
+
+        return_value: number of candles written
+        """
+        covered_end = min(range_end, CandleSyncService.get_closed_end(granularity))
+        try:
+            row_count = db.insert_many(
+                table_name='candles', rows=[Candle(candle_data).get_values() for candle_data in candles], on_conflict=OnConflict.REPLACE, commit=False
+            )
+            if range_start < covered_end:
+                rows = db.cur.execute(
+                    "SELECT range_start, range_end FROM candle_coverage WHERE trading_pair=? AND granularity=?", [trading_pair, granularity]
+                ).fetchall()
+                coverage = CandleSyncService.merge_intervals([(row_start, row_end) for row_start, row_end in rows] + [(range_start, covered_end)])
+                CandleSyncService.write_coverage(db, trading_pair, granularity, coverage)
+            db.conn.commit()
+        except Exception:
+            db.conn.rollback()
+            raise
+        return row_count
+
+    def sync(self, trading_pair: str, granularity: str, start: datetime.datetime, end: datetime.datetime) -> int:
+        """Stores every candle between start and end that is not stored yet.
+
+        return_value: number of candles written
+        """
+        if (not Granularity.verify(granularity)):
+            raise ValueError("Granularity must be one of the following: ONE_MINUTE, FIVE_MINUTES, FIFTEEN_MINUTES, THIRTY_MINUTES, ONE_HOUR, TWO_HOUR, SIX_HOUR, ONE_DAY")
+
+        range_start, range_end = self.get_sync_range(granularity, start, end)
+        coverage = self.get_coverage(trading_pair, granularity)
+        row_count = 0
+        for gap_start, gap_end in self.get_missing_intervals(coverage, range_start, range_end):
+            # no transaction is open while the API is called
+            candles = cb.get_asset_candles(
+                self.client, trading_pair, granularity,
+                datetime.datetime.fromtimestamp(gap_start).astimezone(),
+                datetime.datetime.fromtimestamp(gap_end - 1).astimezone()
+            )
+            row_count += self.store_candles(self.db, trading_pair, granularity, candles, gap_start, gap_end)
+        return row_count
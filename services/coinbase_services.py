@@ -1,13 +1,46 @@
 from coinbase.rest import RESTClient # type: ignore
 from coinbase.wallet.client import Client # type: ignore
-from typing import Optional
+from typing import Any, Callable, Iterator, Optional
 from dotenv import dotenv_values
+from requests.adapters import HTTPAdapter # type: ignore
+from requests.exceptions import HTTPError, ConnectionError as RequestsConnectionError, Timeout # type: ignore
+import requests # type: ignore
 from math import ceil
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from collections import deque
 import datetime
+import os
+import random
+import threading
+import time
+
+from services.rate_limiter import RateLimiter
+from services.response_cache import ResponseCache
+import utils
 
 CANDLES_LIMIT_MAX = 350
+CANDLES_MAX_WORKERS = 8
+MARKET_TRADES_SLICE_SECONDS = 15 * 60
+MARKET_TRADES_MAX_WORKERS = 8
+
+# Advanced Trade allows 30 requests/sec per key on private endpoints and 10 requests/sec per IP on public ones
+REST_RATE_LIMIT = 30
+REST_ENDPOINT_RATE_LIMITS = {
+    'get_public_candles': 10,
+    'get_public_market_trades': 10,
+    'get_public_product': 10,
+    'get_public_products': 10,
+    'get_public_product_book': 10,
+}
+REST_RATE_LIMITER = RateLimiter(rate=REST_RATE_LIMIT, endpoint_rates=REST_ENDPOINT_RATE_LIMITS)
 LOCAL_TZ = datetime.datetime.now().astimezone().tzinfo
 
+# Windows of historical candles and trades never change once closed, they are served from disk on repeated analyses
+RESPONSE_CACHE_DIR = utils.get_path_from_data_dir('response_cache')
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_DIR)
+# Trades are only cached for slices ending at least this many seconds ago, late trades may still be published before that
+MARKET_TRADES_SETTLE_SECONDS = 60
+
 class Granularity:
     ONE_MINUTE = 'ONE_MINUTE'
     FIVE_MINUTES = 'FIVE_MINUTES'
@@ -46,23 +79,162 @@ class Granularity:
 
         return ceil(time_delta_seconds / Granularity.to_seconds(granularity=granularity))
 
-def get_client(dotenv_path: str = ".env") -> RESTClient:
-    # Load environment variables
-    config = dotenv_values(dotenv_path)
-    coinbaseAPIKey = config["COINBASE_API_KEY"]
-    coinbaseAPISecret = config["COINBASE_API_SECRET"]
+class RateLimitedClient:
+    """Proxies every RESTClient call through the shared REST rate limiter and retries throttled or failed requests.
 
-    client = RESTClient(api_key=coinbaseAPIKey, api_secret=coinbaseAPISecret)
-    return client
+    Every RateLimitedClient draws from the same REST_RATE_LIMITER, so concurrent fetchers together stay within
+    Coinbase's request rate. 429 and 5xx responses (and connection errors) are retried with full jitter exponential
+    backoff. A 429 drains the bucket instead of sleeping, so every caller backs off together through the limiter.
+    """
+    RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+    MAX_RETRIES = 5
+    BACKOFF_BASE = 0.5      # seconds
+    BACKOFF_MAX = 30        # seconds
 
-def get_wallet_client(dotenv_path: str = ".env") -> Client:
-    # Load environment variables
-    config = dotenv_values(dotenv_path)
-    coinbaseAPIKey = config["COINBASE_API_KEY"]
-    coinbaseAPISecret = config["COINBASE_API_SECRET"]
+    def __init__(self, client: RESTClient, rate_limiter: Optional[RateLimiter] = None, max_retries: int = MAX_RETRIES):
+        self.client = client
+        self.rate_limiter = rate_limiter if rate_limiter else REST_RATE_LIMITER
+        self.max_retries = max_retries
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def rate_limited_call(*args, **kwargs):
+            return self.call(name, attr, *args, **kwargs)
+        return rate_limited_call
+
+    @staticmethod
+    def get_retry_backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number attempt, the server's Retry-After when given, otherwise full jitter exponential backoff"""
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(RateLimitedClient.BACKOFF_MAX, RateLimitedClient.BACKOFF_BASE * 2 ** attempt))
+
+    def get_backoff(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, 'response', None)
+        return self.get_retry_backoff(attempt, response.headers.get('Retry-After') if response is not None else None)
+
+    def call(self, endpoint: str, method: Callable, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(endpoint)
+            try:
+                return method(*args, **kwargs)
+            except HTTPError as e:
+                status_code = e.response.status_code if e.response is not None else None
+                if status_code not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    self.rate_limiter.record(endpoint, errors=1)
+                    raise
+                backoff = self.get_backoff(attempt, e)
+                if status_code == 429:
+                    # every caller, this one included, waits the backoff out in its next acquire
+                    self.rate_limiter.back_off(endpoint, backoff)
+                    backoff = 0.0
+            except (RequestsConnectionError, Timeout) as e:
+                if attempt >= self.max_retries:
+                    self.rate_limiter.record(endpoint, errors=1)
+                    raise
+                backoff = self.get_backoff(attempt, e)
+
+            self.rate_limiter.record(endpoint, retries=1, wait_time=backoff)
+            time.sleep(backoff)
+            attempt += 1
+
+def get_response_cache_metrics() -> dict[str, int]:
+    return RESPONSE_CACHE.get_metrics()
+
+def get_rate_limit_metrics() -> dict[str, dict[str, float]]:
+    return REST_RATE_LIMITER.get_metrics()
+
+class ClientRegistry:
+    """Process wide registry constructing each client once, on first use, and sharing it between threads.
+
+    Credentials are read from a dotenv file once per path. Clients keep their requests.Session for the life of the
+    process, so TLS connections are reused across calls instead of being renegotiated by every new client, and their
+    connection pools are sized for the concurrent window fetchers.
+    """
+    HTTP_POOL_SIZE = 32     # keep-alive connections per host, above CANDLES_MAX_WORKERS and MARKET_TRADES_MAX_WORKERS
 
-    client = Client(api_key=coinbaseAPIKey, api_secret=coinbaseAPISecret)
-    return client
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.credentials: dict[str, dict[str, Optional[str]]] = {}
+        self.clients: dict[tuple, Any] = {}
+
+    def get_credentials(self, dotenv_path: str = ".env") -> dict[str, Optional[str]]:
+        with self.lock:
+            if dotenv_path not in self.credentials:
+                self.credentials[dotenv_path] = dotenv_values(dotenv_path)
+            return self.credentials[dotenv_path]
+
+    def get_fake_url(self, dotenv_path: str = ".env") -> Optional[str]:
+        # Points every REST call at a local FakeCoinbaseServer (host:port) for benchmarks and offline runs
+        return os.environ.get("COINBASE_FAKE_REST_URL", self.get_credentials(dotenv_path).get("COINBASE_FAKE_REST_URL"))
+
+    def get(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        """Returns the client of key, constructing it with factory under the lock, so factory must not take the lock itself"""
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = factory()
+            return self.clients[key]
+
+    @staticmethod
+    def mount_session_pool(session: requests.Session, pool_size: int = HTTP_POOL_SIZE):
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+    def create_client(self, config: dict[str, Optional[str]], fake_url: Optional[str]) -> RateLimitedClient:
+        if fake_url:
+            from services.fake_coinbase import FakeRESTClient
+            client = FakeRESTClient(base_url=fake_url)
+        else:
+            client = RESTClient(api_key=config["COINBASE_API_KEY"], api_secret=config["COINBASE_API_SECRET"])
+        self.mount_session_pool(client.session)
+        return RateLimitedClient(client)
+
+    def create_wallet_client(self, config: dict[str, Optional[str]]) -> Client:
+        client = Client(api_key=config["COINBASE_API_KEY"], api_secret=config["COINBASE_API_SECRET"])
+        self.mount_session_pool(client.session)
+        return client
+
+    def get_client(self, dotenv_path: str = ".env") -> RateLimitedClient:
+        # credentials are read before get takes the lock, which is not reentrant
+        config = self.get_credentials(dotenv_path)
+        fake_url = self.get_fake_url(dotenv_path)
+        return self.get(('rest', dotenv_path, fake_url), lambda: self.create_client(config, fake_url))
+
+    def get_wallet_client(self, dotenv_path: str = ".env") -> Client:
+        config = self.get_credentials(dotenv_path)
+        return self.get(('wallet', dotenv_path), lambda: self.create_wallet_client(config))
+
+    def reset(self):
+        """Closes every client's session and forgets clients and credentials, ex. after the .env file changed"""
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+            self.credentials.clear()
+        for client in clients:
+            session = getattr(getattr(client, 'client', client), 'session', None)
+            if session is not None:
+                session.close()
+
+CLIENT_REGISTRY = ClientRegistry()
+
+def get_client(dotenv_path: str = ".env") -> RateLimitedClient:
+    """Returns the shared REST client of dotenv_path's credentials, constructed on first use"""
+    return CLIENT_REGISTRY.get_client(dotenv_path)
+
+def get_wallet_client(dotenv_path: str = ".env") -> Client:
+    """Returns the shared wallet client of dotenv_path's credentials, constructed on first use"""
+    return CLIENT_REGISTRY.get_wallet_client(dotenv_path)
 
 def get_default_portfolio(client: RESTClient):
     portfolios_response = client.get_portfolios()
@@ -78,53 +250,178 @@ def get_default_portfolio(client: RESTClient):
             default_portfolio = portfolio_bd
     return default_portfolio
  
-def get_asset_candles(client: RESTClient, product_id: str, granularity: str, start: datetime.datetime, end: datetime.datetime, limit: int = CANDLES_LIMIT_MAX):
-    if (not Granularity.verify(granularity)):
-        raise ValueError("Granularity must be one of the following: ONE_MINUTE, FIVE_MINUTES, FIFTEEN_MINUTES, THIRTY_MINUTES, ONE_HOUR, TWO_HOUR, SIX_HOUR, ONE_DAY")
-    candles: list = []
+def get_candle_windows(start: datetime.datetime, end: datetime.datetime, granularity: str, limit: int = CANDLES_LIMIT_MAX) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """Partitions [start, end] into consecutive windows holding at most limit candles each (capped at CANDLES_LIMIT_MAX)"""
+    window = datetime.timedelta(seconds=Granularity.to_seconds(granularity) * min(limit, CANDLES_LIMIT_MAX))
     base_end_time = end + datetime.timedelta(seconds=1)
+
+    windows = []
+    window_start = start
     while True:
-        if Granularity.get_count_from_granularity(start, end, granularity) > CANDLES_LIMIT_MAX:
-            end = min(start + datetime.timedelta(seconds=Granularity.to_seconds(granularity) * CANDLES_LIMIT_MAX), base_end_time)
+        window_end = min(window_start + window, base_end_time)
+        windows.append((window_start, window_end))
+        if window_end >= base_end_time:
+            break
+        window_start = window_end
+    return windows
 
-        start_unix = str(int(start.timestamp()))
-        end_unix = str(int(end.timestamp()))
+def get_candle_window_cache_key(product_id: str, granularity: str, start: datetime.datetime, end: datetime.datetime) -> Optional[str]:
+    """Returns the response cache key of a candle window, None while the window's newest candle is still open"""
+    # the newest candle of a window starts at end, it is final once its granularity has elapsed
+    if int(end.timestamp()) + Granularity.to_seconds(granularity) > int(time.time()):
+        return None
+    return ResponseCache.get_key('get_candles', product_id=product_id, granularity=granularity, start=str(int(start.timestamp())), end=str(int(end.timestamp())))
 
-        res = client.get_candles(product_id=product_id, start=start_unix, end=end_unix, granularity=granularity, limit=None)
-        curr_candles = res.to_dict()['candles']
-        for candle in curr_candles:
-            candle['trading_pair'] = product_id
-            candle['granularity'] = granularity
-        candles = curr_candles + candles 
+def format_candles(candles: list[dict], product_id: str, granularity: str) -> list[dict]:
+    for candle in candles:
+        candle['trading_pair'] = product_id
+        candle['granularity'] = granularity
+    return candles
 
-        if Granularity.get_count_from_granularity(start, end, granularity) < limit:
-            break
-        else:
-            start = end
-            end = base_end_time
+def merge_candle_pages(pages: list[list[dict]]) -> list[dict]:
+    """Merges the pages of consecutive windows (oldest first) into one list of candles, newest first"""
+    # Windows share their boundaries, so a boundary candle can be returned by both neighbouring windows
+    candles: list = []
+    seen_starts: set[str] = set()
+    for page in reversed(pages):
+        for candle in page:
+            if candle['start'] in seen_starts:
+                continue
+            seen_starts.add(candle['start'])
+            candles.append(candle)
+    return candles
+
+def fetch_candle_window(client: RESTClient, product_id: str, granularity: str, start: datetime.datetime, end: datetime.datetime,
+                        cache: Optional[ResponseCache] = RESPONSE_CACHE) -> list[dict]:
+    """Fetches the candles of one window, windows whose candles are all closed are read from and written to cache"""
+    key = get_candle_window_cache_key(product_id, granularity, start, end) if cache is not None else None
+    if key:
+        candles = cache.get(key)
+        if candles is not None:
+            return candles
+
+    res = client.get_candles(product_id=product_id, start=str(int(start.timestamp())), end=str(int(end.timestamp())), granularity=granularity, limit=None)
+    candles = format_candles(res.to_dict()['candles'], product_id, granularity)
+
+    if key:
+        cache.put(key, candles)
+    return candles
+
+def get_asset_candles(client: RESTClient, product_id: str, granularity: str, start: datetime.datetime, end: datetime.datetime, limit: int = CANDLES_LIMIT_MAX,
+                      max_workers: int = CANDLES_MAX_WORKERS, cache: Optional[ResponseCache] = RESPONSE_CACHE):
+    """Fetches every candle between start and end, newest first.
+
+    The range is split into windows up front and the windows are requested concurrently by a bounded thread pool.
+    Each window's page is stored at its window's slot so the pages can be merged in order once all have returned.
+    """
+    if (not Granularity.verify(granularity)):
+        raise ValueError("Granularity must be one of the following: ONE_MINUTE, FIVE_MINUTES, FIFTEEN_MINUTES, THIRTY_MINUTES, ONE_HOUR, TWO_HOUR, SIX_HOUR, ONE_DAY")
+
+    windows = get_candle_windows(start, end, granularity, limit)
+    pages: list[list[dict]] = [[] for _ in windows]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+        futures = {
+            executor.submit(fetch_candle_window, client, product_id, granularity, window_start, window_end, cache): i
+            for i, (window_start, window_end) in enumerate(windows)
+        }
+        for future in as_completed(futures):
+            pages[futures[future]] = future.result()
+    candles = merge_candle_pages(pages)
 
     # utils.write_data_to_file(utils.get_path_from_cwd(f"{product_id}_candles_{timestamp}.json"), candles)
     return candles
 
-def fetch_market_trades(client: RESTClient, product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int):
+def get_market_trade_slices(start_time: datetime.datetime, end_time: datetime.datetime,
+                            slice_seconds: int = MARKET_TRADES_SLICE_SECONDS) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """Partitions [start_time, end_time] into consecutive slices of at most slice_seconds, oldest first"""
+    slice_length = datetime.timedelta(seconds=slice_seconds)
+    slices = []
+    slice_start = start_time
+    while slice_start < end_time:
+        slice_end = min(slice_start + slice_length, end_time)
+        slices.append((slice_start, slice_end))
+        slice_start = slice_end
+    return slices
+
+def get_market_trade_slice_cache_key(product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int) -> Optional[str]:
+    """Returns the response cache key of a trade slice, None until the slice ended MARKET_TRADES_SETTLE_SECONDS ago"""
+    if int(end_time.timestamp()) + MARKET_TRADES_SETTLE_SECONDS > int(time.time()):
+        return None
+    return ResponseCache.get_key('get_market_trades', product_id=product_id, start=int(start_time.timestamp()), end=int(end_time.timestamp()), limit=limit)
+
+def add_market_trades_page(page: list[dict], market_trades: list[dict], seen_trade_ids: set[str]):
+    """Appends the trades of a page not seen yet to market_trades, with their times converted to local time"""
+    for market_trade in page:
+        if market_trade['trade_id'] in seen_trade_ids:
+            continue
+        seen_trade_ids.add(market_trade['trade_id'])
+        market_trade['time'] = datetime.datetime.fromisoformat(market_trade['time']).astimezone(LOCAL_TZ).isoformat()
+        market_trades.append(market_trade)
+
+def get_next_market_trades_end(page: list[dict], end_time: datetime.datetime) -> datetime.datetime:
+    """Returns the end of the next (older) page after a full page, the time of the page's oldest trade"""
+    next_end_time = datetime.datetime.fromisoformat(min(page, key=lambda x: x['time'])['time']).astimezone(LOCAL_TZ)
+    # The cursor has whole second resolution, a full page within one second would otherwise be requested forever
+    if int(next_end_time.timestamp()) >= int(end_time.timestamp()):
+        next_end_time = end_time - datetime.timedelta(seconds=1)
+    return next_end_time
+
+def fetch_market_trade_slice(client: RESTClient, product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int,
+                             cache: Optional[ResponseCache] = RESPONSE_CACHE) -> list[dict]:
+    """Fetches every trade between start_time and end_time, paginating backwards from end_time, without duplicate trade_ids.
+
+    Slices that ended more than MARKET_TRADES_SETTLE_SECONDS ago are read from and written to cache.
+    """
+    key = get_market_trade_slice_cache_key(product_id, start_time, end_time, limit) if cache is not None else None
+    if key:
+        cached_market_trades = cache.get(key)
+        if cached_market_trades is not None:
+            return cached_market_trades
+
     market_trades: list = []
+    seen_trade_ids: set[str] = set()
     while start_time < end_time:
-        start_unix = str(int(start_time.timestamp()))
-        end_unix = str(int(end_time.timestamp()))
+        res = client.get_market_trades(product_id=product_id, limit=limit, start=str(int(start_time.timestamp())), end=str(int(end_time.timestamp())))
+        page = res.to_dict()['trades']
+        add_market_trades_page(page, market_trades, seen_trade_ids)
 
-        res = client.get_market_trades(product_id=product_id, limit=limit, start=start_unix, end=end_unix)
-        curr_market_trades = res.to_dict()['trades']
-        for market_trade in curr_market_trades:
-            market_trade['time'] = datetime.datetime.fromisoformat(market_trade['time']).astimezone(LOCAL_TZ).isoformat()
-        market_trades = curr_market_trades + market_trades
-
-        if len(res['trades']) < limit:
+        if len(page) < limit:
             break
+        end_time = get_next_market_trades_end(page, end_time)
 
-        end_time = datetime.datetime.fromisoformat(min(curr_market_trades, key=lambda x: x['time'])['time']).astimezone(LOCAL_TZ)
-        
+    if key:
+        cache.put(key, market_trades)
     return market_trades
 
+def fetch_market_trades(client: RESTClient, product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int,
+                        slice_seconds: int = MARKET_TRADES_SLICE_SECONDS, max_workers: int = MARKET_TRADES_MAX_WORKERS,
+                        cache: Optional[ResponseCache] = RESPONSE_CACHE) -> Iterator[dict]:
+    """Yields every trade between start_time and end_time, one slice at a time from the oldest slice to the newest.
+
+    The interval is split into independent slices that are paginated concurrently by a bounded thread pool.
+    At most max_workers slices are in flight or buffered at once, so memory does not grow with the length of the interval.
+    Slices share their boundary second, trades returned by both neighbouring slices are only yielded once.
+    """
+    slices = get_market_trade_slices(start_time, end_time, slice_seconds)
+    if not slices:
+        return
+
+    previous_trade_ids: set[str] = set()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(slices)))) as executor:
+        pending: deque[Future] = deque()
+        next_slice = 0
+        while pending or next_slice < len(slices):
+            while next_slice < len(slices) and len(pending) < max_workers:
+                slice_start, slice_end = slices[next_slice]
+                pending.append(executor.submit(fetch_market_trade_slice, client, product_id, slice_start, slice_end, limit, cache))
+                next_slice += 1
+
+            market_trades = pending.popleft().result()
+            for market_trade in market_trades:
+                if market_trade['trade_id'] not in previous_trade_ids:
+                    yield market_trade
+            previous_trade_ids = { market_trade['trade_id'] for market_trade in market_trades }
+
 def fetch_market_trade_candles(client: RESTClient, product_id: str, start_time: datetime.datetime, end_time: datetime.datetime, limit: int = CANDLES_LIMIT_MAX):
     candles = get_asset_candles(client, product_id=product_id, granularity=Granularity.ONE_MINUTE, start=start_time, end=end_time, limit=limit)
     return candles
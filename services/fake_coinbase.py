@@ -0,0 +1,458 @@
+import base64
+import datetime
+import hashlib
+import json
+import math
+import random
+import select
+import socketserver
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from coinbase.rest import RESTClient # type: ignore
+from coinbase.rest.rest_base import handle_exception # type: ignore
+from coinbase.constants import API_PREFIX, USER_AGENT # type: ignore
+
+from services.coinbase_services import Granularity, CANDLES_LIMIT_MAX
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+class SyntheticMarket:
+    """Deterministic synthetic candles, trades and order book levels for any product and time range.
+
+    Every value is derived from (seed, product_id, second), so two servers with the same settings serve
+    identical responses and benchmark runs are repeatable. Prices follow a slow sine wave around base_price
+    with per second noise, each second holds a number of trades averaging trades_per_second.
+    """
+    PRODUCT_IDS = ['BTC-USD', 'ETH-USD', 'SOL-USD', 'DOGE-USD', 'ETH-BTC', 'SOL-EUR']
+
+    def __init__(self, seed: int = 0, trades_per_second: float = 5.0, base_price: float = 100.0, amplitude: float = 0.05,
+                 period_seconds: int = 86400, book_depth: int = 50, product_ids: Optional[list[str]] = None):
+        self.seed = seed
+        self.trades_per_second = trades_per_second
+        self.base_price = base_price
+        self.amplitude = amplitude
+        self.period_seconds = period_seconds
+        self.book_depth = book_depth
+        self.product_ids = product_ids if product_ids else self.PRODUCT_IDS
+
+    def get_random(self, product_id: str, second: int, salt: str = '') -> random.Random:
+        return random.Random(f"{self.seed}-{product_id}-{second}-{salt}")
+
+    def get_price(self, product_id: str, second: float) -> float:
+        wave = 1 + self.amplitude * math.sin(2 * math.pi * second / self.period_seconds)
+        noise = 1 + 0.001 * (self.get_random(product_id, int(second)).random() * 2 - 1)
+        return round(self.base_price * wave * noise, 4)
+
+    def get_product(self, product_id: str) -> dict:
+        base_currency_id, quote_currency_id = product_id.split('-')
+        return {
+            'product_id': product_id, 'price': str(self.get_price(product_id, time.time())), 'base_currency_id': base_currency_id,
+            'quote_currency_id': quote_currency_id, 'base_increment': '0.00000001', 'quote_increment': '0.01', 'base_min_size': '0.00000001',
+            'base_max_size': '1000000', 'quote_min_size': '1', 'quote_max_size': '10000000', 'status': 'online', 'trading_disabled': False,
+            'product_type': 'SPOT',
+        }
+
+    def get_candles(self, product_id: str, granularity: str, start: int, end: int) -> list[dict]:
+        """Candles starting between start and end, newest first like Coinbase"""
+        granularity_seconds = Granularity.to_seconds(granularity)
+        first_start = -(-start // granularity_seconds) * granularity_seconds
+        candles = []
+        for candle_start in range(first_start, end + 1, granularity_seconds):
+            open_price = self.get_price(product_id, candle_start)
+            close_price = self.get_price(product_id, candle_start + granularity_seconds - 1)
+            rand = self.get_random(product_id, candle_start, granularity)
+            candles.append({
+                'start': str(candle_start),
+                'low': str(round(min(open_price, close_price) * (1 - 0.002 * rand.random()), 4)),
+                'high': str(round(max(open_price, close_price) * (1 + 0.002 * rand.random()), 4)),
+                'open': str(open_price),
+                'close': str(close_price),
+                'volume': str(round(self.trades_per_second * granularity_seconds * rand.uniform(0.5, 1.5), 8)),
+            })
+        candles.reverse()
+        return candles
+
+    def get_trades_in_second(self, product_id: str, second: int) -> list[dict]:
+        rand = self.get_random(product_id, second, 'trades')
+        count = int(self.trades_per_second) + (1 if rand.random() < self.trades_per_second % 1 else 0)
+        trades = []
+        for i in range(count):
+            trade_time = second + i / max(count, 1)
+            price = self.get_price(product_id, trade_time)
+            trades.append({
+                'trade_id': str(second * 1000 + i),
+                'product_id': product_id,
+                'price': str(price),
+                'size': str(round(rand.uniform(0.001, 2), 8)),
+                'time': datetime.datetime.fromtimestamp(trade_time, tz=datetime.timezone.utc).isoformat().replace('+00:00', 'Z'),
+                'side': 'BUY' if rand.random() < 0.5 else 'SELL',
+                'bid': '',
+                'ask': '',
+                'exchange': 'FAKE',
+            })
+        return trades
+
+    def get_trades(self, product_id: str, start: int, end: int, limit: int) -> list[dict]:
+        """The newest limit trades between start and end inclusive, newest first like Coinbase"""
+        trades: list[dict] = []
+        for second in range(end, start - 1, -1):
+            trades.extend(reversed(self.get_trades_in_second(product_id, second)))
+            if len(trades) >= limit:
+                break
+        return trades[:limit]
+
+    def get_book_levels(self, product_id: str, second: int, count: int, salt: str = '') -> list[dict]:
+        """Random bid and offer levels around the price at second, new_quantity 0 removes a level"""
+        rand = self.get_random(product_id, second, f"book{salt}")
+        mid = self.get_price(product_id, second)
+        event_time = datetime.datetime.fromtimestamp(second, tz=datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+        levels = []
+        for _ in range(count):
+            side = 'bid' if rand.random() < 0.5 else 'offer'
+            distance = rand.randint(1, self.book_depth) * 0.01
+            price_level = round(mid - distance if side == 'bid' else mid + distance, 2)
+            new_quantity = 0 if rand.random() < 0.2 else round(rand.uniform(0.01, 10), 8)
+            levels.append({'side': side, 'event_time': event_time, 'price_level': str(price_level), 'new_quantity': str(new_quantity)})
+        return levels
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing pooled keep-alive connections are expected, anything else is still reported
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class FakeCoinbaseServer:
+    """Local stand-in for the Advanced Trade REST and WebSocket APIs, serving a SyntheticMarket.
+
+    REST: GET {API_PREFIX}/products, /products/{product_id}, /products/{product_id}/candles and /ticker (and their /market
+    public variants).
+    WebSocket: subscribe/unsubscribe to the level2, market_trades, candles and heartbeats channels, each
+    subscription streams ws_messages_per_second messages with a per connection sequence_num.
+
+    :latency: seconds added to every REST response
+    :rate_limit_every: answer every nth REST request with a 429, 0 disables
+    :max_page_size: cap on the trades returned per /ticker request, like Coinbase's own page size limit
+    :sequence_gap_every: skip a sequence_num every nth WebSocket message, 0 disables
+    :max_connection_seconds: close every WebSocket connection after this many seconds, 0 keeps them open
+    """
+    def __init__(self, market: Optional[SyntheticMarket] = None, host: str = '127.0.0.1', rest_port: int = 0, ws_port: int = 0,
+                 latency: float = 0.0, rate_limit_every: int = 0, max_page_size: int = 1000,
+                 ws_messages_per_second: float = 100.0, sequence_gap_every: int = 0, max_connection_seconds: float = 0.0):
+        self.market = market if market else SyntheticMarket()
+        self.host = host
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.max_page_size = max_page_size
+        self.ws_messages_per_second = ws_messages_per_second
+        self.sequence_gap_every = sequence_gap_every
+        self.max_connection_seconds = max_connection_seconds
+
+        self.lock = threading.Lock()
+        self.metrics = {'rest_requests': 0, 'rate_limited': 0, 'ws_connections': 0, 'ws_messages': 0}
+
+        self.rest_server = QuietHTTPServer((host, rest_port), self.create_rest_handler())
+        self.ws_server = socketserver.ThreadingTCPServer((host, ws_port), self.create_ws_handler())
+        self.ws_server.daemon_threads = True
+        self.threads: list[threading.Thread] = []
+
+    @property
+    def rest_url(self) -> str:
+        """host:port as expected by RESTClient's base_url"""
+        return f"{self.host}:{self.rest_server.server_address[1]}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.ws_server.server_address[1]}"
+
+    def start(self) -> 'FakeCoinbaseServer':
+        for server in [self.rest_server, self.ws_server]:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in [self.rest_server, self.ws_server]:
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self) -> 'FakeCoinbaseServer':
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def record(self, **values: int):
+        with self.lock:
+            for key, value in values.items():
+                self.metrics[key] += value
+
+    def get_metrics(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.metrics)
+
+    # REST
+    def handle_rest(self, path: str, query: dict[str, str]) -> tuple[int, dict]:
+        """
+        return_value: ( status_code, body )
+        """
+        with self.lock:
+            self.metrics['rest_requests'] += 1
+            request_number = self.metrics['rest_requests']
+            rate_limited = self.rate_limit_every > 0 and request_number % self.rate_limit_every == 0
+            if rate_limited:
+                self.metrics['rate_limited'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if rate_limited:
+            return 429, {'error': 'RATE_LIMIT_EXCEEDED', 'message': 'Too many requests'}
+
+        parts = path[len(API_PREFIX):].strip('/').split('/')
+        if parts and parts[0] == 'market':
+            parts = parts[1:]
+        if parts == ['products']:
+            products = [self.market.get_product(product_id) for product_id in self.market.product_ids]
+            return 200, {'products': products, 'num_products': len(products)}
+        if len(parts) == 2 and parts[0] == 'products':
+            if parts[1] not in self.market.product_ids:
+                return 404, {'error': 'NOT_FOUND', 'message': f"Unknown product {parts[1]}"}
+            return 200, self.market.get_product(parts[1])
+        if len(parts) != 3 or parts[0] != 'products':
+            return 404, {'error': 'NOT_FOUND', 'message': f"Unknown path {path}"}
+        product_id, resource = parts[1], parts[2]
+
+        try:
+            start = int(query.get('start', 0))
+            end = int(query.get('end', int(time.time())))
+        except ValueError:
+            return 400, {'error': 'INVALID_ARGUMENT', 'message': 'start and end must be unix seconds'}
+
+        if resource == 'candles':
+            granularity = query.get('granularity', '')
+            if not Granularity.verify(granularity):
+                return 400, {'error': 'INVALID_ARGUMENT', 'message': f"Unknown granularity {granularity}"}
+            limit = int(query.get('limit', CANDLES_LIMIT_MAX))
+            if (end - start) // Granularity.to_seconds(granularity) > limit:
+                return 400, {'error': 'INVALID_ARGUMENT', 'message': f"number of candles requested should be less than {limit}"}
+            return 200, {'candles': self.market.get_candles(product_id, granularity, start, min(end, int(time.time())))}
+
+        if resource == 'ticker':
+            limit = min(int(query.get('limit', self.max_page_size)), self.max_page_size)
+            trades = self.market.get_trades(product_id, start, min(end, int(time.time())), limit)
+            best_price = trades[0]['price'] if trades else ''
+            return 200, {'trades': trades, 'best_bid': best_price, 'best_ask': best_price}
+
+        return 404, {'error': 'NOT_FOUND', 'message': f"Unknown resource {resource}"}
+
+    def create_rest_handler(self) -> type:
+        fake_server = self
+
+        class RESTHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                # RESTClient sends a JSON body with every request, it has to be consumed to keep the connection usable
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                url = urlparse(self.path)
+                query = { key: values[-1] for key, values in parse_qs(url.query).items() }
+                status_code, body = fake_server.handle_rest(url.path, query)
+                data = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if status_code == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return RESTHandler
+
+    # WebSocket
+    def get_ws_message(self, channel: str, product_id: str, sequence_num: int, message_number: int, snapshot: bool) -> dict:
+        now = time.time()
+        second = int(now)
+        timestamp = datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+        message: dict = {'channel': channel, 'client_id': '', 'timestamp': timestamp, 'sequence_num': sequence_num}
+
+        if channel == 'level2':
+            message['channel'] = 'l2_data'
+            if snapshot:
+                levels = self.market.get_book_levels(product_id, second, self.market.book_depth * 2, 'snapshot')
+                levels = [level for level in levels if level['new_quantity'] != '0']
+            else:
+                levels = self.market.get_book_levels(product_id, second, 3, str(message_number))
+            message['events'] = [{'type': 'snapshot' if snapshot else 'update', 'product_id': product_id, 'updates': levels}]
+        elif channel == 'market_trades':
+            trades = self.market.get_trades_in_second(product_id, second)[:1] or self.market.get_trades(product_id, second - 60, second, 1)
+            for trade in trades:
+                trade['trade_id'] = f"{trade['trade_id']}-{message_number}"
+                trade['time'] = timestamp
+            message['events'] = [{'type': 'snapshot' if snapshot else 'update', 'trades': trades}]
+        elif channel == 'candles':
+            candles = self.market.get_candles(product_id, Granularity.FIVE_MINUTES, second - second % 300, second)
+            for candle in candles:
+                candle['product_id'] = product_id
+            message['events'] = [{'type': 'snapshot' if snapshot else 'update', 'candles': candles}]
+        elif channel == 'heartbeats':
+            message['events'] = [{'current_time': timestamp, 'heartbeat_counter': message_number}]
+        else:
+            message['channel'] = 'subscriptions'
+            message['events'] = []
+        return message
+
+    def create_ws_handler(self) -> type:
+        fake_server = self
+
+        class WebsocketHandler(socketserver.StreamRequestHandler):
+            def handshake(self) -> bool:
+                request = b''
+                while b'\r\n\r\n' not in request:
+                    chunk = self.request.recv(4096)
+                    if not chunk:
+                        return False
+                    request += chunk
+                headers = {}
+                for line in request.decode().split('\r\n')[1:]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                accept = base64.b64encode(hashlib.sha1((headers.get('sec-websocket-key', '') + WS_GUID).encode()).digest()).decode()
+                self.request.sendall((
+                    "HTTP/1.1 101 Switching Protocols\r\n"
+                    "Upgrade: websocket\r\n"
+                    "Connection: Upgrade\r\n"
+                    f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+                ).encode())
+                return True
+
+            def recv_exact(self, size: int) -> bytes:
+                data = b''
+                while len(data) < size:
+                    chunk = self.request.recv(size - len(data))
+                    if not chunk:
+                        raise ConnectionResetError
+                    data += chunk
+                return data
+
+            def recv_frame(self) -> tuple[int, bytes]:
+                first, second = self.recv_exact(2)
+                length = second & 0x7f
+                if length == 126:
+                    length = struct.unpack('!H', self.recv_exact(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', self.recv_exact(8))[0]
+                mask = self.recv_exact(4) if second & 0x80 else b''
+                payload = self.recv_exact(length)
+                if mask:
+                    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+                return first & 0x0f, payload
+
+            def send_frame(self, payload: bytes, opcode: int = 0x1):
+                length = len(payload)
+                if length < 126:
+                    header = struct.pack('!BB', 0x80 | opcode, length)
+                elif length < 1 << 16:
+                    header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+                else:
+                    header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+                self.request.sendall(header + payload)
+
+            def handle(self):
+                if not self.handshake():
+                    return
+                fake_server.record(ws_connections=1)
+
+                subscriptions: dict[tuple[str, str], bool] = {}     # { (channel, product_id) : snapshot sent }
+                sequence_num = 0
+                message_number = 0
+                interval = 1 / fake_server.ws_messages_per_second if fake_server.ws_messages_per_second > 0 else 1.0
+                next_send = time.monotonic()
+                close_at = next_send + fake_server.max_connection_seconds if fake_server.max_connection_seconds > 0 else None
+                try:
+                    while True:
+                        if close_at and time.monotonic() >= close_at:
+                            self.send_frame(struct.pack('!H', 1001), 0x8)
+                            return
+                        timeout = max(0.0, next_send - time.monotonic()) if subscriptions else 1.0
+                        readable, _, _ = select.select([self.request], [], [], timeout)
+                        if readable:
+                            opcode, payload = self.recv_frame()
+                            if opcode == 0x8:
+                                self.send_frame(payload[:2], 0x8)
+                                return
+                            if opcode == 0x9:
+                                self.send_frame(payload, 0xA)
+                            elif opcode == 0x1:
+                                sequence_num = self.handle_message(json.loads(payload), subscriptions, sequence_num)
+                            continue
+
+                        next_send += interval
+                        for key in list(subscriptions):
+                            channel, product_id = key
+                            message_number += 1
+                            if fake_server.sequence_gap_every and message_number % fake_server.sequence_gap_every == 0:
+                                sequence_num += 1
+                            message = fake_server.get_ws_message(channel, product_id, sequence_num, message_number, not subscriptions[key])
+                            subscriptions[key] = True
+                            sequence_num += 1
+                            self.send_frame(json.dumps(message).encode())
+                            fake_server.record(ws_messages=1)
+                except (ConnectionError, OSError, ValueError):
+                    return
+
+            def handle_message(self, message: dict, subscriptions: dict[tuple[str, str], bool], sequence_num: int) -> int:
+                channel = message.get('channel', '')
+                product_ids = message.get('product_ids', []) or ['']
+                for product_id in product_ids:
+                    if message.get('type') == 'subscribe':
+                        subscriptions.setdefault((channel, product_id), False)
+                    elif message.get('type') == 'unsubscribe':
+                        subscriptions.pop((channel, product_id), None)
+
+                active: dict[str, list[str]] = {}
+                for subscribed_channel, product_id in subscriptions:
+                    active.setdefault(subscribed_channel, [])
+                    if product_id:
+                        active[subscribed_channel].append(product_id)
+                ack = {
+                    'channel': 'subscriptions', 'client_id': '', 'sequence_num': sequence_num,
+                    'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat().replace('+00:00', 'Z'),
+                    'events': [{'subscriptions': active}],
+                }
+                self.send_frame(json.dumps(ack).encode())
+                return sequence_num + 1
+
+        return WebsocketHandler
+
+class FakeRESTClient(RESTClient):
+    """RESTClient talking plain HTTP to a FakeCoinbaseServer, every RESTClient method and response type is the real one"""
+    def __init__(self, base_url: str, timeout: Optional[int] = None):
+        """:base_url: host:port of the fake server, see FakeCoinbaseServer.rest_url"""
+        super().__init__(base_url=base_url, timeout=timeout)
+        self.is_authenticated = True    # the fake server accepts unsigned requests to private endpoints
+
+    def set_headers(self, method, path):
+        return {"User-Agent": USER_AGENT, "Content-Type": "application/json"}
+
+    def send_request(self, http_method, url_path, params, headers, data=None):
+        response = self.session.request(
+            http_method,
+            f"http://{self.base_url}{url_path}",
+            params=params,
+            json=data if data else {},
+            headers=headers,
+            timeout=self.timeout,
+        )
+        handle_exception(response)
+        return response.json()
@@ -0,0 +1,213 @@
+import datetime
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import IO, Optional
+
+import utils
+from database import Database, OnConflict
+from models.candles import Candle
+from models.trades import MarketTrade, MissingDataError
+
+class IngestionPipeline:
+    """Buffers websocket messages in a bounded queue and writes them in batches from one writer thread.
+
+    The websocket thread only enqueues the raw message, parsing and writing happen on the writer thread so a slow
+    disk never delays reading the socket. A full queue blocks the producer instead of dropping messages, the
+    number of such waits is reported in the metrics. A batch is written when batch_size messages are queued or
+    flush_interval seconds after its first message, in one transaction:
+        - market_trades messages are inserted into market_trades, duplicate trade ids are ignored
+        - candles messages (FIVE_MINUTES candles) are inserted into candle_rollups once a newer candle of the same
+          product starts, so only closed candles are stored, rollups already stored are kept
+        - every message, including the above, is appended to data/websockets/{channel}/{YYYY-MM-DD}.jsonl when log_dir is set
+    Malformed messages are counted as invalid and skipped alone. A transaction failing on a locked or busy
+    database is retried with backoff until it commits, the queue meanwhile fills up and blocks the producer.
+    Other write errors would fail again, the batch is counted as failed and remains in the message logs.
+    """
+    MAX_QUEUE_SIZE = 100_000
+    BATCH_SIZE = 1000
+    FLUSH_INTERVAL = 1.0    # seconds
+    CANDLES_GRANULARITY = 'FIVE_MINUTES'    # the candles channel streams five minute candles
+    WRITE_RETRY_DELAY = 0.1         # seconds, doubled after each failed write
+    WRITE_RETRY_MAX_DELAY = 5.0     # seconds
+
+    def __init__(self, db: Optional[Database] = None, log_dir: Optional[str] = utils.get_path_from_data_dir('websockets'),
+                 max_queue_size: int = MAX_QUEUE_SIZE, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        """:log_dir: directory of the append-only message logs, None disables them"""
+        self.db = db if db else Database('mywow.db')
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue[Optional[str]] = queue.Queue(maxsize=max_queue_size)
+
+        self.open_candles: dict[str, dict] = {}     # { product_id : latest candle }
+        self.log_files: dict[str, tuple[str, IO]] = {}  # { channel : ( date, file ) }
+        self.writer_thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.metrics = {'received': 0, 'written': 0, 'batches': 0, 'trades': 0, 'candles': 0, 'invalid': 0, 'failed': 0, 'write_retries': 0, 'producer_waits': 0, 'max_queue_depth': 0}
+
+    def start(self) -> 'IngestionPipeline':
+        with self.lock:
+            if self.writer_thread is None or not self.writer_thread.is_alive():
+                self.writer_thread = threading.Thread(target=self.run, daemon=True)
+                self.writer_thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Writes every queued message then stops the writer thread"""
+        with self.lock:
+            writer_thread = self.writer_thread
+            self.writer_thread = None
+        if writer_thread is None:
+            return
+        self.queue.put(None)
+        writer_thread.join(timeout)
+
+    def put(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.record(producer_waits=1)
+            self.queue.put(message)
+        self.record(received=1)
+
+    def on_message(self, ws, message: str):
+        """WebSocketApp on_message callback"""
+        self.put(message)
+
+    def record(self, **values: int):
+        with self.lock:
+            for key, value in values.items():
+                self.metrics[key] += value
+            self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], self.queue.qsize())
+
+    def get_metrics(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.metrics, queue_depth=self.queue.qsize())
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch: list[str] = []
+            message = self.queue.get()
+            flush_at = time.monotonic() + self.flush_interval
+            while message is not None:
+                batch.append(message)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    message = self.queue.get(timeout=max(flush_at - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            stopping = message is None
+            if batch:
+                self.write_batch(batch)
+        self.close_logs()
+
+    def write_batch(self, batch: list[str]):
+        trade_rows: list[list] = []
+        candle_rows: list[list] = []
+        invalid = 0
+        for raw_message in batch:
+            try:
+                message = json.loads(raw_message)
+                channel = message.get('channel', 'unknown')
+                if channel == 'market_trades':
+                    trade_rows.extend(self.get_trade_rows(message))
+                elif channel == 'candles':
+                    candle_rows.extend(self.get_closed_candle_rows(message))
+            except (ValueError, KeyError, TypeError, AttributeError, MissingDataError) as e:
+                print(f"Skipping invalid websocket message: {e!r}")
+                invalid += 1
+                continue
+            self.write_log(channel, raw_message)
+        for _, log_file in self.log_files.values():
+            log_file.flush()
+
+        try:
+            self.write_rows(trade_rows, candle_rows)
+        except Exception as e:
+            # not a busy database, retrying would fail the same way, the messages are still in the message logs
+            print(f"Failed to write {len(batch) - invalid} websocket messages: {e}")
+            self.record(failed=len(batch) - invalid, invalid=invalid, batches=1)
+            return
+        self.record(written=len(batch) - invalid, invalid=invalid, batches=1, trades=len(trade_rows), candles=len(candle_rows))
+
+    def write_rows(self, trade_rows: list[list], candle_rows: list[list]):
+        """Writes the rows in one transaction, retried until it commits while the database is locked or busy, other
+        errors, ex. a missing table or an unreadable database file, are raised"""
+        attempt = 0
+        while True:
+            try:
+                if trade_rows:
+                    self.db.insert_many(table_name='market_trades', rows=trade_rows, on_conflict=OnConflict.IGNORE, commit=False)
+                if candle_rows:
+                    # streamed candles never replace stored ones, see DatabaseSetupService.create_candle_rollups_table
+                    self.db.insert_many(table_name='candle_rollups', rows=candle_rows, on_conflict=OnConflict.IGNORE, commit=False)
+                self.db.conn.commit()
+                return
+            except sqlite3.OperationalError as e:
+                self.db.conn.rollback()
+                # extended result codes keep the primary code in the low byte
+                if e.sqlite_errorcode & 0xff not in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+                    raise
+                delay = min(self.WRITE_RETRY_MAX_DELAY, self.WRITE_RETRY_DELAY * 2 ** attempt)
+                attempt += 1
+                self.record(write_retries=1)
+                print(f"Failed to write websocket messages, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+            except Exception:
+                self.db.conn.rollback()
+                raise
+
+    def write_log(self, channel: str, raw_message: str):
+        if not self.log_dir:
+            return
+        try:
+            self.get_log_file(channel).write(raw_message.rstrip('\n') + '\n')
+        except OSError as e:
+            print(f"Failed to log a {channel} websocket message: {e}")
+
+    @staticmethod
+    def get_trade_rows(message: dict) -> list[list]:
+        rows = []
+        for event in message.get('events', []):
+            for trade in event.get('trades', []):
+                rows.append(MarketTrade({'bid': None, 'ask': None, 'exchange': None, **trade}).get_values())
+        return rows
+
+    def get_closed_candle_rows(self, message: dict) -> list[list]:
+        """Returns the candles that a newer candle of the same product replaced as the open candle"""
+        rows = []
+        for event in message.get('events', []):
+            for candle in event.get('candles', []):
+                product_id = candle['product_id']
+                open_candle = self.open_candles.get(product_id)
+                if open_candle and int(candle['start']) > int(open_candle['start']):
+                    rows.append(self.get_rollup_values(open_candle))
+                if not open_candle or int(candle['start']) >= int(open_candle['start']):
+                    self.open_candles[product_id] = candle
+        return rows
+
+    def get_rollup_values(self, candle_data: dict) -> list:
+        return Candle({**candle_data, 'trading_pair': candle_data['product_id'], 'granularity': self.CANDLES_GRANULARITY}).get_values()
+
+    def get_log_file(self, channel: str) -> IO:
+        date = datetime.datetime.now().strftime('%Y-%m-%d')
+        log_date, log_file = self.log_files.get(channel, (None, None))
+        if log_date != date or log_file is None:
+            if log_file:
+                log_file.close()
+            channel_dir = os.path.join(self.log_dir, channel)
+            os.makedirs(channel_dir, exist_ok=True)
+            log_file = open(os.path.join(channel_dir, f"{date}.jsonl"), 'a')
+            self.log_files[channel] = (date, log_file)
+        return log_file
+
+    def close_logs(self):
+        for _, log_file in self.log_files.values():
+            log_file.close()
+        self.log_files.clear()
@@ -0,0 +1,223 @@
+import datetime
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from services.coinbase_services import Granularity
+from database import Database, OnConflict
+from models.candles import Candle
+
+class LiveCandleBuilder:
+    """Aggregates market_trades channel ticks into OHLCV candles as they arrive.
+
+    Each product keeps one open candle per granularity plus a ring buffer of its last buffer_size closed candles.
+    A candle closes when a trade of a later bucket arrives or finalize_delay seconds after its end, late trades for
+    closed candles are counted and dropped. The first candle of a product is built from the trades seen since
+    subscribing only, so it is kept in memory but never stored, as are candles overlapping messages the websocket
+    missed (see handle_gap). Closed candles are written in batches, ONE_MINUTE candles to candles and the coarser
+    ones to candle_rollups like CandleResampler's rows.
+    """
+    GRANULARITIES = [Granularity.ONE_MINUTE, Granularity.FIVE_MINUTES, Granularity.FIFTEEN_MINUTES, Granularity.ONE_HOUR]
+    BUFFER_SIZE = 500           # closed candles kept in memory per product and granularity
+    FINALIZE_DELAY = 2.0        # seconds waited after a candle's end for trades published late
+    FLUSH_INTERVAL = 1.0        # seconds
+    BATCH_SIZE = 500
+    MAX_GAPS = 100              # missed intervals remembered per product
+
+    def __init__(self, db: Optional[Database] = None, granularities: Optional[list[str]] = None, buffer_size: int = BUFFER_SIZE,
+                 finalize_delay: float = FINALIZE_DELAY, flush_interval: float = FLUSH_INTERVAL, batch_size: int = BATCH_SIZE):
+        self.db = db if db else Database('mywow.db')
+        self.granularities = granularities if granularities else self.GRANULARITIES
+        self.buffer_size = buffer_size
+        self.finalize_delay = finalize_delay
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        # { ( product_id, granularity ) : candle } candle: { 'start', 'open', 'high', 'low', 'close', 'volume', 'complete' }
+        self.open_candles: dict[tuple[str, str], dict] = {}
+        self.closed_candles: dict[tuple[str, str], deque[dict]] = {}
+        self.pending: list[tuple[str, str, dict]] = []  # closed candles not written yet, ( product_id, granularity, candle )
+        self.gaps: dict[str, deque[tuple[float, float]]] = {}   # { product_id : ( start, end ) epochs of missed trades }
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flush_thread: Optional[threading.Thread] = None
+        self.metrics = {'trades': 0, 'late_trades': 0, 'closed': 0, 'written': 0, 'gaps': 0, 'incomplete': 0}
+
+    @staticmethod
+    def get_trade_epoch(trade_time: str) -> float:
+        return datetime.datetime.fromisoformat(trade_time).timestamp()
+
+    def add_trade(self, product_id: str, price: float, size: float, epoch: float):
+        """Adds one trade to the open candle of every granularity, called under the lock"""
+        self.metrics['trades'] += 1
+        late = False
+        for granularity in self.granularities:
+            granularity_seconds = Granularity.to_seconds(granularity)
+            start = int(epoch) - int(epoch) % granularity_seconds
+            key = (product_id, granularity)
+            candle = self.open_candles.get(key)
+            if candle is not None and start < candle['start']:
+                late = True
+                continue
+            if candle is not None and start > candle['start']:
+                self.close_candle(key)
+                candle = None
+            if candle is None:
+                closed = self.closed_candles.get(key)
+                if closed and start <= closed[-1]['start']:
+                    late = True
+                    continue
+                # a product's first candle only holds the trades since subscribing
+                complete = key in self.closed_candles
+                self.open_candles[key] = {'start': start, 'open': price, 'high': price, 'low': price, 'close': price, 'volume': size, 'complete': complete}
+                continue
+            candle['high'] = max(candle['high'], price)
+            candle['low'] = min(candle['low'], price)
+            candle['close'] = price
+            candle['volume'] += size
+        if late:
+            self.metrics['late_trades'] += 1
+
+    def close_candle(self, key: tuple[str, str]):
+        """Moves an open candle to the ring buffer and queues it for writing, called under the lock"""
+        candle = self.open_candles.pop(key)
+        closed = self.closed_candles.get(key)
+        if closed is None:
+            closed = self.closed_candles[key] = deque(maxlen=self.buffer_size)
+        closed.append(candle)
+        self.metrics['closed'] += 1
+        # a gap reported while earlier trades were still queued can reach the candle only now
+        if candle['complete'] and self.overlaps_gap(key[0], key[1], candle):
+            candle['complete'] = False
+            self.metrics['incomplete'] += 1
+        if candle['complete']:
+            self.pending.append((key[0], key[1], candle))
+
+    def overlaps_gap(self, product_id: str, granularity: str, candle: dict) -> bool:
+        candle_end = candle['start'] + Granularity.to_seconds(granularity)
+        return any(start < candle_end and candle['start'] < end for start, end in self.gaps.get(product_id, []))
+
+    def handle_gap(self, channel: str, product_ids: list[str], start: datetime.datetime, end: datetime.datetime):
+        """Marks the candles of products whose trades between start and end were missed as incomplete so they are not
+        stored, WebsocketService on_gap callback"""
+        if channel != 'market_trades':
+            return
+        with self.lock:
+            for product_id in product_ids:
+                gaps = self.gaps.get(product_id)
+                if gaps is None:
+                    gaps = self.gaps[product_id] = deque(maxlen=self.MAX_GAPS)
+                gaps.append((start.timestamp(), end.timestamp()))
+                self.metrics['gaps'] += 1
+                for granularity in self.granularities:
+                    key = (product_id, granularity)
+                    candles = list(self.closed_candles.get(key, []))
+                    if key in self.open_candles:
+                        candles.append(self.open_candles[key])
+                    for candle in candles:
+                        if candle['complete'] and self.overlaps_gap(product_id, granularity, candle):
+                            candle['complete'] = False
+                            self.metrics['incomplete'] += 1
+            self.pending = [pending for pending in self.pending if pending[2]['complete']]
+
+    def close_due(self, now: Optional[float] = None):
+        """Closes every open candle that ended at least finalize_delay seconds ago"""
+        now = now if now else time.time()
+        with self.lock:
+            for key, candle in list(self.open_candles.items()):
+                if candle['start'] + Granularity.to_seconds(key[1]) + self.finalize_delay <= now:
+                    self.close_candle(key)
+
+    def handle_message(self, message: dict):
+        """Adds the trades of a parsed market_trades message, other channels are ignored"""
+        if message.get('channel') != 'market_trades':
+            return
+        with self.lock:
+            for event in message.get('events', []):
+                # snapshots replay recent trades in any order, they are older than the first candle and would only be late
+                if event.get('type') == 'snapshot':
+                    continue
+                for trade in sorted(event.get('trades', []), key=lambda trade: trade['time']):
+                    self.add_trade(trade['product_id'], float(trade['price']), float(trade['size']), self.get_trade_epoch(trade['time']))
+            pending_count = len(self.pending)
+        if pending_count >= self.batch_size:
+            self.flush()
+
+    def on_message(self, ws, message: str):
+        """WebSocketApp on_message callback"""
+        self.handle_message(json.loads(message))
+
+    @staticmethod
+    def get_candle_values(product_id: str, granularity: str, candle: dict) -> list:
+        candle_id = Candle.build_candle_id(product_id, granularity, candle['start'])
+        time_iso = datetime.datetime.fromtimestamp(candle['start']).astimezone().isoformat()
+        return [candle_id, time_iso, candle['start'], product_id, candle['open'], candle['high'], candle['low'], candle['close'], candle['volume'], granularity]
+
+    def flush(self) -> int:
+        """Writes the closed candles in one transaction, return_value: number of candles written"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+
+        minute_rows = [self.get_candle_values(*candle) for candle in pending if candle[1] == Granularity.ONE_MINUTE]
+        rollup_rows = [self.get_candle_values(*candle) for candle in pending if candle[1] != Granularity.ONE_MINUTE]
+        try:
+            # candles derived from the REST API are kept, see DatabaseSetupService.create_candle_rollups_table
+            self.db.insert_many(table_name='candles', rows=minute_rows, on_conflict=OnConflict.IGNORE, commit=False)
+            self.db.insert_many(table_name='candle_rollups', rows=rollup_rows, on_conflict=OnConflict.IGNORE, commit=False)
+            self.db.conn.commit()
+        except Exception:
+            self.db.conn.rollback()
+            with self.lock:
+                self.pending = pending + self.pending
+            raise
+        with self.lock:
+            self.metrics['written'] += len(pending)
+        return len(pending)
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.close_due()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to write live candles: {e}")
+
+    def start(self) -> 'LiveCandleBuilder':
+        """Closes due candles and writes closed candles every flush_interval seconds from a daemon thread"""
+        if self.flush_thread is None or not self.flush_thread.is_alive():
+            self.stop_event.clear()
+            self.flush_thread = threading.Thread(target=self.run, daemon=True)
+            self.flush_thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.flush_thread:
+            self.flush_thread.join()
+            self.flush_thread = None
+        self.close_due()
+        self.flush()
+
+    def get_candles(self, product_id: str, granularity: str, include_open: bool = True) -> list[dict]:
+        """
+        return_value: [ { 'start', 'open', 'high', 'low', 'close', 'volume', 'complete' }, ... ] oldest first, the open candle last
+        """
+        key = (product_id, granularity)
+        with self.lock:
+            candles = [dict(candle) for candle in self.closed_candles.get(key, [])]
+            if include_open and key in self.open_candles:
+                candles.append(dict(self.open_candles[key]))
+        return candles
+
+    def get_open_candle(self, product_id: str, granularity: str) -> Optional[dict]:
+        with self.lock:
+            candle = self.open_candles.get((product_id, granularity))
+            return dict(candle) if candle else None
+
+    def get_metrics(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.metrics, pending=len(self.pending))
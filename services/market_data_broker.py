@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+class OverflowPolicy:
+    DROP_OLDEST = 'DROP_OLDEST'     # a full queue drops its oldest message
+    COALESCE = 'COALESCE'           # a queue keeps only the latest message of each topic, ex. tickers for a chart
+
+    @staticmethod
+    def verify(policy: str) -> bool:
+        return policy in [OverflowPolicy.DROP_OLDEST, OverflowPolicy.COALESCE]
+
+class Subscription:
+    """Bounded queue of the messages of a MarketDataBroker subscriber.
+
+    Putting never blocks, when the queue is full the policy decides what is lost and the loss is counted in the
+    metrics. With a handler the messages are delivered from the subscription's own thread, a slow handler only
+    delays its own queue. Without one, the subscriber reads them with get.
+    """
+    def __init__(self, broker: 'MarketDataBroker', max_size: int, policy: str, channels: Optional[set[str]] = None,
+                 product_ids: Optional[set[str]] = None, handler: Optional[Callable[[dict], None]] = None,
+                 on_overflow: Optional[Callable[[], None]] = None):
+        """
+        :channels, product_ids: topics delivered to the subscriber, None for every channel or product
+        :on_overflow: called from the delivery thread before the first message following dropped messages
+        """
+        if not OverflowPolicy.verify(policy):
+            raise ValueError("Policy must be one of the following: DROP_OLDEST, COALESCE")
+        self.broker = broker
+        self.max_size = max_size
+        self.policy = policy
+        self.channels = channels
+        self.product_ids = product_ids
+        self.handler = handler
+        self.on_overflow = on_overflow
+
+        self.messages: deque[dict] = deque()
+        self.coalesced: OrderedDict[tuple[str, str], dict] = OrderedDict()     # { ( channel, product_id ) : latest message }
+        self.condition = threading.Condition()
+        self.closed = False
+        self.overflowed = False
+        self.thread: Optional[threading.Thread] = None
+        self.metrics = {'delivered': 0, 'dropped': 0, 'coalesced': 0, 'max_depth': 0}
+
+    def matches(self, channel: str, product_ids: set[str]) -> bool:
+        if self.channels is not None and channel not in self.channels:
+            return False
+        return self.product_ids is None or not product_ids or not self.product_ids.isdisjoint(product_ids)
+
+    def put(self, message: dict, topic: tuple[str, str]):
+        with self.condition:
+            if self.closed:
+                return
+            if self.policy == OverflowPolicy.COALESCE:
+                if topic in self.coalesced:
+                    # keeps its place in line so busy topics do not starve the others
+                    self.coalesced[topic] = message
+                    self.metrics['coalesced'] += 1
+                else:
+                    if len(self.coalesced) >= self.max_size:
+                        self.coalesced.popitem(last=False)
+                        self.metrics['dropped'] += 1
+                        self.overflowed = True
+                    self.coalesced[topic] = message
+                depth = len(self.coalesced)
+            else:
+                if len(self.messages) >= self.max_size:
+                    self.messages.popleft()
+                    self.metrics['dropped'] += 1
+                    self.overflowed = True
+                self.messages.append(message)
+                depth = len(self.messages)
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], depth)
+            self.condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Returns the next message, None when none arrived within timeout or the subscription is closed"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.closed or self.messages or self.coalesced, timeout):
+                return None
+            if self.messages:
+                message = self.messages.popleft()
+            elif self.coalesced:
+                _, message = self.coalesced.popitem(last=False)
+            else:
+                return None
+            self.metrics['delivered'] += 1
+            return message
+
+    def run(self):
+        while True:
+            message = self.get()
+            if message is None:
+                return
+            with self.condition:
+                overflowed, self.overflowed = self.overflowed, False
+            try:
+                if overflowed and self.on_overflow:
+                    self.on_overflow()
+                self.handler(message)
+            except Exception as e:
+                print(f"Market data subscriber failed to handle a {message.get('channel')} message: {e}")
+
+    def start(self) -> 'Subscription':
+        if self.handler and self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def close(self, timeout: Optional[float] = None):
+        """Stops delivering, messages still queued are discarded"""
+        self.broker.unsubscribe(self)
+        with self.condition:
+            self.closed = True
+            self.messages.clear()
+            self.coalesced.clear()
+            self.condition.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def get_metrics(self) -> dict[str, int]:
+        with self.condition:
+            return dict(self.metrics, depth=len(self.messages) + len(self.coalesced))
+
+class MarketDataBroker:
+    """Fans parsed websocket messages out to every subscriber of their topic, a channel and product pair.
+
+    Topics use the subscribed channel names, level2 messages arrive as l2_data. publish only appends to the
+    subscribers' bounded queues, so however slow a subscriber is, the websocket thread is never held up.
+    """
+    MAX_QUEUE_SIZE = 10_000
+    CHANNEL_ALIASES = {'l2_data': 'level2'}
+
+    def __init__(self):
+        self.subscriptions: list[Subscription] = []
+        self.lock = threading.Lock()
+        self.metrics = {'published': 0, 'unrouted': 0}
+
+    @staticmethod
+    def get_product_ids(message: dict) -> set[str]:
+        """Products a message carries data of, read from its events and their trades, candles and tickers"""
+        product_ids = set()
+        for event in message.get('events', []):
+            if 'product_id' in event:
+                product_ids.add(event['product_id'])
+            for key in ['trades', 'candles', 'tickers']:
+                for item in event.get(key, []):
+                    if 'product_id' in item:
+                        product_ids.add(item['product_id'])
+        return product_ids
+
+    def subscribe(self, handler: Optional[Callable[[dict], None]] = None, channels: Optional[list[str]] = None,
+                  product_ids: Optional[list[str]] = None, max_size: int = MAX_QUEUE_SIZE, policy: str = OverflowPolicy.DROP_OLDEST,
+                  on_overflow: Optional[Callable[[], None]] = None) -> Subscription:
+        """
+        :handler: called with every message from the subscription's thread, None to read them with Subscription.get
+        :channels, product_ids: topics to receive, None for every channel or product
+        """
+        subscription = Subscription(
+            self, max_size, policy,
+            channels=set(channels) if channels else None,
+            product_ids=set(product_ids) if product_ids else None,
+            handler=handler,
+            on_overflow=on_overflow,
+        )
+        with self.lock:
+            # copied on write so publish iterates without holding the lock
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription.start()
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            self.subscriptions = [other for other in self.subscriptions if other is not subscription]
+
+    def publish(self, message: dict) -> int:
+        """Queues a message for every matching subscriber, return_value: number of subscribers it was queued for"""
+        channel = message.get('channel', '')
+        channel = self.CHANNEL_ALIASES.get(channel, channel)
+        product_ids = self.get_product_ids(message)
+        topic = (channel, ','.join(sorted(product_ids)))
+
+        delivered = 0
+        for subscription in self.subscriptions:
+            if subscription.matches(channel, product_ids):
+                subscription.put(message, topic)
+                delivered += 1
+        with self.lock:
+            self.metrics['published'] += 1
+            if not delivered:
+                self.metrics['unrouted'] += 1
+        return delivered
+
+    def close(self):
+        for subscription in list(self.subscriptions):
+            subscription.close()
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+            metrics = dict(self.metrics)
+        metrics['subscriptions'] = [subscription.get_metrics() for subscription in subscriptions]
+        return metrics
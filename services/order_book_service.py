@@ -0,0 +1,70 @@
+import json
+import threading
+from typing import Optional
+
+from models.order_book import OrderBook
+
+class OrderBookService:
+    """Live order books of every product streamed on the level2 channel.
+
+    Messages are applied by the websocket thread while monitors and predictions read from others, both go
+    through one lock so readers always see a book between two updates. Readers get copies (get_top, get_depth)
+    rather than the books themselves.
+    """
+    def __init__(self):
+        self.books: dict[str, OrderBook] = {}
+        self.lock = threading.Lock()
+
+    def handle_message(self, message: dict):
+        """Applies a parsed level2 message, other channels are ignored"""
+        if message.get('channel') != 'l2_data':
+            return
+        with self.lock:
+            for event in message.get('events', []):
+                product_id = event['product_id']
+                book = self.books.get(product_id)
+                if book is None:
+                    book = self.books[product_id] = OrderBook(product_id)
+                book.apply_event(event)
+
+    def on_message(self, ws, message: str):
+        """WebSocketApp on_message callback"""
+        self.handle_message(json.loads(message))
+
+    def get_product_ids(self) -> list[str]:
+        with self.lock:
+            return sorted(self.books)
+
+    def get_top(self, product_id: str) -> Optional[dict]:
+        """
+        return_value: { 'best_bid': ( price, size ), 'best_ask': ( price, size ), 'spread', 'mid_price', 'microprice', 'updated_at' },
+                      None until a snapshot of the product was received
+        """
+        with self.lock:
+            book = self.books.get(product_id)
+            if book is None or not book.is_synced:
+                return None
+            return {
+                'best_bid': book.best_bid(),
+                'best_ask': book.best_ask(),
+                'spread': book.spread(),
+                'mid_price': book.mid_price(),
+                'microprice': book.microprice(),
+                'updated_at': book.updated_at,
+            }
+
+    def get_depth(self, product_id: str, levels: int = 10) -> Optional[dict[str, list[tuple[float, float]]]]:
+        with self.lock:
+            book = self.books.get(product_id)
+            if book is None or not book.is_synced:
+                return None
+            return book.get_depth(levels)
+
+    def reset(self, product_id: Optional[str] = None):
+        """Drops a product's book (default: every book), ex. after missed messages, get_top and get_depth return None until
+        its next snapshot, which the caller requests with WebsocketService.resubscribe"""
+        with self.lock:
+            if product_id:
+                self.books.pop(product_id, None)
+            else:
+                self.books.clear()
@@ -1,10 +1,13 @@
 import datetime
+import itertools
 import os
 from typing import Optional
 from coinbase.rest import RESTClient # type: ignore
 
 import services.coinbase_services as cb
 from services.coinbase_services import Granularity
+from services.candle_sync_service import CandleSyncService
+from services.candle_resampler import CandleResampler
 from database.database import Database
 
 from models.prediction import Prediction
@@ -14,6 +17,8 @@ class PredictionService:
     def __init__(self, client: Optional[RESTClient] = None, db: Optional[Database] = None):
         self.client = client if client else cb.get_client()
         self.db = db if db else Database('mywow.db')
+        self.candle_sync_service = CandleSyncService(self.client, self.db)
+        self.candle_resampler = CandleResampler(self.db)
 
         self.predictions_updated = False
         self.update_predictions()
@@ -21,20 +26,19 @@ class PredictionService:
     def get_predictions(self, start_index: int = 0, limit: int = 10) -> list[Prediction]:
         start_index = 0 if start_index < 0 else start_index # TODO: Handle start_index being greater than count of predictions (predictions object? count query? TBD)
         limit = -1 if limit < 0 else start_index + limit # offsets limit as queryed records are those UPTO start_index + desired limit count
-        result = self.db.get_rows(table_name='predictions', limit=limit)
-        return [Prediction(data=result_data) for result_data in result[start_index:]]
+        result = self.db.iter_rows(table_name='predictions', limit=limit)
+        return [Prediction(data=result_data) for result_data in itertools.islice(result, start_index, None)]
 
     def get_results(self, start_index: int = 0, limit: int = 10) -> list[Prediction]:
         start_index = 0 if start_index < 0 else start_index # TODO: Handle start_index being greater than count of predictions (predictions object? count query? TBD)
         limit = -1 if limit < 0 else start_index + limit # offsets limit as queryed records are those UPTO start_index + desired limit count
-        result = self.db.get_rows(table_name='results', limit=limit)
-        return [Prediction(data=result_data) for result_data in result[start_index:]]
+        result = self.db.iter_rows(table_name='results', limit=limit)
+        return [Prediction(data=result_data) for result_data in itertools.islice(result, start_index, None)]
 
     def update_candles(self, prediction: Prediction):
-        candles = cb.get_asset_candles(self.client, prediction.trading_pair, Granularity.ONE_DAY, prediction.start_date, prediction.end_date)
-        for candle_data in candles:
-            candle = Candle(candle_data)
-            self.db.insert_one(table_name='candles', values=candle.get_values())
+        if self.candle_resampler.covers(prediction.trading_pair, Granularity.ONE_DAY, prediction.start_date, prediction.end_date):
+            return
+        self.candle_sync_service.sync(prediction.trading_pair, Granularity.ONE_DAY, prediction.start_date, prediction.end_date)
 
     def update_predictions(self):
         if self.predictions_updated:
@@ -67,21 +71,24 @@ class PredictionService:
     def get_candles(self, trading_pair: str, start_date: datetime.datetime, end_date: datetime.datetime, granularity: Granularity) -> list[Candle]:
         where_statement = self.db.build_where(
             eq={
-                'trading_pair':f"'{trading_pair}'",
-                'granularity':f"'{granularity}'"
+                'trading_pair':trading_pair,
+                'granularity':granularity
             },
             btwn={
-                'time':{
-                    'min':f"'{start_date.isoformat()}'",
-                    'max':f"'{end_date.isoformat()}'",
+                'start':{
+                    'min':int(start_date.timestamp()),
+                    'max':int(end_date.timestamp()),
                 }
             })
-        rows = self.db.get_rows(table_name='candles', where_statement=where_statement)
+        if granularity != Granularity.ONE_MINUTE and self.candle_resampler.covers(trading_pair, granularity, start_date, end_date):
+            rows = self.candle_resampler.get_candles_frame(trading_pair, granularity, start_date, end_date).to_dict('records')
+        else:
+            rows = self.db.iter_rows(table_name='candles', where_statement=where_statement)
+        candles = [Candle(row) for row in rows]
 
-        if not rows:
+        if not candles:
             return []
 
-        candles = [Candle(row) for row in rows]
         range_high = max(candles, key=lambda x:x.high_price).high_price
         range_low = min(candles, key=lambda x:x.low_price).low_price
         for candle in candles:
@@ -0,0 +1,140 @@
+import threading
+import time
+from typing import Optional
+from coinbase.rest import RESTClient # type: ignore
+from requests.exceptions import HTTPError, ConnectionError as RequestsConnectionError, Timeout # type: ignore
+
+import services.coinbase_services as cb
+from database import Database, OnConflict
+
+class ProductCatalog:
+    """Every tradable product, loaded with one get_products request and answered from memory.
+
+    The product list is persisted in the products table and reused across restarts until it is older than
+    ttl seconds, so validating a trading pair costs a dict lookup instead of a get_product request. A refresh
+    swaps in a new dict in one assignment, readers never see a half loaded catalog. start_background_refresh
+    keeps the catalog fresh from a daemon thread, a failed refresh keeps serving the previous products.
+    """
+    TTL = 6 * 60 * 60   # seconds
+    COLUMNS = ['product_id', 'base_currency_id', 'quote_currency_id', 'base_increment', 'quote_increment', 'base_min_size',
+               'base_max_size', 'quote_min_size', 'quote_max_size', 'status', 'trading_disabled', 'product_type']
+
+    def __init__(self, client: Optional[RESTClient] = None, db: Optional[Database] = None, ttl: float = TTL):
+        self.client = client    # shared client constructed on the first refresh when None
+        self.db = db if db else Database('mywow.db')
+        self.ttl = ttl
+        self.products: Optional[dict[str, dict]] = None  # { product_id : product }
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.refresh_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def format_product(cls, product: dict, updated_at: int) -> dict:
+        values = {column: product.get(column) for column in cls.COLUMNS}
+        values['trading_disabled'] = int(bool(values['trading_disabled']))
+        values['updated_at'] = updated_at
+        return values
+
+    def is_stale(self) -> bool:
+        return time.time() - self.updated_at >= self.ttl
+
+    def load_stored(self) -> dict[str, dict]:
+        """Reads the stored catalog and its age, return_value: { product_id : product }"""
+        products = {}
+        updated_at = 0
+        # databases not set up by DatabaseSetupService yet have no products table, the catalog is then fetched
+        if not self.db.table_exists('products'):
+            return products
+        for row in self.db.iter_rows(table_name='products', headers=self.COLUMNS + ['updated_at'], formatted=False):
+            product = dict(zip(self.COLUMNS + ['updated_at'], row))
+            updated_at = max(updated_at, product['updated_at'] or 0)
+            products[product['product_id']] = product
+        self.updated_at = updated_at
+        return products
+
+    def refresh(self) -> int:
+        """Replaces the catalog with the products currently listed by Coinbase, return_value: number of products"""
+        if self.client is None:
+            self.client = cb.get_client()
+        response = self.client.get_products(get_all_products=True)
+        updated_at = time.time()
+        products = {product['product_id']: self.format_product(product, int(updated_at)) for product in response.to_dict().get('products', [])}
+
+        try:
+            # the whole list is replaced so delisted products are dropped
+            self.db.cur.execute("DELETE FROM products")
+            self.db.insert_many(table_name='products', rows=list(products.values()), on_conflict=OnConflict.REPLACE, commit=False)
+            self.db.conn.commit()
+        except Exception:
+            self.db.conn.rollback()
+            raise
+
+        self.products = products
+        self.updated_at = updated_at
+        return len(products)
+
+    def load(self) -> dict[str, dict]:
+        """Returns the catalog, reading the stored products on first use and refreshing them when they are missing or
+        older than ttl. A stale catalog is still returned when the refresh fails.
+        """
+        products = self.products
+        if products is not None and not self.is_stale():
+            return products
+        with self.lock:
+            if self.products is None:
+                self.products = self.load_stored()
+            if not self.products or self.is_stale():
+                try:
+                    self.refresh()
+                except (HTTPError, RequestsConnectionError, Timeout) as e:
+                    if not self.products:
+                        raise
+                    print(f"Failed to refresh products, using the stored catalog: {e}")
+                    # retry on the next ttl rather than on every lookup
+                    self.updated_at = time.time()
+            return self.products
+
+    def exists(self, product_id: str) -> bool:
+        return product_id.upper() in self.load()
+
+    def get(self, product_id: str) -> Optional[dict]:
+        """
+        return_value: { 'product_id', 'base_currency_id', 'quote_currency_id', 'base_increment', 'quote_increment', 'base_min_size',
+                        'base_max_size', 'quote_min_size', 'quote_max_size', 'status', 'trading_disabled', 'product_type', 'updated_at' },
+                      None for unknown products
+        """
+        return self.load().get(product_id.upper())
+
+    def is_tradable(self, product_id: str) -> bool:
+        product = self.get(product_id)
+        return product is not None and product['status'] == 'online' and not product['trading_disabled']
+
+    def get_product_ids(self, quote_currency_id: Optional[str] = None) -> list[str]:
+        return sorted(
+            product_id for product_id, product in self.load().items()
+            if quote_currency_id is None or product['quote_currency_id'] == quote_currency_id
+        )
+
+    def run_refresh(self, interval: float):
+        while not self.stop_event.wait(interval):
+            try:
+                with self.lock:
+                    self.refresh()
+            except (HTTPError, RequestsConnectionError, Timeout) as e:
+                print(f"Failed to refresh products: {e}")
+
+    def start_background_refresh(self, interval: Optional[float] = None):
+        """Refreshes the catalog every interval seconds (default: ttl) from a daemon thread"""
+        if self.refresh_thread and self.refresh_thread.is_alive():
+            return
+        self.load()
+        self.stop_event.clear()
+        self.refresh_thread = threading.Thread(target=self.run_refresh, args=(interval if interval else self.ttl,), daemon=True)
+        self.refresh_thread.start()
+
+    def stop_background_refresh(self):
+        self.stop_event.set()
+        if self.refresh_thread:
+            self.refresh_thread.join()
+            self.refresh_thread = None
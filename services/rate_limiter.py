@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Optional
+
+class TokenBucket:
+    """Thread safe token bucket refilled continuously at rate tokens per second up to capacity.
+
+    Callers reserve their token immediately and then sleep outside the lock until it is due,
+    so waiting threads are served in arrival order and the bucket never hands out more than
+    rate tokens per second on average (plus the initial burst of capacity).
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Takes tokens from the bucket, returns the seconds to wait before they may be used"""
+        with self.lock:
+            self.refill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks until tokens are available, returns the seconds waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def drain(self, seconds: float):
+        """Pushes the next available token at least seconds into the future, used to back every caller off after a 429"""
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class RateLimiter:
+    """A global token bucket shared by every endpoint plus one token bucket per endpoint, with wait time metrics"""
+    def __init__(self, rate: float, endpoint_rates: Optional[dict[str, float]] = None):
+        """
+        :rate: requests per second allowed across all endpoints
+        :endpoint_rates: { endpoint : requests per second }, endpoints not listed are only bound by rate
+        """
+        self.global_bucket = TokenBucket(rate)
+        self.endpoint_rates = endpoint_rates if endpoint_rates else {}
+        self.endpoint_buckets: dict[str, TokenBucket] = {}
+        self.metrics: dict[str, dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, endpoint: str) -> Optional[TokenBucket]:
+        if endpoint not in self.endpoint_rates:
+            return None
+        with self.lock:
+            if endpoint not in self.endpoint_buckets:
+                self.endpoint_buckets[endpoint] = TokenBucket(self.endpoint_rates[endpoint])
+            return self.endpoint_buckets[endpoint]
+
+    def reserve(self, endpoint: str) -> float:
+        """Takes a request to endpoint from every bucket it is bound by without blocking, returns the seconds to wait
+        before sending it. Used by callers that cannot block their thread (asyncio)."""
+        wait = self.global_bucket.reserve()
+        bucket = self.get_bucket(endpoint)
+        if bucket:
+            wait = max(wait, bucket.reserve())
+        self.record(endpoint, requests=1, wait_time=wait)
+        return wait
+
+    def acquire(self, endpoint: str) -> float:
+        """Blocks until a request to endpoint is allowed, returns the seconds waited"""
+        wait = self.reserve(endpoint)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def back_off(self, endpoint: str, seconds: float):
+        """Delays every request to endpoint by seconds, the caller included: its next acquire or reserve does the waiting"""
+        bucket = self.get_bucket(endpoint)
+        (bucket if bucket else self.global_bucket).drain(seconds)
+
+    def record(self, endpoint: str, **values: float):
+        with self.lock:
+            endpoint_metrics = self.metrics.setdefault(endpoint, {'requests': 0, 'retries': 0, 'errors': 0, 'wait_time': 0.0, 'max_wait_time': 0.0})
+            for key, value in values.items():
+                endpoint_metrics[key] += value
+            if 'wait_time' in values:
+                endpoint_metrics['max_wait_time'] = max(endpoint_metrics['max_wait_time'], values['wait_time'])
+
+    def get_metrics(self) -> dict[str, dict[str, float]]:
+        """
+        return_value: { endpoint : { 'requests', 'retries', 'errors', 'wait_time', 'max_wait_time' } }
+        """
+        with self.lock:
+            return { endpoint: dict(values) for endpoint, values in self.metrics.items() }
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+class ResponseCache:
+    """Content addressed on-disk cache of API responses, bounded in size with least recently used eviction.
+
+    Entries are JSON files named by the sha256 of their request key, so equal requests share one entry
+    whatever the caller. Only responses that can never change may be stored, callers decide what that is.
+    Recency is kept in an in-memory index ordered by last use and persisted through the files' mtimes,
+    which are refreshed on every hit, so the eviction order survives restarts.
+    """
+    MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, cache_dir: str, max_bytes: int = MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index: Optional[OrderedDict[str, int]] = None    # { key : file size } least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @staticmethod
+    def get_key(endpoint: str, **params: Any) -> str:
+        request = json.dumps([endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load_index(self):
+        """Rebuilds the recency index from the cache directory, called under the lock on first use"""
+        entries = []
+        if os.path.exists(self.cache_dir):
+            for dir_path, _, file_names in os.walk(self.cache_dir):
+                for file_name in file_names:
+                    if not file_name.endswith('.json'):
+                        continue
+                    stat = os.stat(os.path.join(dir_path, file_name))
+                    entries.append((stat.st_mtime, file_name[:-len('.json')], stat.st_size))
+        entries.sort()
+        self.index = OrderedDict((key, size) for _, key, size in entries)
+        self.total_bytes = sum(self.index.values())
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            if key not in self.index:
+                self.metrics['misses'] += 1
+                return None
+            self.index.move_to_end(key)
+            self.metrics['hits'] += 1
+
+        file_path = self.get_path(key)
+        try:
+            with open(file_path, 'r') as f:
+                value = json.load(f)
+            os.utime(file_path)
+        except (OSError, ValueError):
+            self.discard(key)
+            return None
+        return value
+
+    def put(self, key: str, value: Any):
+        file_path = self.get_path(key)
+        data = json.dumps(value)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            self.total_bytes += len(data) - self.index.pop(key, 0)
+            self.index[key] = len(data)
+            self.evict()
+
+    def discard(self, key: str):
+        with self.lock:
+            if self.index is not None and key in self.index:
+                self.total_bytes -= self.index.pop(key)
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes, called under the lock"""
+        while self.index and self.total_bytes > self.max_bytes:
+            key, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            self.metrics['evictions'] += 1
+            try:
+                os.remove(self.get_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            keys = list(self.index)
+        for key in keys:
+            self.discard(key)
+
+    def get_metrics(self) -> dict[str, int]:
+        """
+        return_value: { 'hits', 'misses', 'evictions', 'entries', 'bytes' }
+        """
+        with self.lock:
+            entries = len(self.index) if self.index is not None else 0
+            return dict(self.metrics, entries=entries, bytes=self.total_bytes)
@@ -1,7 +1,7 @@
 from coinbase import jwt_generator # type: ignore
+from coinbase.rest import RESTClient # type: ignore
 from dotenv import dotenv_values
-from typing import Optional
-from contextlib import closing
+from typing import Callable, Optional
 import datetime
 import threading
 import websocket
@@ -9,11 +9,182 @@ import json
 import time
 import os
 
+import services.coinbase_services as cb
+from services.coinbase_services import RateLimitedClient
+from services.ingestion_pipeline import IngestionPipeline
+from services.market_data_broker import MarketDataBroker
+from services.order_book_service import OrderBookService
+from services.live_candle_builder import LiveCandleBuilder
+from database import OnConflict
+from models.trades import MarketTrade
+
+class WebsocketConnection:
+    """One socket carrying a share of a WebsocketService's subscriptions, reconnecting until it is closed.
+
+    Every (re)connect replays the connection's subscriptions with a fresh JWT. Lost sockets are reconnected with
+    full jitter exponential backoff, sockets older than MAX_WS_CONN_DURATION are replaced right away. Coinbase
+    numbers the messages of a connection with sequence_num, a skipped number or a lost socket means messages were
+    missed between the last message received and the next one, that interval is reported to the service. A
+    replaced socket only reports it when no message arrived for more than ROTATION_GAP_SECONDS.
+    """
+    PING_INTERVAL = 30  # seconds
+    ROTATION_GAP_SECONDS = 2.0
+
+    def __init__(self, service: 'WebsocketService', connection_id: int):
+        self.service = service
+        self.connection_id = connection_id
+        self.subscriptions: dict[str, set[str]] = {}    # { channel : { product_id, ... } }
+        self.lock = threading.Lock()
+        self.ws: Optional[websocket.WebSocketApp] = None
+        self.thread: Optional[threading.Thread] = None
+        self.closing = threading.Event()
+        self.connected = threading.Event()
+
+        self.opened_at = 0.0
+        self.rotating = False
+        self.attempt = 0
+        self.last_sequence_num: Optional[int] = None
+        self.last_message_time: Optional[datetime.datetime] = None
+        self.reconnected = False    # set after a lost socket
+        self.rotated = False        # set after replacing a socket older than MAX_WS_CONN_DURATION
+
+    def get_subscription_count(self) -> int:
+        with self.lock:
+            return sum(max(len(product_ids), 1) for product_ids in self.subscriptions.values())
+
+    def get_subscriptions(self) -> list[dict[str, str | list[str]]]:
+        """
+        return_value: [ { 'channel', 'product_ids' }, ... ]
+        """
+        with self.lock:
+            return [{'channel': channel, 'product_ids': sorted(product_ids)} for channel, product_ids in self.subscriptions.items()]
+
+    def send(self, msg: dict) -> bool:
+        """Sends a message if the socket is open, False when it is not, subscriptions are then replayed on the next connect"""
+        ws = self.ws
+        if ws is None or not self.connected.is_set():
+            return False
+        try:
+            ws.send(json.dumps(msg))
+            return True
+        except (websocket.WebSocketConnectionClosedException, OSError):
+            return False
+
+    def subscribe(self, channel: str, product_ids: list[str]):
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).update(product_ids)
+        self.send(self.service.build_message(WebsocketService.MessageTypes.subscribe, channel, product_ids))
+
+    def unsubscribe(self, channel: str, product_ids: list[str]):
+        with self.lock:
+            if channel not in self.subscriptions:
+                return
+            self.subscriptions[channel].difference_update(product_ids)
+            if not product_ids or not self.subscriptions[channel]:
+                del self.subscriptions[channel]
+        self.send(self.service.build_message(WebsocketService.MessageTypes.unsubscribe, channel, product_ids))
+
+    def replay(self):
+        self.send(self.service.build_message(WebsocketService.MessageTypes.subscribe, WebsocketService.Channel.heartbeats))
+        for subscription in self.get_subscriptions():
+            self.send(self.service.build_message(WebsocketService.MessageTypes.subscribe, subscription['channel'], subscription['product_ids']))
+
+    def on_open(self, ws):
+        self.connected.set()
+        self.opened_at = time.monotonic()
+        self.attempt = 0
+        # sequence numbers restart with every connection
+        self.last_sequence_num = None
+        self.replay()
+
+    def on_message(self, ws, raw_message: str):
+        message = json.loads(raw_message)
+        sequence_num = message.get('sequence_num')
+        message_time = datetime.datetime.fromisoformat(message['timestamp']) if message.get('timestamp') else None
+
+        missed = self.reconnected or (sequence_num is not None and self.last_sequence_num is not None and sequence_num > self.last_sequence_num + 1)
+        if self.rotated and self.last_message_time and message_time:
+            # the new socket is opened right away, only a longer silence than usual means messages were missed
+            missed = missed or (message_time - self.last_message_time).total_seconds() > self.ROTATION_GAP_SECONDS
+        if missed and self.last_message_time and message_time:
+            # subscriptions replayed on a new socket already start with level2 snapshots
+            self.service.handle_gap(self, self.last_message_time, message_time, resubscribe=not (self.reconnected or self.rotated))
+        self.reconnected = False
+        self.rotated = False
+        if sequence_num is not None:
+            self.last_sequence_num = sequence_num
+        if message_time:
+            self.last_message_time = message_time
+
+        self.service.dispatch(raw_message, message)
+
+        if time.monotonic() - self.opened_at >= WebsocketService.MAX_WS_CONN_DURATION:
+            self.rotating = True
+            ws.close()
+
+    def on_error(self, ws, e):
+        print(f"Websocket connection {self.connection_id} error: {e}")
+
+    def on_close(self, ws, close_status_code, close_msg):
+        self.connected.clear()
+
+    def run(self):
+        while not self.closing.is_set():
+            self.ws = websocket.WebSocketApp(
+                self.service.WS_URL,
+                on_open=self.on_open,
+                on_message=self.on_message,
+                on_error=self.on_error,
+                on_close=self.on_close,
+                )
+            self.ws.run_forever(ping_interval=self.PING_INTERVAL)
+            self.connected.clear()
+            if self.closing.is_set():
+                break
+
+            if self.rotating:
+                self.rotating = False
+                self.rotated = True
+                continue
+            self.reconnected = True
+            delay = RateLimitedClient.get_retry_backoff(self.attempt)
+            self.attempt += 1
+            print(f"Websocket connection {self.connection_id} lost, reconnecting in {delay:.1f}s")
+            self.closing.wait(delay)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.closing.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def close(self, timeout: Optional[float] = None):
+        self.closing.set()
+        for subscription in self.get_subscriptions():
+            self.send(self.service.build_message(WebsocketService.MessageTypes.unsubscribe, subscription['channel'], subscription['product_ids']))
+        with self.lock:
+            self.subscriptions.clear()
+        if self.ws:
+            self.ws.close()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+
 class WebsocketService:
+    """Multiplexes channel subscriptions over a few WebsocketConnections. Every message is written by an IngestionPipeline,
+    which never drops messages, and published to a MarketDataBroker for live consumers.
+
+    Subscriptions fill a connection up to max_subscriptions_per_connection (channel, product) pairs before another
+    connection is opened. When a connection misses messages the level2 products it carries are resubscribed for a
+    fresh snapshot unless it just reconnected, the missed market trades are backfilled from the REST API when a client is given and on_gap
+    is called with ( channel, product_ids, start, end ) for every subscription of the connection.
+    """
     WS_URL = "wss://advanced-trade-ws.coinbase.com"
     ALGORITHM = 'ES256'
     MAX_JWT_DURATION = 120          # 2 mins | 120 secs
     MAX_WS_CONN_DURATION = 300      # 5 mins | 300 secs
+    JWT_REFRESH_MARGIN = 20         # secs before expiry a new JWT is generated
+    MAX_SUBSCRIPTIONS_PER_CONNECTION = 20
     class Channel:
         level2 = 'level2'
         user = 'user'
@@ -28,89 +199,164 @@ class WebsocketService:
         subscribe = 'subscribe'
         unsubscribe = 'unsubscribe'
 
-    def __init__(self, api_key: str, api_secret: str):
+    def __init__(self, api_key: str, api_secret: str, ws_url: Optional[str] = None, pipeline: Optional[IngestionPipeline] = None,
+                 client: Optional[RESTClient] = None, on_gap: Optional[Callable[[str, list[str], datetime.datetime, datetime.datetime], None]] = None,
+                 max_subscriptions_per_connection: int = MAX_SUBSCRIPTIONS_PER_CONNECTION, broker: Optional[MarketDataBroker] = None):
+        """
+        :ws_url: overrides WS_URL, ex. the ws_url of a local FakeCoinbaseServer, defaults to $COINBASE_FAKE_WS_URL when set
+        :pipeline: receives every message, started with the first connection
+        :client: backfills missed market trades, None disables backfilling
+        :broker: receives every parsed message, subscribe to it to consume live data
+        """
         self.KEY = api_key 
         self.SECRET = api_secret
+        self.WS_URL = ws_url if ws_url else os.environ.get('COINBASE_FAKE_WS_URL', WebsocketService.WS_URL)
 
         self.curr_jwt: str = ""
         self.last_jwt_update: datetime.datetime = datetime.datetime.now()
-        self.opened_connections: list[dict[str, str | list]] = []
+        self.jwt_lock = threading.Lock()
+        self.pipeline = pipeline if pipeline else IngestionPipeline()
+        self.broker = broker if broker else MarketDataBroker()
+        self.client = client
+        self.on_gap = on_gap
+        self.max_subscriptions_per_connection = max_subscriptions_per_connection
+        self.connections: list[WebsocketConnection] = []
+        self.lock = threading.Lock()
+        self.metrics = {'gaps': 0, 'backfilled_trades': 0}
+
+    @property
+    def opened_connections(self) -> list[dict[str, str | list[str]]]:
+        """Active subscriptions of every connection, [ { 'channel', 'product_ids' }, ... ]"""
+        return [subscription for connection in self.connections for subscription in connection.get_subscriptions()]
 
     def gen_jwt(self) -> str:
         return jwt_generator.build_ws_jwt(self.KEY, self.SECRET)
 
     def get_jwt(self) -> str:
-        if not self.curr_jwt or (datetime.datetime.now() - self.last_jwt_update).seconds >= self.MAX_JWT_DURATION:
-            self.curr_jwt = self.gen_jwt()
-            self.last_jwt_update = datetime.datetime.now()
-
-        return self.curr_jwt
-
-    def on_open(self, ws):
-        self.subscribe(ws=ws, channel=self.Channel.heartbeats)
+        """Returns the current JWT, a new one is generated JWT_REFRESH_MARGIN seconds before it expires"""
+        with self.jwt_lock:
+            if not self.curr_jwt or (datetime.datetime.now() - self.last_jwt_update).total_seconds() >= self.MAX_JWT_DURATION - self.JWT_REFRESH_MARGIN:
+                self.curr_jwt = self.gen_jwt()
+                self.last_jwt_update = datetime.datetime.now()
+            return self.curr_jwt
 
-    def on_message(self, ws, message):
-        data = json.loads(message)
-        data_path = os.path.join(os.getcwd(), 'data', 'websockets', 'level2', f'{datetime.datetime.now().strftime('%H_%M_%S')}.json')
-        with open(data_path, 'w') as f:
-            json.dump(data, f, indent=4)
-
-    def on_error(self, ws, e):
-        print(f"Error: {e}")
-
-    def on_close(self, ws):
-        print("Connection closed")
-
-    def create_socket(self):
-        ws = websocket.WebSocketApp(
-            self.WS_URL,
-            on_open=self.on_open,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close,
-            )
-        return ws
-
-    def subscribe(self, ws: websocket.WebSocketApp, channel: str, products_ids: Optional[list[str]] = None, jwt: Optional[str] = None):
+    def build_message(self, message_type: str, channel: str, products_ids: Optional[list[str]] = None) -> dict[str, str | list[str]]:
         msg: dict[str, str | list[str]] = {
-            'type' : self.MessageTypes.subscribe,
+            'type' : message_type,
             'channel': channel,
         }
 
         if products_ids:
             msg['product_ids'] = products_ids
-        if jwt: 
-            msg['jwt'] = jwt
-        else:
-            msg['jwt'] = self.gen_jwt()
-
-        ws = self.create_socket()
-        ws.send(json.dumps(msg))
-        self.opened_connections.append(msg)
-    
-    def unsubscribe(self, ws: websocket.WebSocketApp, channel: str, products_ids: Optional[list[str]] = None, jwt: Optional[str] = None):
-        msg: dict[str, str | list[str]] = {
-            'type' : self.MessageTypes.unsubscribe,
-            'channel': channel,
-        }
+        # unauthenticated connections, ex. to a FakeCoinbaseServer, send no JWT
+        if self.KEY and self.SECRET:
+            msg['jwt'] = self.get_jwt()
+        return msg
 
-        if products_ids:
-            msg['product_ids'] = products_ids
-        if jwt:
-            msg['jwt'] = jwt
+    def dispatch(self, raw_message: str, message: dict):
+        self.pipeline.put(raw_message)
+        self.broker.publish(message)
 
-        ws.send(json.dumps(msg))
+    def get_connection(self, channel: str, product_id: str) -> WebsocketConnection:
+        """Returns the connection carrying a subscription, otherwise the first one with room for it, called under the lock"""
+        for connection in self.connections:
+            with connection.lock:
+                if product_id in connection.subscriptions.get(channel, set()):
+                    return connection
+        for connection in self.connections:
+            if connection.get_subscription_count() < self.max_subscriptions_per_connection:
+                return connection
+        connection = WebsocketConnection(self, len(self.connections))
+        self.connections.append(connection)
+        self.pipeline.start()
+        connection.start()
+        return connection
 
-        removed_connection = { key: msg[key] for key in msg if key != 'type'}
-        for oc in self.opened_connections:
-            if oc == removed_connection:
-                self.opened_connections.remove(oc)
-                break
+    def subscribe(self, channel: str, products_ids: Optional[list[str]] = None):
+        """Subscribes to a channel, its products are spread over connections with room for them"""
+        with self.lock:
+            assigned: dict[WebsocketConnection, list[str]] = {}
+            for product_id in (products_ids if products_ids else ['']):
+                connection = self.get_connection(channel, product_id)
+                # reserve the slot before the next product picks a connection
+                with connection.lock:
+                    connection.subscriptions.setdefault(channel, set())
+                    if product_id:
+                        connection.subscriptions[channel].add(product_id)
+                assigned.setdefault(connection, []).append(product_id)
+        for connection, product_ids in assigned.items():
+            connection.subscribe(channel, [product_id for product_id in product_ids if product_id])
+
+    def unsubscribe(self, channel: str, products_ids: Optional[list[str]] = None):
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            with connection.lock:
+                subscribed = set(connection.subscriptions.get(channel, set()))
+            if products_ids:
+                subscribed.intersection_update(products_ids)
+            if subscribed or (not products_ids and channel in connection.subscriptions):
+                connection.unsubscribe(channel, sorted(subscribed))
+
+    def resubscribe(self, channel: str, products_ids: Optional[list[str]] = None):
+        """Renews subscriptions on the connections carrying them, ex. level2 ones to get fresh snapshots
+
+        :products_ids: products to resubscribe, None for every product of the channel
+        """
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            with connection.lock:
+                subscribed = set(connection.subscriptions.get(channel, set()))
+            if products_ids:
+                subscribed.intersection_update(products_ids)
+            if subscribed:
+                connection.unsubscribe(channel, sorted(subscribed))
+                connection.subscribe(channel, sorted(subscribed))
+
+    def handle_gap(self, connection: WebsocketConnection, start: datetime.datetime, end: datetime.datetime, resubscribe: bool = True):
+        """Recovers the subscriptions of a connection that missed the messages between start and end
 
-    def close_all(self):
-        while self.opened_connections:
-            oc = self.opened_connections.pop()
-            self.unsubscribe(channel=oc['channel'], products_ids=oc.get('products_ids', None), jwt=oc.get('jwt', None))
+        :resubscribe: resubscribes level2 for fresh snapshots, False when the subscriptions were just replayed
+        """
+        with self.lock:
+            self.metrics['gaps'] += 1
+        for subscription in connection.get_subscriptions():
+            channel, product_ids = str(subscription['channel']), list(subscription['product_ids'])
+            if resubscribe and channel == self.Channel.level2 and product_ids:
+                # order books cannot be patched, a new subscription starts with a snapshot
+                connection.unsubscribe(channel, product_ids)
+                connection.subscribe(channel, product_ids)
+            if self.client and channel == self.Channel.market_trades and product_ids:
+                threading.Thread(target=self.backfill_market_trades, args=(product_ids, start, end), daemon=True).start()
+            if self.on_gap:
+                threading.Thread(target=self.on_gap, args=(channel, product_ids, start, end), daemon=True).start()
+
+    def backfill_market_trades(self, product_ids: list[str], start: datetime.datetime, end: datetime.datetime) -> int:
+        """Writes the market trades between start and end from the REST API, return_value: number of trades written"""
+        row_count = 0
+        for product_id in product_ids:
+            try:
+                trades = cb.fetch_market_trades(self.client, product_id, start, end, cb.CANDLES_LIMIT_MAX, cache=None)
+                rows = [MarketTrade(trade).get_values() for trade in trades]
+                row_count += self.pipeline.db.insert_many(table_name='market_trades', rows=rows, on_conflict=OnConflict.IGNORE)
+            except Exception as e:
+                print(f"Failed to backfill {product_id} market trades: {e}")
+        with self.lock:
+            self.metrics['backfilled_trades'] += row_count
+        return row_count
+
+    def get_metrics(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.metrics, connections=len(self.connections), subscriptions=sum(connection.get_subscription_count() for connection in self.connections))
+
+    def close_all(self, timeout: Optional[float] = None):
+        """Unsubscribes and closes every connection, then writes the messages still queued in the pipeline"""
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close(timeout)
+        self.pipeline.stop(timeout)
 
 def test_on_open(ws):
     msg = {
@@ -145,10 +391,31 @@ def main():
     key = config['COINBASE_API_KEY']
     secret = config['COINBASE_API_SECRET']
 
-    wservice = WebsocketService(key, secret)
-    # Creates thread and websocket then sends the subscription request to the server
-    #   - Messages are 
-    wservice.subscribe(channel=WebsocketService.Channel.candles, products_ids=['BTC-USD'])
+    candle_builder = LiveCandleBuilder().start()
+    # candles overlapping missed trades are kept out of the database
+    wservice = WebsocketService(key, secret, on_gap=candle_builder.handle_gap)
+    order_books = OrderBookService()
+
+    def resync_order_books():
+        # the dropped updates could be of any product, every book is cleared until the snapshots of new subscriptions
+        order_books.reset()
+        wservice.resubscribe(WebsocketService.Channel.level2)
+
+    # Live consumers each get their own queue, books that missed updates are resynced from fresh snapshots
+    wservice.broker.subscribe(order_books.handle_message, channels=[WebsocketService.Channel.level2], on_overflow=resync_order_books)
+    wservice.broker.subscribe(candle_builder.handle_message, channels=[WebsocketService.Channel.market_trades])
+
+    # Opens a connection thread on the first subscription, messages are written by the service's IngestionPipeline
+    wservice.subscribe(channel=WebsocketService.Channel.level2, products_ids=['BTC-USD'])
+    wservice.subscribe(channel=WebsocketService.Channel.market_trades, products_ids=['BTC-USD'])
+    try:
+        while True:
+            time.sleep(1)
+            print(order_books.get_top('BTC-USD'), candle_builder.get_open_candle('BTC-USD', 'ONE_MINUTE'))
+    except KeyboardInterrupt:
+        wservice.close_all()
+        wservice.broker.close()
+        candle_builder.stop()
 
 
     # ws = websocket.WebSocketApp(WebsocketService.WS_URL, on_open=test_on_open, on_message=test_on_message, on_close=test_on_close, on_error=test_on_error)
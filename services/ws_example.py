@@ -10,6 +10,8 @@ import datetime
 import time
 import os
 
+from services.ingestion_pipeline import IngestionPipeline
+
 config = dotenv_values('.env')
 api_key = config['COINBASE_API_KEY']
 api_secret = config['COINBASE_API_SECRET']
@@ -66,11 +68,11 @@ def unsubscribe_to_products(ws, product_ids, channel_name):
     signed_message = sign_with_jwt(message, channel_name, product_ids)
     ws.send(json.dumps(signed_message))
 
+# Appends every message to data/websockets/{channel}/{date}.jsonl in batches
+pipeline = IngestionPipeline()
+
 def on_message(ws, message):
-    data = json.loads(message)
-    data_path = os.path.join(os.getcwd(), 'data', 'websockets', 'level2', f'{datetime.datetime.now().strftime('%H_%M_%S')}.json')
-    with open(data_path, 'w') as f:
-        json.dump(data, f, indent=4)
+    pipeline.put(message)
 
 def on_open(ws):
     product_ids = ['BTC-USD']
@@ -81,6 +83,7 @@ def start_websocket():
     ws.run_forever()
 
 def main():
+    pipeline.start()
     ws_thread = threading.Thread(target=start_websocket)
     ws_thread.start()
 
@@ -98,6 +101,8 @@ def main():
             time.sleep(1)
     except Exception as e:
         print(f"Exception: {e}")
+    finally:
+        pipeline.stop()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, DatabaseSetupService
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Points DatabaseSetupService's local storage directories at a temporary directory"""
+    monkeypatch.setattr(DatabaseSetupService, 'data_dir', str(tmp_path))
+    monkeypatch.setattr(DatabaseSetupService, 'local_db_path', str(tmp_path / 'local_db'))
+    monkeypatch.setattr(DatabaseSetupService, 'candles_dir', str(tmp_path / 'candles'))
+    return tmp_path
+
+@pytest.fixture
+def db(local_storage):
+    """Empty database in the temporary directory, Database joins an absolute name onto nothing"""
+    db = Database(str(local_storage / 'test.db'))
+    yield db
+    db.on_exit()
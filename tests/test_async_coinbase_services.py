@@ -0,0 +1,29 @@
+import asyncio
+import datetime
+
+import services.async_coinbase_services as acb
+from database import DatabaseSetupService
+from services.candle_sync_service import CandleSyncService
+
+HOUR = 3600
+
+def test_upload_asset_candles_records_coverage(db, monkeypatch):
+    DatabaseSetupService(db)
+    base = CandleSyncService.get_closed_end('ONE_HOUR') - 5 * HOUR
+
+    async def get_asset_candles(client, product_id, granularity, start, end):
+        return [
+            {'start': str(candle_start), 'trading_pair': product_id, 'granularity': granularity, 'open': '1', 'high': '1', 'low': '1', 'close': '1', 'volume': '1'}
+            for candle_start in range(base, base + 3 * HOUR, HOUR)
+        ]
+    monkeypatch.setattr(acb, 'get_asset_candles', get_asset_candles)
+
+    start = datetime.datetime.fromtimestamp(base).astimezone()
+    end = datetime.datetime.fromtimestamp(base + 2 * HOUR).astimezone()
+    assert asyncio.run(acb.upload_asset_candles(db, None, ['BTC-USD', 'ETH-USD'], 'ONE_HOUR', start, end)) == 6
+
+    # a later sync of the same range makes no API calls
+    sync_service = CandleSyncService(client=object(), db=db)
+    for product_id in ['BTC-USD', 'ETH-USD']:
+        assert sync_service.get_coverage(product_id, 'ONE_HOUR') == [(base, base + 3 * HOUR)]
+        assert sync_service.sync(product_id, 'ONE_HOUR', start, end) == 0
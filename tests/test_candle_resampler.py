@@ -0,0 +1,24 @@
+import pandas as pd # type: ignore
+
+from services.candle_resampler import CandleResampler
+
+def test_resample_frame_aggregates_ohlcv_per_bucket():
+    df_minutes = pd.DataFrame({
+        'start':  [360, 0, 60, 120, 180, 240, 300],
+        'open':   [7.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        'high':   [7.5, 1.5, 2.5, 9.0, 4.5, 5.5, 6.5],
+        'low':    [6.5, 0.5, 1.5, 2.5, 0.1, 4.5, 5.5],
+        'close':  [7.2, 1.2, 2.2, 3.2, 4.2, 5.2, 6.2],
+        'volume': [1.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+    })
+    df_resampled = CandleResampler.resample_frame(df_minutes, 'FIVE_MINUTES')
+
+    assert df_resampled['start'].tolist() == [0, 300]
+    # the first bucket is the 00:00 - 00:05 minutes in start order, whatever order the rows came in
+    assert df_resampled.iloc[0][['open', 'high', 'low', 'close', 'volume']].tolist() == [1.0, 9.0, 0.1, 5.2, 15.0]
+    assert df_resampled.iloc[1][['open', 'high', 'low', 'close', 'volume']].tolist() == [6.0, 7.5, 5.5, 7.2, 7.0]
+
+def test_to_candles_frame_keys_candles_by_trading_pair_and_granularity():
+    df_resampled = pd.DataFrame({'start': [0, 300], 'open': [1.0, 2.0], 'high': [1.0, 2.0], 'low': [1.0, 2.0], 'close': [1.0, 2.0], 'volume': [1.0, 2.0]})
+    df_candles = CandleResampler.__new__(CandleResampler).to_candles_frame(df_resampled, 'BTC-EUR', 'FIVE_MINUTES')
+    assert df_candles['candle_id'].tolist() == ['BTC-EUR-FIVE_MINUTES-0', 'BTC-EUR-FIVE_MINUTES-300']
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+import services.coinbase_services as cb
+from database import DatabaseSetupService
+from services.candle_sync_service import CandleSyncService
+
+HOUR = 3600
+
+def test_merge_intervals_joins_overlapping_and_touching_intervals():
+    intervals = [(50, 60), (0, 10), (10, 20), (15, 30), (40, 45)]
+    assert CandleSyncService.merge_intervals(intervals) == [(0, 30), (40, 45), (50, 60)]
+
+def test_missing_intervals_of_an_uncovered_range():
+    assert CandleSyncService.get_missing_intervals([], 0, 100) == [(0, 100)]
+
+def test_missing_intervals_between_and_around_coverage():
+    coverage = [(10, 20), (40, 50)]
+    assert CandleSyncService.get_missing_intervals(coverage, 0, 60) == [(0, 10), (20, 40), (50, 60)]
+
+def test_missing_intervals_are_clipped_to_the_range():
+    coverage = [(0, 20), (40, 100)]
+    assert CandleSyncService.get_missing_intervals(coverage, 10, 50) == [(20, 40)]
+
+def test_no_missing_intervals_in_a_covered_range():
+    assert CandleSyncService.get_missing_intervals([(0, 100)], 20, 80) == []
+
+def test_coverage_is_half_open():
+    # [0, 10) covers up to but not including 10
+    assert CandleSyncService.get_missing_intervals([(0, 10)], 0, 11) == [(10, 11)]
+
+@pytest.fixture
+def sync_service(db):
+    DatabaseSetupService(db)
+    return CandleSyncService(client=object(), db=db)
+
+def fake_candles(trading_pair: str, start: datetime.datetime, end: datetime.datetime) -> list[dict]:
+    first = int(start.timestamp())
+    return [
+        {'start': str(candle_start), 'trading_pair': trading_pair, 'granularity': 'ONE_HOUR', 'open': '1', 'high': '1', 'low': '1', 'close': '1', 'volume': '1'}
+        for candle_start in range(first - first % HOUR, int(end.timestamp()) + 1, HOUR)
+    ]
+
+def test_sync_fetches_gaps_outside_of_transactions(sync_service, db, monkeypatch):
+    calls = []
+
+    def get_asset_candles(client, trading_pair, granularity, start, end):
+        calls.append((int(start.timestamp()), int(end.timestamp()) + 1, db.conn.in_transaction))
+        return fake_candles(trading_pair, start, end)
+    monkeypatch.setattr(cb, 'get_asset_candles', get_asset_candles)
+
+    base = CandleSyncService.get_closed_end('ONE_HOUR') - 10 * HOUR
+    sync_service.set_coverage('BTC-USD', 'ONE_HOUR', [(base + 2 * HOUR, base + 4 * HOUR)])
+    start = datetime.datetime.fromtimestamp(base).astimezone()
+    end = datetime.datetime.fromtimestamp(base + 6 * HOUR).astimezone()
+
+    assert sync_service.sync('BTC-USD', 'ONE_HOUR', start, end) == 5
+    assert calls == [(base, base + 2 * HOUR, False), (base + 4 * HOUR, base + 7 * HOUR, False)]
+    assert sync_service.get_coverage('BTC-USD', 'ONE_HOUR') == [(base, base + 7 * HOUR)]
+
+    # the synced range costs no calls the second time
+    assert sync_service.sync('BTC-USD', 'ONE_HOUR', start, end) == 0
+    assert len(calls) == 2
+
+def test_failed_fetch_keeps_the_gaps_stored_before_it(sync_service, db, monkeypatch):
+    base = CandleSyncService.get_closed_end('ONE_HOUR') - 10 * HOUR
+    sync_service.set_coverage('BTC-USD', 'ONE_HOUR', [(base + 2 * HOUR, base + 4 * HOUR)])
+
+    def get_asset_candles(client, trading_pair, granularity, start, end):
+        if int(start.timestamp()) > base:
+            raise ConnectionError
+        return fake_candles(trading_pair, start, end)
+    monkeypatch.setattr(cb, 'get_asset_candles', get_asset_candles)
+
+    with pytest.raises(ConnectionError):
+        sync_service.sync('BTC-USD', 'ONE_HOUR', datetime.datetime.fromtimestamp(base).astimezone(), datetime.datetime.fromtimestamp(base + 6 * HOUR).astimezone())
+    assert sync_service.get_coverage('BTC-USD', 'ONE_HOUR') == [(base, base + 4 * HOUR)]
+    assert not db.conn.in_transaction
+
+def test_open_candle_is_stored_but_not_covered(sync_service, db):
+    closed_end = CandleSyncService.get_closed_end('ONE_HOUR')
+    candles = fake_candles('BTC-USD', datetime.datetime.fromtimestamp(closed_end - HOUR), datetime.datetime.fromtimestamp(closed_end))
+    assert CandleSyncService.store_candles(db, 'BTC-USD', 'ONE_HOUR', candles, closed_end - HOUR, closed_end + HOUR) == 2
+    assert sync_service.get_coverage('BTC-USD', 'ONE_HOUR') == [(closed_end - HOUR, closed_end)]
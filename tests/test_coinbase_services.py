@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from services.coinbase_services import ClientRegistry, RateLimitedClient
+
+@pytest.fixture
+def dotenv_path(tmp_path, monkeypatch) -> str:
+    monkeypatch.delenv('COINBASE_FAKE_REST_URL', raising=False)
+    path = tmp_path / '.env'
+    path.write_text('COINBASE_API_KEY=organizations/test/apiKeys/test\nCOINBASE_API_SECRET=test-secret\n')
+    return str(path)
+
+def get_in_thread(get, timeout: float = 5):
+    """Runs get on a daemon thread so a deadlock fails the test instead of hanging the run"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('client', get()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "client construction deadlocked"
+    return result['client']
+
+def test_registry_builds_a_real_rest_client_once(dotenv_path):
+    registry = ClientRegistry()
+    client = get_in_thread(lambda: registry.get_client(dotenv_path))
+    assert isinstance(client, RateLimitedClient)
+    assert type(client.client).__name__ == 'RESTClient'
+    assert registry.get_client(dotenv_path) is client
+
+def test_registry_builds_a_real_wallet_client_once(dotenv_path):
+    registry = ClientRegistry()
+    client = get_in_thread(lambda: registry.get_wallet_client(dotenv_path))
+    assert registry.get_wallet_client(dotenv_path) is client
+
+def test_registry_shares_one_client_between_threads(dotenv_path):
+    registry = ClientRegistry()
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(registry.get_client(dotenv_path))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(clients) == 8 and all(client is clients[0] for client in clients)
+
+def test_reset_forgets_clients(dotenv_path):
+    registry = ClientRegistry()
+    client = registry.get_client(dotenv_path)
+    registry.reset()
+    assert registry.get_client(dotenv_path) is not client
+
+def test_retry_backoff_prefers_retry_after():
+    assert RateLimitedClient.get_retry_backoff(3, '1.5') == 1.5
+    assert 0 <= RateLimitedClient.get_retry_backoff(0) <= RateLimitedClient.BACKOFF_BASE
@@ -0,0 +1,39 @@
+import pytest
+
+from database import OnConflict, DuplicateInsertError, InvalidValuesError
+
+@pytest.fixture
+def prices(db):
+    db.create_table(table_name='prices', values={'price_id': 'TEXT PRIMARY KEY UNIQUE', 'price': 'REAL', 'size': 'REAL'})
+    db.insert_many(table_name='prices', rows=[['a', 1.0, 10.0], ['b', 2.0, 20.0]])
+    return db
+
+def get_prices(db) -> dict:
+    return {row['price_id']: (row['price'], row['size']) for row in db.get_rows(table_name='prices')}
+
+def test_insert_many_ignore_keeps_stored_rows(prices):
+    prices.insert_many(table_name='prices', rows=[['a', 5.0, 50.0], ['c', 3.0, 30.0]], on_conflict=OnConflict.IGNORE)
+    assert get_prices(prices) == {'a': (1.0, 10.0), 'b': (2.0, 20.0), 'c': (3.0, 30.0)}
+
+def test_insert_many_replace_overwrites_stored_rows(prices):
+    prices.insert_many(table_name='prices', rows=[['a', 5.0, 50.0]], on_conflict=OnConflict.REPLACE)
+    assert get_prices(prices) == {'a': (5.0, 50.0), 'b': (2.0, 20.0)}
+
+def test_insert_many_update_overwrites_only_update_columns(prices):
+    prices.insert_many(table_name='prices', rows=[['a', 5.0, 50.0]], on_conflict=OnConflict.UPDATE, update_columns=['size'])
+    assert get_prices(prices) == {'a': (1.0, 50.0), 'b': (2.0, 20.0)}
+
+def test_insert_many_abort_rolls_back_the_batch(prices):
+    with pytest.raises(DuplicateInsertError):
+        prices.insert_many(table_name='prices', rows=[['c', 3.0, 30.0], ['a', 5.0, 50.0]], on_conflict=OnConflict.ABORT)
+    assert get_prices(prices) == {'a': (1.0, 10.0), 'b': (2.0, 20.0)}
+
+def test_insert_many_maps_dict_rows_to_columns(prices):
+    count = prices.insert_many(table_name='prices', rows=[{'size': 30.0, 'price_id': 'c', 'price': 3.0}, {'price': 4.0, 'size': 40.0, 'price_id': 'd'}])
+    assert count == 2
+    assert get_prices(prices)['c'] == (3.0, 30.0)
+    assert get_prices(prices)['d'] == (4.0, 40.0)
+
+def test_insert_many_rejects_rows_of_the_wrong_length(prices):
+    with pytest.raises(InvalidValuesError):
+        prices.insert_many(table_name='prices', rows=[['c', 3.0]])
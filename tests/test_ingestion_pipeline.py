@@ -0,0 +1,82 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from database import DatabaseSetupService, OnConflict
+from services.ingestion_pipeline import IngestionPipeline
+
+def trades_message(*trade_ids: str, **fields) -> str:
+    trades = [
+        {'trade_id': trade_id, 'product_id': 'BTC-USD', 'price': '1', 'size': '1', 'side': 'BUY', 'time': '2025-01-01T00:00:00Z', **fields}
+        for trade_id in trade_ids
+    ]
+    return json.dumps({'channel': 'market_trades', 'events': [{'type': 'update', 'trades': trades}]})
+
+def candles_message(start: int, close: str) -> str:
+    candle = {'product_id': 'BTC-USD', 'start': str(start), 'open': '1', 'high': '1', 'low': '1', 'close': close, 'volume': '1'}
+    return json.dumps({'channel': 'candles', 'events': [{'type': 'update', 'candles': [candle]}]})
+
+@pytest.fixture
+def pipeline(db):
+    DatabaseSetupService(db)
+    pipeline = IngestionPipeline(db=db, log_dir=None)
+    pipeline.WRITE_RETRY_DELAY = 0.01
+    return pipeline
+
+def get_trade_ids(db) -> list[str]:
+    return sorted(row['trade_id'] for row in db.get_rows(table_name='market_trades'))
+
+def test_malformed_messages_are_skipped_alone(pipeline, db):
+    pipeline.write_batch([
+        trades_message('1', '2'),
+        '{not json',
+        trades_message('3', price=None),
+        json.dumps({'channel': 'market_trades', 'events': [{'trades': [{'trade_id': '4'}]}]}),
+        trades_message('5'),
+    ])
+    assert get_trade_ids(db) == ['1', '2', '5']
+    metrics = pipeline.get_metrics()
+    assert metrics['invalid'] == 3
+    assert metrics['written'] == 2
+
+def test_busy_database_is_retried_until_the_batch_commits(pipeline, db):
+    db.cur.execute("PRAGMA busy_timeout = 10")
+    locker = sqlite3.connect(db.connection_manager.db_path, check_same_thread=False)
+    locker.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.3, locker.rollback)
+    release.start()
+
+    pipeline.write_batch([trades_message('1')])
+    release.join()
+    locker.close()
+
+    assert get_trade_ids(db) == ['1']
+    metrics = pipeline.get_metrics()
+    assert metrics['write_retries'] >= 1
+    assert metrics['failed'] == 0
+
+def test_permanent_errors_fail_the_batch_without_retrying(pipeline, db):
+    db.cur.execute("DROP TABLE market_trades")
+    db.conn.commit()
+    pipeline.write_batch([trades_message('1'), trades_message('2')])
+    metrics = pipeline.get_metrics()
+    assert metrics['write_retries'] == 0
+    assert metrics['failed'] == 2
+    assert not db.conn.in_transaction
+
+def test_streamed_candles_never_replace_stored_rollups(pipeline, db):
+    db.insert_many(table_name='candle_rollups', rows=[['BTC-USD-FIVE_MINUTES-300', '1970-01-01T00:05:00+00:00', 300, 'BTC-USD', 1, 1, 1, 9, 1, 'FIVE_MINUTES']], on_conflict=OnConflict.REPLACE)
+    # a candle is stored once the next one starts
+    pipeline.write_batch([candles_message(0, '2'), candles_message(300, '3'), candles_message(600, '4')])
+    closes = {row['start']: row['close'] for row in db.get_rows(table_name='candle_rollups')}
+    assert closes == {0: 2, 300: 9}
+
+def test_stop_writes_every_queued_message(pipeline, db):
+    pipeline.start()
+    for trade_id in range(20):
+        pipeline.put(trades_message(str(trade_id)))
+    pipeline.stop(5)
+    assert len(get_trade_ids(db)) == 20
+    assert pipeline.get_metrics()['received'] == 20
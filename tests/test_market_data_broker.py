@@ -0,0 +1,88 @@
+import threading
+
+from services.market_data_broker import MarketDataBroker, OverflowPolicy
+
+def trades(product_id: str, trade_id: int) -> dict:
+    return {'channel': 'market_trades', 'events': [{'trades': [{'product_id': product_id, 'trade_id': trade_id}]}]}
+
+def ticker(product_id: str, price: str) -> dict:
+    return {'channel': 'ticker', 'events': [{'tickers': [{'product_id': product_id, 'price': price}]}]}
+
+def trade_ids(messages: list[dict]) -> list[int]:
+    return [message['events'][0]['trades'][0]['trade_id'] for message in messages]
+
+def drain(subscription) -> list[dict]:
+    messages = []
+    while (message := subscription.get(timeout=0)) is not None:
+        messages.append(message)
+    return messages
+
+def test_publish_routes_by_channel_and_product():
+    broker = MarketDataBroker()
+    btc = broker.subscribe(channels=['market_trades'], product_ids=['BTC-USD'])
+    level2 = broker.subscribe(channels=['level2'])
+    assert broker.publish(trades('BTC-USD', 1)) == 1
+    assert broker.publish(trades('ETH-USD', 2)) == 0
+    assert broker.publish({'channel': 'l2_data', 'events': [{'product_id': 'BTC-USD'}]}) == 1
+    assert trade_ids(drain(btc)) == [1]
+    assert len(drain(level2)) == 1
+    assert broker.get_metrics()['unrouted'] == 1
+
+def test_drop_oldest_keeps_the_latest_messages():
+    broker = MarketDataBroker()
+    subscription = broker.subscribe(max_size=3, policy=OverflowPolicy.DROP_OLDEST)
+    for trade_id in range(5):
+        broker.publish(trades('BTC-USD', trade_id))
+    assert trade_ids(drain(subscription)) == [2, 3, 4]
+    metrics = subscription.get_metrics()
+    assert metrics['dropped'] == 2
+    assert metrics['max_depth'] == 3
+
+def test_coalesce_keeps_the_latest_message_of_each_topic():
+    broker = MarketDataBroker()
+    subscription = broker.subscribe(max_size=10, policy=OverflowPolicy.COALESCE)
+    for product_id, price in [('BTC-USD', '1'), ('ETH-USD', '2'), ('BTC-USD', '3')]:
+        broker.publish(ticker(product_id, price))
+    prices = [message['events'][0]['tickers'][0]['price'] for message in drain(subscription)]
+    assert prices == ['3', '2']
+    assert subscription.get_metrics()['coalesced'] == 1
+
+def test_slow_handler_overflows_then_recovers():
+    broker = MarketDataBroker()
+    holding = threading.Event()
+    release = threading.Event()
+    handled = {trade_id: threading.Event() for trade_id in range(10)}
+    received: list[int] = []
+    overflows: list[list[int]] = []
+
+    def handler(message: dict):
+        holding.set()
+        release.wait(5)
+        trade_id = trade_ids([message])[0]
+        received.append(trade_id)
+        handled[trade_id].set()
+
+    subscription = broker.subscribe(handler, max_size=2, on_overflow=lambda: overflows.append(list(received)))
+    broker.publish(trades('BTC-USD', 0))
+    assert holding.wait(5)
+    # the handler holds message 0 while 1 to 7 overflow the queue of 2, only the latest two are kept
+    for trade_id in range(1, 8):
+        broker.publish(trades('BTC-USD', trade_id))
+    release.set()
+    assert handled[7].wait(5)
+    for trade_id in [8, 9]:
+        broker.publish(trades('BTC-USD', trade_id))
+        assert handled[trade_id].wait(5)
+    subscription.close(5)
+
+    assert received == [0, 6, 7, 8, 9]
+    # called once, after the drops and before the first message following them
+    assert overflows == [[0]]
+    assert subscription.get_metrics()['dropped'] == 5
+
+def test_closed_subscriptions_stop_receiving():
+    broker = MarketDataBroker()
+    subscription = broker.subscribe()
+    subscription.close()
+    assert broker.publish(trades('BTC-USD', 1)) == 0
+    assert subscription.get(timeout=0) is None
@@ -0,0 +1,144 @@
+import csv
+import os
+
+import pytest
+
+from database import DatabaseSetupService, Migration, MigrationRunner, MigrationError
+
+def read_local_file(local_storage, table_name: str) -> list[dict]:
+    with open(local_storage / 'local_db' / f"{table_name}.csv", newline='') as f:
+        return list(csv.DictReader(f))
+
+def test_fresh_database_is_created_at_the_latest_version(db):
+    service = DatabaseSetupService(db)
+    assert db.get_schema_version() == service.migration_runner.latest_version
+    for table_name in ['candles', 'market_trades', 'local_imports', 'candle_coverage', 'candle_rollups', 'products']:
+        assert db.table_exists(table_name)
+    assert 'time_epoch' in db.get_table_schema('market_trades')
+
+def test_setup_is_idempotent(db):
+    DatabaseSetupService(db)
+    version = db.get_schema_version()
+    DatabaseSetupService(db)
+    assert db.get_schema_version() == version
+
+def test_upgrade_migrates_existing_tables_and_local_files(db, local_storage):
+    # a version 0 database, before market_trades.time_epoch and the trading pair and granularity in candle ids
+    db.cur.execute(
+        "CREATE TABLE market_trades(trade_id TEXT PRIMARY KEY UNIQUE, trading_pair TEXT, price REAL, size REAL, "
+        "time DATETIME, side TEXT, bid REAL, ask REAL, exchange TEXT)"
+    )
+    db.cur.execute("INSERT INTO market_trades VALUES ('1', 'BTC-USD', 1, 1, '2025-01-01T00:00:00+00:00', 'BUY', 0, 0, 'x')")
+    db.cur.execute(
+        "CREATE TABLE candles(candle_id TEXT PRIMARY KEY UNIQUE, time DATETIME, start INT, trading_pair TEXT, "
+        "open REAL, high REAL, low REAL, close REAL, volume REAL, granularity TEXT)"
+    )
+    db.cur.execute("INSERT INTO candles VALUES ('BTC-60', '2025-01-01T00:01:00+00:00', 60, 'BTC-USD', 1, 1, 1, 1, 1, 'ONE_MINUTE')")
+    db.conn.commit()
+    os.makedirs(local_storage / 'local_db')
+    with open(local_storage / 'local_db' / 'market_trades.csv', 'w') as f:
+        f.write('trade_id,trading_pair,price,size,time,side,bid,ask,exchange\n')
+        f.write('2,BTC-USD,1,1,2025-01-01T00:02:00+00:00,SELL,0,0,"an, exchange"\n')
+    with open(local_storage / 'local_db' / 'candles.csv', 'w') as f:
+        f.write('candle_id,time,start,trading_pair,open,high,low,close,volume,granularity\n')
+        f.write('BTC-60,2025-01-01T00:01:00+00:00,60,BTC-EUR,2,2,2,2,2,ONE_DAY\n')
+
+    service = DatabaseSetupService(db)
+
+    assert db.get_schema_version() == service.migration_runner.latest_version
+    trades = {row['trade_id']: row for row in db.get_rows(table_name='market_trades')}
+    assert trades['1']['time_epoch'] == 1735689600
+    assert trades['2']['time_epoch'] == 1735689720
+    assert trades['2']['exchange'] == 'an, exchange'
+    assert read_local_file(local_storage, 'market_trades')[0]['time_epoch'] == '1735689720'
+
+    # the ONE_MINUTE BTC-USD candle and the ONE_DAY BTC-EUR candle had the same id before
+    candle_ids = {row['candle_id'] for row in db.get_rows(table_name='candles')}
+    assert candle_ids == {'BTC-USD-ONE_MINUTE-60', 'BTC-EUR-ONE_DAY-60'}
+    assert read_local_file(local_storage, 'candles')[0]['candle_id'] == 'BTC-EUR-ONE_DAY-60'
+
+def test_failed_migration_rolls_back_and_skips_commit_callbacks(db):
+    committed = []
+
+    def create_table(runner: MigrationRunner):
+        runner.execute("CREATE TABLE created(value INT)")
+        runner.after_commit(lambda: committed.append(True))
+
+    def fail(runner: MigrationRunner):
+        runner.execute("SELECT * FROM missing_table")
+
+    runner = MigrationRunner(db, [Migration(1, 'create', [create_table]), Migration(2, 'fail', [fail])])
+    with pytest.raises(MigrationError):
+        runner.run()
+
+    assert db.get_schema_version() == 0
+    assert not db.table_exists('created')
+    assert committed == []
+
+def test_commit_callbacks_run_after_the_migrations_commit(db):
+    versions = []
+
+    def step(runner: MigrationRunner):
+        runner.after_commit(lambda: versions.append(db.get_schema_version()))
+
+    assert MigrationRunner(db, [Migration(1, 'first', [step]), Migration(2, 'second', [])]).run() == 2
+    assert versions == [2]
+
+def rebuild(db, chunk_size: int, *args, **kwargs):
+    runner = MigrationRunner(db, [Migration(1, 'rebuild', [lambda runner: runner.rebuild_table(*args, **kwargs)])], chunk_size=chunk_size)
+    runner.run()
+    return runner
+
+def test_rebuild_table_copies_rowid_tables_in_chunks(db):
+    db.cur.execute("CREATE TABLE trades(trade_id TEXT PRIMARY KEY, price REAL, size REAL)")
+    db.cur.execute("CREATE INDEX trades_price_idx ON trades(price)")
+    db.cur.executemany("INSERT INTO trades VALUES (?, ?, ?)", [[f"t{i}", i, i * 10] for i in range(7)])
+    db.cur.execute("DELETE FROM trades WHERE trade_id = 't3'")
+    db.conn.commit()
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+
+    rebuild(db, 2, 'trades', {'trade_id': 'TEXT PRIMARY KEY', 'price': 'REAL', 'total': 'REAL'}, column_map={'total': 'price * size'})
+    db.conn.set_trace_callback(None)
+
+    rows = db.cur.execute("SELECT trade_id, price, total FROM trades ORDER BY price").fetchall()
+    assert rows == [(f"t{i}", i, i * i * 10) for i in [0, 1, 2, 4, 5, 6]]
+    # 6 rows in chunks of 2, the last chunk copies whatever is left
+    assert len([statement for statement in statements if statement.startswith('INSERT INTO trades__rebuild')]) == 4
+    assert db.cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='trades' AND sql IS NOT NULL").fetchall() == [('trades_price_idx',)]
+    assert not db.table_exists('trades__rebuild')
+
+def test_rebuild_table_chunks_without_rowid_tables_on_their_primary_key(db):
+    db.cur.execute("CREATE TABLE levels(product_id TEXT, price REAL, size REAL, PRIMARY KEY (product_id, price)) WITHOUT ROWID")
+    db.cur.executemany("INSERT INTO levels VALUES (?, ?, ?)", [[product_id, price, 1] for product_id in ['BTC-USD', 'ETH-USD'] for price in range(5)])
+    db.conn.commit()
+    assert MigrationRunner(db, []).get_chunk_key('levels') == ['product_id', 'price']
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+
+    rebuild(db, 3, 'levels', {'product_id': 'TEXT', 'price': 'REAL', 'size': 'REAL', 'side': 'TEXT'})
+    db.conn.set_trace_callback(None)
+
+    copies = [statement for statement in statements if statement.startswith('INSERT INTO levels__rebuild')]
+    assert len(copies) == 4
+    assert "(product_id, price) > ('BTC-USD', 2.0)" in copies[1]
+    assert db.cur.execute("SELECT COUNT(*), COUNT(DISTINCT product_id || price), COUNT(side) FROM levels").fetchone() == (10, 10, 0)
+
+def test_rebuild_table_of_an_empty_table(db):
+    db.cur.execute("CREATE TABLE empty(value INT)")
+    db.conn.commit()
+    rebuild(db, 2, 'empty', {'value': 'INT', 'other': 'TEXT'})
+    assert list(db.get_table_schema('empty')) == ['value', 'other']
+    assert db.cur.execute("SELECT COUNT(*) FROM empty").fetchone() == (0,)
+
+def test_export_writes_the_table_to_local_storage_and_is_not_imported_back(db, local_storage):
+    service = DatabaseSetupService(db)
+    rows = [[f"BTC-USD-ONE_MINUTE-{start}", '2025-01-01T00:00:00+00:00', start, 'BTC-USD', 1.0, 2.0, 0.5, 1.5, 10.0, 'ONE_MINUTE'] for start in range(0, 300, 60)]
+    db.insert_many(table_name='candles', rows=rows)
+
+    assert service.export_local_table_data('candles', chunk_size=2) == 5
+    exported = read_local_file(local_storage, 'candles')
+    assert [row['candle_id'] for row in exported] == [row[0] for row in rows]
+    assert exported[0]['close'] == '1.5'
+    assert not os.path.exists(local_storage / 'local_db' / 'candles.csv.tmp')
+    assert service.upload_local_table_data('candles') == 0
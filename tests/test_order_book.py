@@ -0,0 +1,52 @@
+import pytest
+
+from models.order_book import OrderBook
+from services.order_book_service import OrderBookService
+
+def level(side: str, price: float, quantity: float) -> dict:
+    return {'side': side, 'price_level': str(price), 'new_quantity': str(quantity), 'event_time': '2025-01-01T00:00:00Z'}
+
+@pytest.fixture
+def book() -> OrderBook:
+    book = OrderBook('BTC-USD')
+    book.apply_event({'type': 'snapshot', 'product_id': 'BTC-USD', 'updates': [
+        level('bid', 99, 1), level('bid', 98, 2), level('bid', 97, 3),
+        level('offer', 101, 4), level('offer', 102, 5), level('offer', 0.5, 0),
+    ]})
+    return book
+
+def test_snapshot_loads_both_sides(book):
+    assert book.is_synced
+    assert book.best_bid() == (99, 1)
+    assert book.best_ask() == (101, 4)
+    assert book.get_depth(2) == {'bids': [(99, 1), (98, 2)], 'asks': [(101, 4), (102, 5)]}
+    assert book.spread() == 2
+    assert book.mid_price() == 100
+    assert book.microprice() == pytest.approx((99 * 4 + 101 * 1) / 5)
+
+def test_updates_set_absolute_quantities(book):
+    book.apply_event({'type': 'update', 'product_id': 'BTC-USD', 'updates': [
+        level('bid', 99, 7), level('bid', 100, 1), level('offer', 101, 0), level('offer', 100.5, 2),
+    ]})
+    assert book.get_depth(3) == {'bids': [(100, 1), (99, 7), (98, 2)], 'asks': [(100.5, 2), (102, 5)]}
+    assert book.get_depth_size(2) == {'bids': 8, 'asks': 7}
+
+def test_removing_a_missing_level_is_ignored(book):
+    book.apply_updates([level('bid', 50, 0)])
+    assert len(book.bids) == 3
+
+def test_snapshot_replaces_every_level(book):
+    book.apply_snapshot([level('bid', 10, 1), level('offer', 11, 1)])
+    assert book.get_depth(5) == {'bids': [(10, 1)], 'asks': [(11, 1)]}
+
+def test_service_reads_only_synced_books():
+    service = OrderBookService()
+    service.handle_message({'channel': 'l2_data', 'events': [{'type': 'update', 'product_id': 'ETH-USD', 'updates': [level('bid', 1, 1)]}]})
+    assert service.get_top('ETH-USD') is None
+
+    service.handle_message({'channel': 'l2_data', 'events': [{'type': 'snapshot', 'product_id': 'ETH-USD', 'updates': [level('bid', 1, 1), level('offer', 2, 1)]}]})
+    assert service.get_top('ETH-USD')['mid_price'] == 1.5
+
+    service.reset('ETH-USD')
+    assert service.get_top('ETH-USD') is None
+    assert service.get_product_ids() == []
@@ -0,0 +1,14 @@
+from database import DatabaseSetupService
+from services.prediction_service import PredictionService
+
+def test_predictions_and_results_are_paged(db):
+    DatabaseSetupService(db)
+    for index in range(5):
+        values = [f"C{index}-1112-2025", f"C{index}", f"C{index}-USD", '2025-01-01', '2025-01-02', 1.0, 2.0, 1.0, 2.0]
+        db.insert_one(table_name='results', values=values + [1.5])
+    # no open predictions, so nothing is synced and the client is never used
+    service = PredictionService(client=object(), db=db)  # type: ignore
+
+    assert [result.symbol for result in service.get_results(start_index=1, limit=2)] == ['C1', 'C2']
+    assert [result.symbol for result in service.get_results(start_index=3, limit=-1)] == ['C3', 'C4']
+    assert service.get_predictions() == []
@@ -0,0 +1,57 @@
+import pytest
+
+import services.coinbase_services as cb
+from database import DatabaseSetupService
+from services.product_catalog import ProductCatalog
+
+class ProductsResponse:
+    def __init__(self, products: list[dict]):
+        self.products = products
+
+    def to_dict(self) -> dict:
+        return {'products': self.products}
+
+class StubClient:
+    def __init__(self, product_ids: list[str]):
+        self.product_ids = product_ids
+        self.requests = 0
+
+    def get_products(self, get_all_products: bool = False) -> ProductsResponse:
+        self.requests += 1
+        return ProductsResponse([{'product_id': product_id, 'status': 'online', 'trading_disabled': False} for product_id in self.product_ids])
+
+@pytest.fixture
+def no_client(monkeypatch):
+    def get_client(*args, **kwargs):
+        raise AssertionError("no client should be constructed")
+    monkeypatch.setattr(cb, 'get_client', get_client)
+
+def test_constructing_a_catalog_makes_no_client(db, no_client):
+    ProductCatalog(db=db)
+
+def test_missing_products_table_reads_as_an_empty_catalog(db, no_client):
+    assert not db.table_exists('products')
+    assert ProductCatalog(db=db).load_stored() == {}
+
+def test_stored_catalog_is_reused_until_stale(db):
+    DatabaseSetupService(db)
+    client = StubClient(['BTC-USD', 'ETH-USD'])
+    catalog = ProductCatalog(client=client, db=db)
+    assert catalog.exists('BTC-USD')
+    assert not catalog.exists('DOGE-EUR')
+    assert client.requests == 1
+
+    # a restart reads the stored products instead of requesting them
+    restarted = ProductCatalog(client=client, db=db)
+    assert restarted.get_product_ids() == ['BTC-USD', 'ETH-USD']
+    assert client.requests == 1
+
+def test_refresh_drops_delisted_products(db):
+    DatabaseSetupService(db)
+    client = StubClient(['BTC-USD', 'ETH-USD'])
+    catalog = ProductCatalog(client=client, db=db)
+    catalog.refresh()
+    client.product_ids = ['BTC-USD']
+    catalog.refresh()
+    assert not catalog.exists('ETH-USD')
+    assert list(catalog.load_stored()) == ['BTC-USD']
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+import requests  # type: ignore
+
+from services.coinbase_services import RateLimitedClient
+from services.rate_limiter import RateLimiter, TokenBucket
+
+def http_error(status_code: int, retry_after: str = '') -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    if retry_after:
+        response.headers['Retry-After'] = retry_after
+    return requests.HTTPError(response=response)
+
+class FlakyMethod:
+    """Raises the given errors in turn, then returns 'ok'"""
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls: list[float] = []
+
+    def __call__(self):
+        self.calls.append(time.monotonic())
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+
+def test_429_retry_waits_the_backoff_once(monkeypatch):
+    rate_limiter = RateLimiter(rate=1000)
+    client = RateLimitedClient(client=object(), rate_limiter=rate_limiter)
+    sleeps: list[float] = []
+    real_sleep = time.sleep
+    monkeypatch.setattr(time, 'sleep', lambda seconds: (sleeps.append(seconds), real_sleep(seconds)))
+
+    method = FlakyMethod(http_error(429, retry_after='0.3'))
+    assert client.call('get_candles', method) == 'ok'
+    assert method.calls[1] - method.calls[0] == pytest.approx(0.3, abs=0.1)
+    assert sum(sleeps) == pytest.approx(0.3, abs=0.01)
+    assert rate_limiter.get_metrics()['get_candles']['retries'] == 1
+
+def test_429_backs_off_other_callers(monkeypatch):
+    rate_limiter = RateLimiter(rate=1000)
+    client = RateLimitedClient(client=object(), rate_limiter=rate_limiter)
+    client.call('get_candles', FlakyMethod(http_error(429, retry_after='0.3')))
+    # the drained bucket has been waited out by the retry, a new call runs right away
+    assert rate_limiter.acquire('get_candles') == pytest.approx(0, abs=0.01)
+
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    rate_limiter.back_off('get_product', 0.3)
+    assert rate_limiter.acquire('get_product') == pytest.approx(0.3, abs=0.01)
+
+def test_5xx_is_retried_with_a_sleep_and_4xx_is_raised(monkeypatch):
+    rate_limiter = RateLimiter(rate=1000)
+    client = RateLimitedClient(client=object(), rate_limiter=rate_limiter)
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+
+    assert client.call('get_candles', FlakyMethod(http_error(503, retry_after='1'), http_error(503, retry_after='1'))) == 'ok'
+    assert rate_limiter.get_metrics()['get_candles']['retries'] == 2
+    assert rate_limiter.get_metrics()['get_candles']['wait_time'] == pytest.approx(2, abs=0.01)
+
+    with pytest.raises(requests.HTTPError):
+        client.call('get_product', FlakyMethod(http_error(404)))
+    assert rate_limiter.get_metrics()['get_product']['errors'] == 1
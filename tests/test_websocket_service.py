@@ -0,0 +1,128 @@
+import datetime
+import json
+import threading
+import time
+
+import pytest
+
+from database import DatabaseSetupService
+from services.fake_coinbase import FakeCoinbaseServer
+from services.ingestion_pipeline import IngestionPipeline
+from services.websocket_service import WebsocketConnection, WebsocketService
+
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+class StubService:
+    """Records the gaps and messages a WebsocketConnection reports"""
+    def __init__(self):
+        self.gaps: list[tuple[datetime.datetime, datetime.datetime, bool]] = []
+        self.messages: list[dict] = []
+
+    def handle_gap(self, connection, start, end, resubscribe=True):
+        self.gaps.append((start, end, resubscribe))
+
+    def dispatch(self, raw_message, message):
+        self.messages.append(message)
+
+    def build_message(self, message_type, channel, products_ids=None):
+        return {'type': message_type, 'channel': channel, 'product_ids': products_ids}
+
+class StubSocket:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def message(sequence_num: int, seconds: float) -> str:
+    return json.dumps({'channel': 'heartbeats', 'sequence_num': sequence_num, 'timestamp': (START + datetime.timedelta(seconds=seconds)).isoformat()})
+
+@pytest.fixture
+def connection():
+    connection = WebsocketConnection(StubService(), 0)  # type: ignore
+    connection.opened_at = time.monotonic()
+    return connection
+
+def test_consecutive_messages_report_no_gap(connection):
+    for sequence_num in range(5):
+        connection.on_message(StubSocket(), message(sequence_num, sequence_num))
+    assert connection.service.gaps == []
+    assert len(connection.service.messages) == 5
+
+def test_skipped_sequence_num_reports_the_gap_and_resubscribes(connection):
+    connection.on_message(StubSocket(), message(0, 0))
+    connection.on_message(StubSocket(), message(1, 1))
+    connection.on_message(StubSocket(), message(3, 2))
+    assert connection.service.gaps == [(START + datetime.timedelta(seconds=1), START + datetime.timedelta(seconds=2), True)]
+
+def test_reconnect_reports_the_gap_without_resubscribing(connection):
+    connection.on_message(StubSocket(), message(7, 0))
+    # a new socket restarts the sequence numbers
+    connection.reconnected = True
+    connection.on_open(StubSocket())
+    connection.on_message(StubSocket(), message(0, 30))
+    connection.on_message(StubSocket(), message(1, 31))
+    assert connection.service.gaps == [(START, START + datetime.timedelta(seconds=30), False)]
+
+def test_rotation_reports_a_gap_only_after_a_long_silence(connection):
+    connection.on_message(StubSocket(), message(7, 0))
+    connection.rotated = True
+    connection.on_message(StubSocket(), message(0, connection.ROTATION_GAP_SECONDS / 2))
+    assert connection.service.gaps == []
+
+    connection.rotated = True
+    connection.on_message(StubSocket(), message(0, connection.ROTATION_GAP_SECONDS * 2))
+    silence_start = START + datetime.timedelta(seconds=connection.ROTATION_GAP_SECONDS / 2)
+    assert connection.service.gaps == [(silence_start, START + datetime.timedelta(seconds=connection.ROTATION_GAP_SECONDS * 2), False)]
+
+def test_old_socket_is_closed_for_rotation(connection, monkeypatch):
+    monkeypatch.setattr(WebsocketService, 'MAX_WS_CONN_DURATION', 0)
+    ws = StubSocket()
+    connection.on_message(ws, message(0, 0))
+    assert ws.closed
+    assert connection.rotating
+
+def test_handle_gap_resubscribes_level2_and_reports_every_subscription(db):
+    gaps = []
+    reported = threading.Event()
+    def on_gap(channel, product_ids, start, end):
+        gaps.append((channel, product_ids))
+        if len(gaps) == 4:
+            reported.set()
+
+    service = WebsocketService('', '', ws_url='ws://127.0.0.1:1', pipeline=IngestionPipeline(db=db, log_dir=None), on_gap=on_gap)
+    connection = WebsocketConnection(service, 0)
+    connection.subscribe(WebsocketService.Channel.level2, ['BTC-USD', 'ETH-USD'])
+    connection.subscribe(WebsocketService.Channel.candles, ['BTC-USD'])
+    resubscribed = []
+    connection.unsubscribe = lambda channel, product_ids: resubscribed.append(('unsubscribe', channel, product_ids))  # type: ignore
+
+    service.handle_gap(connection, START, START + datetime.timedelta(seconds=10), resubscribe=False)
+    assert resubscribed == []
+    service.handle_gap(connection, START, START + datetime.timedelta(seconds=10))
+    assert resubscribed == [('unsubscribe', 'level2', ['BTC-USD', 'ETH-USD'])]
+    assert connection.get_subscriptions() == [{'channel': 'level2', 'product_ids': ['BTC-USD', 'ETH-USD']}, {'channel': 'candles', 'product_ids': ['BTC-USD']}]
+
+    assert reported.wait(5)
+    assert sorted(gaps) == [('candles', ['BTC-USD'])] * 2 + [('level2', ['BTC-USD', 'ETH-USD'])] * 2
+    assert service.get_metrics()['gaps'] == 2
+
+def run_service(db, server: FakeCoinbaseServer, seconds: float) -> dict[str, int]:
+    DatabaseSetupService(db)
+    service = WebsocketService('', '', ws_url=server.ws_url, pipeline=IngestionPipeline(db=db, log_dir=None))
+    service.subscribe(WebsocketService.Channel.candles, ['BTC-USD'])
+    time.sleep(seconds)
+    service.close_all(5)
+    return service.get_metrics()
+
+def test_fake_server_sequence_gaps_are_reported(db):
+    with FakeCoinbaseServer(ws_messages_per_second=50, sequence_gap_every=10) as server:
+        metrics = run_service(db, server, 1.0)
+    assert metrics['gaps'] >= 1
+
+def test_fake_server_rotations_are_not_reported_as_gaps(db, monkeypatch):
+    monkeypatch.setattr(WebsocketService, 'MAX_WS_CONN_DURATION', 0.3)
+    with FakeCoinbaseServer(ws_messages_per_second=50) as server:
+        metrics = run_service(db, server, 1.5)
+        assert server.get_metrics()['ws_connections'] >= 3
+    assert metrics['gaps'] == 0
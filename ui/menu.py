@@ -151,7 +151,7 @@ class Menu:
 
     @menu_output
     @menu_exception_handler
-    def addprediction(self):
+    def addprediction(self, validate_trading_pair: Optional[Callable[[str], bool]] = None):
         y, _ = self.stdscr.getyx()
         last_y, _ = self.stdscr.getmaxyx()
         last_y -= 2
@@ -162,7 +162,7 @@ class Menu:
             try:
                 prediction = {}
                 prediction["trading_pair"] = self.input_handler.get_input(
-                    prompt="Trading Pair", input_type=str, example="BTC-USD", can_refresh=True).upper()
+                    prompt="Trading Pair", input_type=str, example="BTC-USD", validation=validate_trading_pair, can_refresh=True).upper()
                 prediction["symbol"] = prediction["trading_pair"].split("-")[0]
 
                 prediction["start_date"] = self.input_handler.get_input(